@@ -0,0 +1,78 @@
+# coding=utf-8
+from typing import Optional
+
+from elasticsearch import ApiError, TransportError
+from fastapi import APIRouter, Request, HTTPException
+from pydantic import Field
+
+from app.core.auth import check_auth
+from app.core.es import es_client, client_key
+from app.api.search import SearchRequest, build_filters
+from app.service import aggs
+
+router = APIRouter()
+
+
+class HistogramRequest(SearchRequest):
+    # fixed_interval，如 30s / 5m / 1h / 1d；不填时按时间跨度自动选择
+    interval: Optional[str] = Field(default=None, pattern=r"^\d+(ms|s|m|h|d)$")
+
+
+class TermsRequest(SearchRequest):
+    # keyword / 数值类字段，如 host.name、level
+    field: str = Field(min_length=1)
+    top: int = Field(default=10, ge=1, le=1000)
+
+
+def _agg_error(e: Exception) -> HTTPException:
+    """
+    只有请求本身有问题（参数不合法、ES 返回 4xx，如字段不能聚合）才是 400；
+    ES 自身出错按上游失败 502（与 /search 所有集群都失败时一致）；
+    连不上、超时、ES 限流或不可用（429/503）为 503，可稍后重试。
+    """
+    if isinstance(e, ApiError):
+        status = e.status_code
+        if status in (429, 503):
+            return HTTPException(503, f"ES is busy or unavailable ({status}): {e.message}", headers={"Retry-After": "30"})
+        if 400 <= status < 500:
+            return HTTPException(400, f"Aggregation rejected by ES: {e.message}")
+        return HTTPException(502, f"ES error ({status}): {e.message}")
+    if isinstance(e, TransportError):
+        return HTTPException(503, f"ES unavailable: {e}", headers={"Retry-After": "30"})
+    return HTTPException(400, str(e))
+
+
+@router.post("/histogram")
+async def histogram(req: Request, body: HistogramRequest):
+    """
+    与 /search 相同的查询和时间范围，按时间桶统计条数（用于趋势图）。
+
+    结果按“集群 + 索引 + 查询 + 取整后的时间窗 + interval”缓存。
+    """
+    check_auth(req)
+    filters = build_filters(body)
+    async with es_client(body.es_host, body.es_api_key) as es:
+        try:
+            return await aggs.histogram(
+                es, body.index, body.query, filters, body.interval,
+                cache_scope=client_key(body.es_host, body.es_api_key)
+            )
+        except (ValueError, ApiError, TransportError) as e:
+            raise _agg_error(e)
+
+
+@router.post("/terms")
+async def terms(req: Request, body: TermsRequest):
+    """
+    与 /search 相同的查询和时间范围，统计 field 出现最多的 top 个取值。
+    """
+    check_auth(req)
+    filters = build_filters(body)
+    async with es_client(body.es_host, body.es_api_key) as es:
+        try:
+            return await aggs.terms(
+                es, body.index, body.query, filters, body.field, body.top,
+                cache_scope=client_key(body.es_host, body.es_api_key)
+            )
+        except (ValueError, ApiError, TransportError) as e:
+            raise _agg_error(e)
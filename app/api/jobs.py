@@ -0,0 +1,91 @@
+# coding=utf-8
+from typing import Tuple
+
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import JSONResponse
+
+from app.core.auth import check_auth, get_token
+from app.api.search import (
+    SearchRequest, build_filters, cached_export, check_clusters, check_compression, cluster_report, clusters_failed,
+    download_url, export_cache_key, export_to_file, plan_request, too_busy, too_large
+)
+from app.service.fanout import ClustersFailed
+from app.service.planner import ExportTooLarge
+from app.service.jobs import Job, job_manager
+from app.service.scheduler import SchedulerFull, export_scheduler
+
+router = APIRouter()
+
+
+@router.post("/jobs")
+async def create_job(req: Request, body: SearchRequest):
+    """
+    异步导出：立即返回 job id，导出在后台进行，用 GET /jobs/{id} 轮询进度。
+
+    与 /search 共用导出缓存：相同的导出直接复用已有文件，并发的相同任务只导出一次。
+    """
+    check_auth(req)
+    check_compression(body)
+    check_clusters(body)
+
+    # 队列已满时直接 429，而不是建一个注定排很久的任务
+    try:
+        export_scheduler.check_admission()
+    except SchedulerFull as e:
+        raise too_busy(e)
+
+    filters = build_filters(body)
+    # 提交前先估算：超出大小限制时同步返回 413，而不是等任务失败
+    try:
+        plan = await plan_request(body, filters)
+    except ClustersFailed as e:
+        raise clusters_failed(e)
+    if plan.over_limit:
+        raise too_large(ExportTooLarge(plan))
+
+    token = get_token(req)
+    report = cluster_report(body)
+    cache_key = export_cache_key(body, filters)
+
+    async def run(job: Job) -> Tuple[str, int]:
+        file_name, count = await cached_export(
+            body, cache_key,
+            lambda: export_to_file(
+                body, filters, job.progress, token=token, on_ticket=job.set_ticket, plan=plan, report=report
+            ),
+            report
+        )
+        # 命中缓存或并入别人的导出时，本任务的进度没有被更新过
+        job.progress.lines = count
+        return file_name, count
+
+    job = job_manager.submit(run)
+    job.estimate = plan.to_dict()
+    job.clusters = report
+    return JSONResponse(job.to_dict(), status_code=202)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, req: Request):
+    check_auth(req)
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+
+    data = job.to_dict()
+    if job.status == "done" and job.count > 0:
+        data["url"] = download_url(req, job.file_name)
+    return data
+
+
+@router.get("/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str, req: Request):
+    """
+    任务的分阶段耗时（调度排队、取客户端、首页、每次 search/scroll、编码、写盘……），
+    任务进行中也可以查看已完成的部分。
+    """
+    check_auth(req)
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job.trace.to_dict()
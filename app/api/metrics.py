@@ -0,0 +1,55 @@
+# coding=utf-8
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core import metrics
+from app.core.auth import check_auth
+from app.service.budget import export_memory
+from app.service.scheduler import export_scheduler
+from app.service.tail import tail_hub
+from app.storage.retention import retention
+
+router = APIRouter()
+
+# 由其他模块维护的状态，抓取时读取
+metrics.Gauge(
+    "logscope_log_dir_bytes", "Total size of tracked export files in LOG_DIR",
+    collect=lambda: {(): retention.total_bytes}
+)
+metrics.Gauge(
+    "logscope_log_dir_files", "Number of tracked export files in LOG_DIR",
+    collect=lambda: {(): retention.file_count}
+)
+metrics.CounterFunc(
+    "logscope_retention_removed_total", "Export files removed by the retention manager", ("reason",),
+    collect=lambda: {
+        ("expired",): retention.stats["expired_removed"],
+        ("quota",): retention.stats["quota_removed"],
+        ("orphan",): retention.stats["orphans_removed"],
+    }
+)
+metrics.Gauge(
+    "logscope_scheduler_exports", "Exports admitted by the scheduler", ("state",),
+    collect=lambda: {("running",): export_scheduler.running, ("queued",): export_scheduler.queued}
+)
+metrics.Gauge(
+    "logscope_export_memory_bytes", "Global export memory budget: bytes in use, high-water mark and limit", ("kind",),
+    collect=lambda: {("used",): export_memory.used, ("peak",): export_memory.peak, ("limit",): export_memory.limit}
+)
+metrics.CounterFunc(
+    "logscope_export_memory_waits_total", "Times an export paused fetching because the global memory budget was full",
+    collect=lambda: {(): export_memory.waits}
+)
+metrics.Gauge(
+    "logscope_tail", "Live tails: distinct pollers and connected viewers", ("kind",),
+    collect=lambda: {("pollers",): tail_hub.pollers, ("viewers",): tail_hub.subscribers}
+)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(req: Request):
+    """
+    Prometheus 文本格式指标（抓取时同样需要 Bearer token）。
+    """
+    check_auth(req)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
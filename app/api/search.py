@@ -1,20 +1,47 @@
 # coding=utf-8
+import asyncio
+import os
+import re
+import time
 import uuid
-from typing import Optional, Dict
+from typing import Awaitable, Callable, Optional, Dict, List, Literal, Tuple
 from datetime import datetime, timedelta, timezone
-from fastapi import APIRouter, Request, BackgroundTasks, HTTPException
-from fastapi.responses import PlainTextResponse, FileResponse
+from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import PlainTextResponse, FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from elasticsearch import AsyncElasticsearch
+from elasticsearch import ApiError, TransportError
 
-from app.core.auth import check_auth
+from app.core import tracing
+from app.core.auth import check_auth, get_token
 from app.core.time import to_utc
-from app.core.es import normalize_es_host
-from app.service.exporter import export_logs
-from app.storage.local import get_file_path, cleanup_file
+from app.core.es import es_client, acquire_es, release_es, client_key
+from app.service.cache import export_cache, make_cache_key, EXPORT_CACHE_OPEN_WINDOW_SECONDS
+from app.service.scheduler import SchedulerFull, Ticket, export_scheduler
+from app.service.exporter import ExportProgress, build_dsl, export_logs, iter_export_chunks
+from app.service.fanout import CLUSTER_TIMEOUT_SECONDS, Cluster, ClusterReport, ClustersFailed
+from app.service.formats import EXTENSIONS, MEDIA_TYPES
+from app.service.planner import ExportPlan, ExportTooLarge, combine_plans, plan_export
+from app.storage import compression
+from app.storage.grep import grep_file
+from app.storage.lineindex import read_lines
+from app.storage.local import get_file_path
+from app.storage.retention import retention
 
 router = APIRouter()
 
+
+class ClusterTarget(BaseModel):
+    # 多集群导出中的一个集群；es_host 为空表示默认集群（ES_HOSTS）
+    es_host: Optional[str] = None
+    es_api_key: Optional[str] = None
+    # 该集群上查询的索引，不填时用请求的 index
+    index: Optional[str] = None
+    # 出现在报告里的名字，不填时用 es_host
+    name: Optional[str] = None
+    # 该集群单页超时（秒），不填时用 CLUSTER_TIMEOUT_SECONDS
+    timeout: Optional[float] = Field(default=None, gt=0, le=600)
+
+
 class SearchRequest(BaseModel):
     index: str
     es_host: Optional[str] = None
@@ -25,28 +52,47 @@ class SearchRequest(BaseModel):
     end_time: Optional[str] = None
     size: int = Field(default=50000, ge=1, le=200000)
     filters: Optional[Dict[str, str]] = None
+    # 每页条数；不填时按响应大小和耗时自适应。slices > 1 时按 slice 并行导出
+    page_size: Optional[int] = Field(default=None, ge=100, le=10000)
+    slices: int = Field(default=1, ge=1, le=16)
+    # auto：优先 PIT + search_after，集群不支持时回退 scroll
+    pagination: Literal["auto", "pit", "scroll"] = "auto"
+    # 导出压缩：gzip 始终可用，zstd 需安装 zstandard
+    compression: Optional[Literal["gzip", "zstd"]] = None
+    # 导出的 _source 字段（支持 host.name 这类嵌套路径），默认只导出 message
+    fields: Optional[List[str]] = Field(default=None, min_length=1, max_length=100)
+    # txt：每行字段值（多字段 \t 分隔）；ndjson：每行一个对象；csv：带表头；columnar：每页一行列式 JSON
+    format: Literal["txt", "ndjson", "csv", "columnar"] = "txt"
+    # 字段获取方式：source（_source 过滤）/ fields（fields API）/ docvalue（doc values，仅限 keyword/数值/日期字段）
+    fetch: Literal["source", "fields", "docvalue"] = "source"
+    # 按时间分区并发导出（适合按天滚动的索引）：每 partition_hours 小时一个分区，
+    # 只查与分区时间有交集的索引，结果按时间顺序拼接
+    partition: bool = False
+    partition_hours: int = Field(default=24, ge=1, le=24 * 31)
+    # 多集群导出：同时查询这些集群（忽略 es_host/es_api_key），按 @timestamp 归并成一个导出；
+    # 单个集群超时或出错时剔除，其余集群照常导出，失败情况见 X-Cluster-Failures / 任务的 clusters
+    clusters: Optional[List[ClusterTarget]] = Field(default=None, min_length=1, max_length=16)
 
 
-@router.post("/search")
-async def search(
-    req: Request,
-    body: SearchRequest,
-    background_tasks: BackgroundTasks
-):
-    check_auth(req)
+def check_compression(body: SearchRequest):
+    if not compression.is_available(body.compression):
+        raise HTTPException(400, f"Compression not available: {body.compression}")
 
-    # 不要修改全局共享的 app.state.es（并发请求会互相覆盖 hosts/api_key）。
-    # 每次请求按参数创建独立 ES 客户端，用完即关闭。
-    kwargs = dict(
-        hosts=[normalize_es_host(body.es_host)],
-        verify_certs=False,
-        ssl_show_warn=False,
-    )
-    if body.es_api_key:
-        kwargs["api_key"] = body.es_api_key
 
-    es = AsyncElasticsearch(**kwargs)
+def check_clusters(body: SearchRequest):
+    if body.clusters and body.partition:
+        raise HTTPException(400, "partition is not supported together with clusters")
+
 
+def _is_open_window(body: SearchRequest) -> bool:
+    # 没有 end_time 或 end_time 在未来：同样的查询过一会儿会查到更多数据
+    if not body.end_time:
+        return True
+    end = datetime.fromisoformat(to_utc(body.end_time))
+    return end > datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def build_filters(body: SearchRequest) -> list:
     filters = []
 
     # 时间过滤优化：
@@ -72,54 +118,480 @@ async def search(
             }
         })
 
-    if body.filters:
-        for k, v in body.filters.items():
-            if v:
-                filters.append({"match_phrase": {k: v}})
+    filters.extend(match_filters(body))
+    return filters
+
+
+def match_filters(body: SearchRequest) -> list:
+    # filters 里的 key/value 转成 match_phrase；value 为空的忽略
+    return [{"match_phrase": {k: v}} for k, v in (body.filters or {}).items() if v]
+
+
+def _partition_seconds(body: SearchRequest) -> Optional[int]:
+    return body.partition_hours * 3600 if body.partition else None
+
+
+def _scheduler_hosts(body: SearchRequest) -> List[str]:
+    # 每个集群一个调度 key，跨集群导出在每个集群上各占一个名额
+    if body.clusters:
+        return [",".join(client_key(c.es_host, c.es_api_key)[0]) for c in body.clusters]
+    return [",".join(client_key(body.es_host, body.es_api_key)[0])]
+
+
+def _cluster_name(c: ClusterTarget) -> str:
+    return c.name or c.es_host or "default"
+
+
+def cluster_report(body: SearchRequest) -> Optional[ClusterReport]:
+    if not body.clusters:
+        return None
+    return ClusterReport([(_cluster_name(c), c.index or body.index) for c in body.clusters])
+
+
+def acquire_clusters(body: SearchRequest) -> List[Cluster]:
+    # 每个集群从连接池取一个客户端，用完逐个 release_es
+    return [
+        Cluster(_cluster_name(c), acquire_es(c.es_host, c.es_api_key), c.index or body.index, c.timeout)
+        for c in body.clusters or []
+    ]
+
+
+async def release_clusters(clusters: List[Cluster]):
+    for c in clusters:
+        await release_es(c.es)
+
 
-    file_name = f"log_{uuid.uuid4().hex}.txt"
+def _cache_cluster(body: SearchRequest):
+    if body.clusters:
+        return [(client_key(c.es_host, c.es_api_key), c.index or body.index) for c in body.clusters]
+    return client_key(body.es_host, body.es_api_key)
+
+
+def too_busy(e: SchedulerFull) -> HTTPException:
+    return HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def too_large(e: ExportTooLarge) -> HTTPException:
+    return HTTPException(413, str(e))
+
+
+def clusters_failed(e: ClustersFailed) -> HTTPException:
+    return HTTPException(502, str(e))
+
+
+async def plan_request(body: SearchRequest, filters: list) -> ExportPlan:
+    """
+    导出前估算（_count + 抽样）；只发两个轻量请求，不经过导出调度器排队。
+    多集群时各集群并发估算后合并，超时或出错的集群不计入（导出时同样会被剔除）。
+    """
+    if body.clusters:
+        return await _plan_clusters(body, filters)
+    async with es_client(body.es_host, body.es_api_key) as es:
+        return await plan_export(
+            es, body.index, body.query, filters, body.size,
+            fields=body.fields, fetch=body.fetch, fmt=body.format
+        )
+
+
+async def _plan_clusters(body: SearchRequest, filters: list) -> ExportPlan:
+    report = cluster_report(body)
+
+    async def plan_one(c: ClusterTarget) -> ExportPlan:
+        async with es_client(c.es_host, c.es_api_key) as es:
+            return await asyncio.wait_for(
+                plan_export(
+                    es, c.index or body.index, body.query, filters, body.size,
+                    fields=body.fields, fetch=body.fetch, fmt=body.format
+                ),
+                c.timeout or CLUSTER_TIMEOUT_SECONDS
+            )
+
+    results = await asyncio.gather(*(plan_one(c) for c in body.clusters), return_exceptions=True)
+    plans = []
+    for status, result in zip(report.clusters, results):
+        if isinstance(result, asyncio.TimeoutError):
+            status.fail("timeout", "estimate timed out")
+        elif isinstance(result, (ApiError, TransportError)):
+            status.fail("failed", str(result))
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            status.status = "ok"
+            status.hits = result.hits
+            plans.append(result)
+    if not plans:
+        raise ClustersFailed(report)
+
+    plan = combine_plans(plans, body.size)
+    plan.clusters = report.to_dict()
+    return plan
+
+
+async def export_to_file(
+    body: SearchRequest,
+    filters: list,
+    progress: Optional[ExportProgress] = None,
+    token: str = "",
+    on_ticket: Optional[Callable[[Ticket], None]] = None,
+    plan: Optional[ExportPlan] = None,
+    report: Optional[ClusterReport] = None
+) -> Tuple[str, int]:
+    """
+    按请求参数导出到 LOG_DIR，返回 (文件名, 导出条数)；文件到期自动清理。
+
+    先做导出估算（未传入 plan 时）：预计大小超限抛 ExportTooLarge，没有命中则直接返回 ("", 0)，
+    不开 scroll / PIT、不建文件。之后经过调度器准入（全局/单集群并发、按 token 公平排队），
+    队列满时抛 SchedulerFull。
+
+    多集群（body.clusters）时各集群的导出情况记入 report；全部失败时抛 ClustersFailed。
+    """
+    if plan is None:
+        plan = await plan_request(body, filters)
+    if plan.over_limit:
+        raise ExportTooLarge(plan)
+    if plan.hits == 0:
+        return "", 0
+
+    file_name = f"log_{uuid.uuid4().hex}{EXTENSIONS[body.format]}{compression.file_suffix(body.compression)}"
     file_path = get_file_path(file_name)
 
+    # 客户端来自按 (host, api_key) 复用的连接池，请求结束只归还不关闭
+    start = time.monotonic()
+    async with export_scheduler.slot(token, _scheduler_hosts(body), on_ticket):
+        tracing.record("scheduler", start)
+        start = time.monotonic()
+        clusters = acquire_clusters(body)
+        es = None if clusters else acquire_es(body.es_host, body.es_api_key)
+        tracing.record("client", start)
+        if progress is not None:
+            # 估算里的条数用于进度百分比和 ETA
+            progress.started_at = time.monotonic()
+            progress.total = plan.lines
+        try:
+            count = await export_logs(
+                es=es,
+                index=body.index,
+                query=body.query,
+                filters=filters,
+                file_path=file_path,
+                max_size=body.size,
+                page_size=body.page_size,
+                slices=body.slices,
+                pagination=body.pagination,
+                compression=body.compression,
+                progress=progress,
+                fields=body.fields,
+                fmt=body.format,
+                fetch=body.fetch,
+                partition_seconds=_partition_seconds(body),
+                clusters=clusters or None,
+                report=report,
+                line_bytes=plan.avg_line_bytes
+            )
+        finally:
+            retention.register(file_path)
+            if es is not None:
+                await release_es(es)
+            await release_clusters(clusters)
+    return file_name, count
+
+
+def export_cache_key(body: SearchRequest, filters: list) -> str:
+    # 相同集群/索引/DSL/条数/压缩方式的导出复用同一个文件；并发的相同请求只导出一次
+    return make_cache_key(
+        cluster=_cache_cluster(body),
+        index=body.index,
+        dsl=build_dsl(body.query, filters, body.fields, body.fetch),
+        size=body.size,
+        compression=body.compression,
+        format=body.format,
+    )
+
+
+async def cached_export(
+    body: SearchRequest,
+    cache_key: str,
+    export: Callable[[], Awaitable[Tuple[str, int]]],
+    report: Optional[ClusterReport] = None
+) -> Tuple[str, int]:
+    """
+    经过导出缓存（single-flight）执行 export；/search 与 /jobs 共用。
+    """
     try:
-        count = await export_logs(
-            es=es,
-            index=body.index,
-            query=body.query,
-            filters=filters,
-            file_path=file_path,
-            max_size=body.size
+        return await export_cache.get_or_export(
+            cache_key,
+            export,
+            max_age=EXPORT_CACHE_OPEN_WINDOW_SECONDS if _is_open_window(body) else None
         )
     finally:
-        await es.close()
+        if report is not None and report.failed:
+            # 部分集群缺失的结果不进缓存，下次请求重新导出
+            export_cache.invalidate(cache_key)
+
+
+def download_url(req: Request, file_name: str) -> str:
+    base = str(req.base_url).rstrip("/")
+    return f"{base}/api/logscope/download/{file_name}"
+
+
+@router.post("/search")
+async def search(req: Request, body: SearchRequest):
+    check_auth(req)
+    check_compression(body)
+    check_clusters(body)
+
+    filters = build_filters(body)
+
+    cache_key = export_cache_key(body, filters)
+    planned: Dict[str, ExportPlan] = {}
+    report = cluster_report(body)
+
+    async def export() -> Tuple[str, int]:
+        # 缓存未命中、真正要导出时才估算；命中时不再访问 ES
+        planned["plan"] = await plan_request(body, filters)
+        return await export_to_file(body, filters, token=get_token(req), plan=planned["plan"], report=report)
+
+    # 各阶段耗时通过 Server-Timing 返回（缓存命中或并入他人的导出时只有 total）
+    trace = tracing.Trace("search")
+    try:
+        with tracing.activate(trace):
+            file_name, count = await cached_export(body, cache_key, export, report)
+    except SchedulerFull as e:
+        raise too_busy(e)
+    except ExportTooLarge as e:
+        raise too_large(e)
+    except ClustersFailed as e:
+        raise clusters_failed(e)
+    finally:
+        trace.finish()
+    headers = {"Server-Timing": trace.server_timing()}
+    if "plan" in planned and planned["plan"].warning:
+        headers["X-Export-Warning"] = planned["plan"].warning
+    if report is not None and report.failed:
+        headers["X-Cluster-Failures"] = report.header()
 
     if count == 0:
+        raise HTTPException(404, "No log found", headers=headers)
+
+    return PlainTextResponse(download_url(req, file_name), headers=headers)
+
+
+@router.post("/search/stream")
+async def search_stream(req: Request, body: SearchRequest):
+    """
+    流式导出：ES 每取回一页就直接写进 HTTP 响应，不落盘，内存以单页为上限。
+
+    指定 compression 时按页增量压缩，并以 Content-Encoding 返回。
+    Server-Timing 只能覆盖响应头发出前的阶段（排队、取客户端、首页），完整耗时见慢请求日志。
+    多集群时 X-Cluster-Failures 只包含首页之前已失败的集群，之后被剔除的集群只记日志。
+    """
+    check_auth(req)
+    check_compression(body)
+    check_clusters(body)
+
+    filters = build_filters(body)
+    trace = tracing.Trace("stream")
+    try:
+        with tracing.activate(trace):
+            plan = await plan_request(body, filters)
+    except ClustersFailed as e:
+        raise clusters_failed(e)
+    if plan.over_limit:
+        raise too_large(ExportTooLarge(plan))
+    if plan.hits == 0:
+        # 没有命中：不占调度名额，也不开 scroll / PIT
         raise HTTPException(404, "No log found")
 
-    base = str(req.base_url).rstrip("/")
-    url = f"{base}/api/logscope/download/{file_name}"
+    start = time.monotonic()
+    try:
+        ticket = export_scheduler.acquire(get_token(req), _scheduler_hosts(body))
+    except SchedulerFull as e:
+        raise too_busy(e)
+    try:
+        await ticket.wait()
+    except BaseException:
+        ticket.release()
+        raise
+    tracing.record("scheduler", start, trace)
+
+    start = time.monotonic()
+    clusters = acquire_clusters(body)
+    es = None if clusters else acquire_es(body.es_host, body.es_api_key)
+    report = cluster_report(body)
+    tracing.record("client", start, trace)
 
-    background_tasks.add_task(cleanup_file, file_path, 120)
+    async def release():
+        if es is not None:
+            await release_es(es)
+        await release_clusters(clusters)
 
-    return PlainTextResponse(url)
+    chunks = iter_export_chunks(
+        es=es,
+        index=body.index,
+        query=body.query,
+        filters=filters,
+        max_size=body.size,
+        page_size=body.page_size,
+        slices=body.slices,
+        pagination=body.pagination,
+        fields=body.fields,
+        fmt=body.format,
+        fetch=body.fetch,
+        partition_seconds=_partition_seconds(body),
+        clusters=clusters or None,
+        report=report,
+        line_bytes=plan.avg_line_bytes
+    )
+
+    # 先取第一页：没有命中时还能返回 404，而不是一个空的 200
+    try:
+        with tracing.activate(trace):
+            first, _ = await chunks.__anext__()
+    except StopAsyncIteration:
+        await release()
+        ticket.release()
+        trace.finish()
+        raise HTTPException(404, "No log found", headers={"Server-Timing": trace.server_timing()})
+    except ClustersFailed as e:
+        await release()
+        ticket.release()
+        trace.finish()
+        raise clusters_failed(e)
+    except BaseException:
+        await chunks.aclose()
+        await release()
+        ticket.release()
+        raise
+
+    async def stream():
+        try:
+            yield first
+            with tracing.activate(trace):
+                async for chunk, _ in chunks:
+                    yield chunk
+        finally:
+            await chunks.aclose()
+            await release()
+            ticket.release()
+            trace.finish()
+
+    async def compressed_stream():
+        # 压缩是 CPU 活，放到线程里做，避免阻塞事件循环
+        compressor = compression.StreamCompressor(body.compression)
+        async for chunk in stream():
+            data = await asyncio.to_thread(compressor.compress, chunk.encode("utf-8"))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    file_name = f"log_{uuid.uuid4().hex}{EXTENSIONS[body.format]}"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{file_name}"',
+        "Server-Timing": trace.server_timing(),
+    }
+    if plan.warning:
+        headers["X-Export-Warning"] = plan.warning
+    if report is not None and report.failed:
+        headers["X-Cluster-Failures"] = report.header()
+    if body.compression:
+        headers["Content-Encoding"] = body.compression
+    return StreamingResponse(
+        compressed_stream() if body.compression else stream(),
+        media_type=MEDIA_TYPES[body.format],
+        headers=headers,
+    )
+
+
+@router.post("/estimate")
+async def estimate(req: Request, body: SearchRequest):
+    """
+    只估算不导出：命中数、实际导出条数、抽样平均行大小、预计大小及是否超出限制。
+    """
+    check_auth(req)
+    check_clusters(body)
+    try:
+        plan = await plan_request(body, build_filters(body))
+    except ClustersFailed as e:
+        raise clusters_failed(e)
+    return plan.to_dict()
 
 
 @router.get("/download/{file}")
 async def download(file: str, req: Request):
+    """
+    下载导出文件；FileResponse 原生支持 Range（206 / 416），可断点续传或分段拉取。
+    """
     check_auth(req)
     path = get_file_path(file)
-    return FileResponse(path, filename=file)
+    if not os.path.isfile(path):
+        raise HTTPException(404, "File not found")
+    retention.mark_access(path)
+    # 压缩文件按原样下发（.gz / .zst），不设 Content-Encoding，避免浏览器自动解压后文件名对不上
+    return FileResponse(path, filename=file, media_type=compression.media_type_for(file))
 
 
 @router.get("/preview/{file}")
-async def preview(file: str, req: Request, max_bytes: int = 200_000):
+async def preview(
+    file: str,
+    req: Request,
+    max_bytes: int = 200_000,
+    offset_line: Optional[int] = Query(default=None, ge=0),
+    limit: int = Query(default=500, ge=1, le=5000)
+):
     """
-    在线预览：只读取文件前 max_bytes（默认 200KB），避免浏览器直接加载大文件一直转圈。
+    在线预览：
+    - 默认只读取文件前 max_bytes（默认 200KB），避免浏览器直接加载大文件一直转圈
+    - 传 offset_line 时按行分页：借助导出时生成的稀疏行索引直接 seek，
+      响应头 X-Total-Lines 给出总行数
     """
     check_auth(req)
     path = get_file_path(file)
+    retention.mark_access(path)
+
+    if offset_line is not None:
+        try:
+            lines, total = await asyncio.to_thread(read_lines, path, offset_line, limit)
+        except FileNotFoundError:
+            raise HTTPException(404, "File not found")
+        headers = {"X-Offset-Line": str(offset_line)}
+        if total is not None:
+            headers["X-Total-Lines"] = str(total)
+        content = "".join(line + "\n" for line in lines)
+        return PlainTextResponse(content, headers=headers)
+
     try:
-        with open(path, "r", encoding="utf-8", errors="replace") as f:
+        with compression.open_text(path) as f:
             content = f.read(max_bytes)
     except FileNotFoundError:
         raise HTTPException(404, "File not found")
     return PlainTextResponse(content)
+
+
+@router.get("/files/{file}/grep")
+async def grep(
+    file: str,
+    req: Request,
+    pattern: str = Query(min_length=1),
+    regex: bool = False,
+    ignore_case: bool = False,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    index: bool = True
+):
+    """
+    在服务端检索导出文件（例如按 trace id 找行），不用先下载：
+    - 默认按子串匹配，regex=true 时按正则匹配
+    - 大文件首次子串检索时在后台建立 trigram 索引（index=false 可跳过），建好之前直接扫描，之后只扫候选块
+    - 按命中条数分页：返回 0 起的行号（可直接用作预览接口的 offset_line）和行内容片段
+    """
+    check_auth(req)
+    path = get_file_path(file)
+    if not os.path.isfile(path):
+        raise HTTPException(404, "File not found")
+    if regex:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise HTTPException(400, f"Invalid regex: {e}")
+    retention.mark_access(path)
+    return await asyncio.to_thread(grep_file, path, pattern, regex, ignore_case, offset, limit, index)
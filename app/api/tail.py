@@ -0,0 +1,86 @@
+# coding=utf-8
+import asyncio
+import json
+import os
+from typing import Literal
+
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.core.auth import check_auth
+from app.core.es import acquire_es, client_key
+from app.api.search import SearchRequest, match_filters
+from app.service.cache import make_cache_key
+from app.service.exporter import build_dsl
+from app.service.tail import TailPoller, TooManyTails, tail_hub
+
+router = APIRouter()
+
+# 没有新日志时每隔多少秒发一个 SSE 注释行，防止代理/网关因空闲断开连接
+TAIL_HEARTBEAT_SECONDS = float(os.getenv("TAIL_HEARTBEAT_SECONDS", "15"))
+
+
+class TailRequest(SearchRequest):
+    # tail 按行推送，只支持逐行独立的格式；start_time/end_time/size 等导出参数忽略
+    format: Literal["txt", "ndjson"] = "txt"
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/tail")
+async def tail(req: Request, body: TailRequest):
+    """
+    实时跟踪（tail -f）：以 SSE 推送新写入的日志。
+
+    事件：hit（{"hit": "..."}，每条日志一个事件，文本里可能有换行；先推最近的若干条，之后只推新的）/
+    dropped（消费太慢被丢弃的条数）/ error（查询失败，轮询会退避后自动重试）。
+    相同集群 + 索引 + 查询 + 字段的观看者共用同一个轮询，每个轮询间隔只查一次 ES。
+    """
+    check_auth(req)
+
+    filters = match_filters(body)
+    key = make_cache_key(
+        kind="tail",
+        cluster=client_key(body.es_host, body.es_api_key),
+        index=body.index,
+        dsl=build_dsl(body.query, filters, body.fields, body.fetch),
+        format=body.format,
+    )
+    try:
+        tail_hub.check_admission(key)
+    except TooManyTails as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": "30"})
+
+    def factory() -> TailPoller:
+        return TailPoller(
+            acquire_es(body.es_host, body.es_api_key),
+            body.index, body.query, filters,
+            fields=body.fields, fetch=body.fetch, fmt=body.format
+        )
+
+    async def events():
+        try:
+            async with tail_hub.subscribe(key, factory) as queue:
+                while True:
+                    try:
+                        kind, data = await asyncio.wait_for(queue.get(), TAIL_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        if await req.is_disconnected():
+                            return
+                        yield ": ping\n\n"
+                        continue
+                    if kind == "hits":
+                        yield "".join(_sse("hit", {"hit": hit}) for hit in data)
+                    else:
+                        yield _sse(kind, {kind: data})
+        except TooManyTails as e:
+            # 检查之后、开始推送之前名额被别的查询占满
+            yield _sse("error", {"error": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
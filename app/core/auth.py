@@ -1,7 +1,11 @@
 # coding=utf-8
+import os
+
 from fastapi import Request, HTTPException
 
 AUTH_TOKEN = "your-secret-admin-token"
+# 额外允许的 token（逗号分隔）。导出调度按 token 公平排队、限流，每个使用方一个 token 时才能互相隔离
+AUTH_TOKENS = {AUTH_TOKEN} | {t.strip() for t in os.getenv("AUTH_TOKENS", "").split(",") if t.strip()}
 
 def check_auth(req: Request):
     auth = req.headers.get("Authorization", "")
@@ -9,5 +13,9 @@ def check_auth(req: Request):
         raise HTTPException(403, "Invalid Authorization header")
 
     token = auth.split(" ", 1)[1].strip()
-    if token != AUTH_TOKEN:
+    if token not in AUTH_TOKENS:
         raise HTTPException(403, "Invalid Token")
+
+def get_token(req: Request) -> str:
+    auth = req.headers.get("Authorization", "")
+    return auth.split(" ", 1)[1].strip() if auth.startswith("Bearer ") else ""
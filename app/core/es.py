@@ -1,8 +1,44 @@
 # coding=utf-8
+import asyncio
+import hashlib
+import logging
 import os
-from typing import List, Optional
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
 from elasticsearch import AsyncElasticsearch
 
+try:
+    import orjson  # noqa: F401
+    from elasticsearch.serializer import OrjsonSerializer
+except ImportError:  # 可选依赖：未安装 orjson（或 elasticsearch < 8.12）时用标准库 json
+    OrjsonSerializer = None
+
+logger = logging.getLogger(__name__)
+
+# 客户端池：按 (hosts, api_key 哈希) 复用 AsyncElasticsearch，保持 keep-alive 连接
+ES_POOL_MAX_CLIENTS = int(os.getenv("ES_POOL_MAX_CLIENTS", "32"))
+ES_POOL_IDLE_SECONDS = float(os.getenv("ES_POOL_IDLE_SECONDS", "300"))
+ES_CONNECTIONS_PER_HOST = int(os.getenv("ES_CONNECTIONS_PER_HOST", "10"))
+
+PoolKey = Tuple[Tuple[str, ...], str]
+
+
+class _PooledClient:
+    __slots__ = ("client", "refs", "last_used", "pinned")
+
+    def __init__(self, client: AsyncElasticsearch, pinned: bool = False):
+        self.client = client
+        self.refs = 0
+        self.last_used = time.monotonic()
+        self.pinned = pinned
+
+
+_pool: "OrderedDict[PoolKey, _PooledClient]" = OrderedDict()
+_default_hosts: List[str] = ["http://localhost:9200"]
+
+
 def _parse_hosts_from_env(value: Optional[str]) -> List[str]:
     if not value:
         return []
@@ -17,16 +53,98 @@ def normalize_es_host(host: str) -> str:
         return f"http://{h}"
     return h
 
-async def init_es(app):
-    # 从环境变量读取 ES_HOSTS，未设置时默认本地 9200。
-    hosts = _parse_hosts_from_env(os.getenv("ES_HOSTS")) or ["http://localhost:9200"]
-    app.state.es = AsyncElasticsearch(
+def _pool_key(host: Optional[str], api_key: Optional[str]) -> PoolKey:
+    # 未指定 host 时使用 ES_HOSTS（即 app.state.es 的那组节点）
+    hosts = (normalize_es_host(host),) if (host or "").strip() else tuple(_default_hosts)
+    # api_key 只以哈希形式出现在 key 里，避免明文常驻在字典/日志中
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest() if api_key else ""
+    return hosts, key_hash
+
+def client_key(host: Optional[str], api_key: Optional[str]) -> PoolKey:
+    """
+    标识一个 (集群, 凭据) 组合；连接池和导出结果缓存共用。
+    """
+    return _pool_key(host, api_key)
+
+def _new_client(hosts: List[str], api_key: Optional[str] = None) -> AsyncElasticsearch:
+    kwargs = dict(
         hosts=hosts,
         verify_certs=False,
         ssl_show_warn=False,
+        connections_per_node=ES_CONNECTIONS_PER_HOST,
     )
+    if api_key:
+        kwargs["api_key"] = api_key
+    if OrjsonSerializer is not None:
+        # 导出时每页都要解析整段响应，orjson 解码明显快于标准库 json
+        kwargs["serializer"] = OrjsonSerializer()
+    return AsyncElasticsearch(**kwargs)
+
+def _pop_evictable() -> List[AsyncElasticsearch]:
+    """
+    取出需要关闭的客户端：空闲超时的，以及超过 ES_POOL_MAX_CLIENTS 时最久未用的。
+    正在被请求使用（refs > 0）或常驻（pinned）的不会被淘汰。
+    """
+    now = time.monotonic()
+    evicted = []
+    for key, entry in list(_pool.items()):
+        if entry.refs or entry.pinned:
+            continue
+        if now - entry.last_used > ES_POOL_IDLE_SECONDS or len(_pool) > ES_POOL_MAX_CLIENTS:
+            del _pool[key]
+            evicted.append(entry.client)
+    return evicted
+
+def acquire_es(host: Optional[str], api_key: Optional[str]) -> AsyncElasticsearch:
+    """
+    从池中取（或新建）一个客户端并增加引用计数；用完必须 release_es。
+    """
+    key = _pool_key(host, api_key)
+    entry = _pool.get(key)
+    if entry is None:
+        entry = _PooledClient(_new_client(list(key[0]), api_key))
+        _pool[key] = entry
+    _pool.move_to_end(key)
+    entry.refs += 1
+    entry.last_used = time.monotonic()
+    return entry.client
+
+async def release_es(es: AsyncElasticsearch):
+    for entry in _pool.values():
+        if entry.client is es:
+            entry.refs = max(0, entry.refs - 1)
+            entry.last_used = time.monotonic()
+            break
+    else:
+        # 已不在池中（例如 close_es 之后）：直接关闭
+        await es.close()
+
+    for client in _pop_evictable():
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"close pooled ES client failed: {e}")
+
+@asynccontextmanager
+async def es_client(host: Optional[str], api_key: Optional[str]) -> AsyncIterator[AsyncElasticsearch]:
+    es = acquire_es(host, api_key)
+    try:
+        yield es
+    finally:
+        await release_es(es)
+
+async def init_es(app):
+    # 从环境变量读取 ES_HOSTS，未设置时默认本地 9200。
+    global _default_hosts
+    _default_hosts = _parse_hosts_from_env(os.getenv("ES_HOSTS")) or ["http://localhost:9200"]
+    app.state.es = _new_client(_default_hosts)
+    # 默认集群的客户端常驻池中，未指定 es_host/es_api_key 的请求直接复用
+    _pool[_pool_key(None, None)] = _PooledClient(app.state.es, pinned=True)
 
 async def close_es(app):
+    clients = [entry.client for entry in _pool.values()]
+    _pool.clear()
     es = getattr(app.state, "es", None)
-    if es is not None:
-        await es.close()
+    if es is not None and all(es is not c for c in clients):
+        clients.append(es)
+    await asyncio.gather(*(c.close() for c in clients), return_exceptions=True)
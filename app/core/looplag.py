@@ -0,0 +1,46 @@
+# coding=utf-8
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+# 采样间隔（秒）：每次 sleep 这么久，实际醒来比预期晚多少就是事件循环被阻塞的时间
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.1"))
+# 单次延迟超过该值（秒）时打印告警（通常是事件循环里跑了同步 IO 或重 CPU 的代码）
+LOOP_LAG_WARN_SECONDS = float(os.getenv("LOOP_LAG_WARN_SECONDS", "0.5"))
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟采样，结果记入 logscope_event_loop_lag_seconds。
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            metrics.EVENT_LOOP_LAG.observe(lag)
+            if lag >= LOOP_LAG_WARN_SECONDS:
+                logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms")
+
+    async def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+loop_lag_monitor = LoopLagMonitor()
@@ -0,0 +1,231 @@
+# coding=utf-8
+import bisect
+import math
+import os
+import re
+import threading
+from fnmatch import fnmatchcase
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# 导出 / ES 请求耗时的默认桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 事件循环延迟的桶（秒）：正常应在毫秒级
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# 导出指标 index 标签的取值白名单（逗号分隔，可用通配符，如 "app-*,nginx-*"）：
+# 请求的索引匹配到哪一项就记为哪一项，都不匹配记为 other
+METRICS_INDEX_LABELS = [p.strip() for p in os.getenv("METRICS_INDEX_LABELS", "").split(",") if p.strip()]
+# 未配置白名单时，按索引名前缀归并后最多保留的不同取值个数，之后新出现的都记为 other
+METRICS_INDEX_MAX_LABELS = int(os.getenv("METRICS_INDEX_MAX_LABELS", "50"))
+
+LabelValues = Tuple[str, ...]
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """
+    最小化的 Prometheus 指标实现（不引入 prometheus_client）：
+    标签值按声明顺序组成 key，渲染为文本格式 0.0.4。
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        # 请求处理在事件循环里，sweep 等在线程里，统一加锁
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """
+    collect 非空时为回调型：每次抓取时调用，返回 {标签值元组: 数值}。
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[LabelValues, float]]] = None
+    ):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterable[str]:
+        if self._collect is not None:
+            items = list(self._collect().items())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class CounterFunc(Gauge):
+    # 回调型计数器：数值由其他模块维护（例如 retention.stats），只在抓取时读出
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各桶计数（非累计）..., +Inf 桶计数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 2)
+            data[i] += 1
+            data[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, data in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), data):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(data[-1])}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {_format_value(cumulative)}"
+
+
+OTHER_INDEX = "other"
+# 前缀到第一个通配符或数字为止：按天 / 按序号滚动的索引归并成一个取值
+_INDEX_PREFIX = re.compile(r"[^*?0-9]*")
+_seen_index_labels: Set[str] = set()
+_seen_index_labels_lock = threading.Lock()
+
+
+def _index_prefix(part: str) -> str:
+    prefix = _INDEX_PREFIX.match(part).group(0)
+    return part if prefix == part else prefix + "*"
+
+
+def index_label(index: str) -> str:
+    """
+    把请求里的索引（用户输入，取值无界）归并成有限的标签取值，避免指标的时间序列无限增长。
+
+    配置了 METRICS_INDEX_LABELS 时按白名单匹配；否则取索引名前缀（"app-2024.05.01" -> "app-*"），
+    最多 METRICS_INDEX_MAX_LABELS 个。逗号分隔的多个索引归并到不同取值时记为 other。
+    """
+    parts = [p.strip() for p in (index or "").split(",") if p.strip() and not p.strip().startswith("-")]
+    if METRICS_INDEX_LABELS:
+        labels = {next((a for a in METRICS_INDEX_LABELS if fnmatchcase(p, a)), OTHER_INDEX) for p in parts}
+        return labels.pop() if len(labels) == 1 else OTHER_INDEX
+
+    labels = {_index_prefix(p) for p in parts}
+    if len(labels) != 1:
+        return OTHER_INDEX
+    label = labels.pop()
+    with _seen_index_labels_lock:
+        if label in _seen_index_labels:
+            return label
+        if len(_seen_index_labels) >= METRICS_INDEX_MAX_LABELS:
+            return OTHER_INDEX
+        _seen_index_labels.add(label)
+    return label
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+
+# ---- 导出 ----
+EXPORTS = Counter("logscope_exports_total", "Finished exports by index and outcome", ("index", "status"))
+EXPORT_LINES = Counter("logscope_export_lines_total", "Lines exported", ("index",))
+EXPORT_BYTES = Counter("logscope_export_bytes_total", "Uncompressed bytes exported", ("index",))
+EXPORT_TTFB = Histogram("logscope_export_ttfb_seconds", "Time from export start to the first encoded page")
+EXPORT_DURATION = Histogram("logscope_export_duration_seconds", "Export duration", ("status",))
+ACTIVE_EXPORTS = Gauge("logscope_active_exports", "Exports currently pulling pages from ES")
+
+# ---- ES ----
+ES_REQUEST_SECONDS = Histogram("logscope_es_request_seconds", "Latency of ES paging requests", ("op",))
+ES_REQUEST_ERRORS = Counter("logscope_es_request_errors_total", "Failed ES paging requests", ("op",))
+
+# ---- 进程 ----
+EVENT_LOOP_LAG = Histogram(
+    "logscope_event_loop_lag_seconds", "How late the event loop woke up from a timed sleep",
+    buckets=LOOP_LAG_BUCKETS
+)
@@ -0,0 +1,128 @@
+# coding=utf-8
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 导出总耗时超过该值（秒）时打印各阶段耗时
+SLOW_EXPORT_SECONDS = float(os.getenv("SLOW_EXPORT_SECONDS", "10"))
+# 单个 trace 最多保留的明细 span 数（逐页的 span 很多）；超出后只累加汇总
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("logscope_trace", default=None)
+
+
+class Trace:
+    """
+    一次导出的分阶段耗时：
+
+    - 明细：每个 span 的 (阶段名, 相对开始时间, 耗时)，最多 TRACE_MAX_SPANS 条
+    - 汇总：按阶段名累计次数与总耗时，用于 Server-Timing 和慢请求日志
+
+    通过 contextvar 传递，asyncio 任务创建时自动继承；写线程里用 writer 创建时捕获的引用。
+    """
+
+    def __init__(self, name: str = "export"):
+        self.name = name
+        self.started = time.monotonic()
+        self.duration: Optional[float] = None
+        self.spans: List[Dict] = []
+        self.dropped = 0
+        # 阶段名 -> [次数, 总耗时]
+        self._stages: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, duration: float):
+        with self._lock:
+            stage = self._stages.setdefault(name, [0, 0.0])
+            stage[0] += 1
+            stage[1] += duration
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append({
+                    "name": name,
+                    "start_ms": round((start - self.started) * 1000, 3),
+                    "duration_ms": round(duration * 1000, 3),
+                })
+            else:
+                self.dropped += 1
+
+    def stages(self) -> Dict[str, Dict]:
+        with self._lock:
+            items = list(self._stages.items())
+        return {
+            name: {"count": int(count), "total_ms": round(total * 1000, 3)}
+            for name, (count, total) in items
+        }
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing 头：每个阶段一项，dur 为累计毫秒，desc 为次数。
+        """
+        parts = [
+            f'{name};dur={s["total_ms"]};desc="{s["count"]}x"'
+            for name, s in self.stages().items()
+        ]
+        elapsed = self.duration if self.duration is not None else time.monotonic() - self.started
+        parts.append(f"total;dur={round(elapsed * 1000, 3)}")
+        return ", ".join(parts)
+
+    def finish(self):
+        if self.duration is not None:
+            return
+        self.duration = time.monotonic() - self.started
+        if self.duration >= SLOW_EXPORT_SECONDS:
+            breakdown = ", ".join(
+                f"{name}={s['total_ms']:.0f}ms/{s['count']}"
+                for name, s in sorted(self.stages().items(), key=lambda kv: -kv[1]["total_ms"])
+            )
+            logger.warning(f"Slow {self.name}: {self.duration:.1f}s ({breakdown})")
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "stages": self.stages(),
+            "spans": list(self.spans),
+            "dropped_spans": self.dropped,
+        }
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def activate(trace: Trace) -> Iterator[Trace]:
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, trace: Optional[Trace] = None) -> Iterator[None]:
+    """
+    记录一个阶段的耗时；当前没有 trace 时什么都不做。
+    """
+    trace = trace or _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.monotonic() - start)
+
+
+def record(name: str, start: float, trace: Optional[Trace] = None):
+    # 记录 [start, now) 这一段；用于起止点不在同一个代码块里的阶段
+    trace = trace or _current.get()
+    if trace is not None:
+        trace.add(name, start, time.monotonic() - start)
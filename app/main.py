@@ -2,8 +2,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.search import router as search_router
+from app.api.jobs import router as jobs_router
+from app.api.aggs import router as aggs_router
+from app.api.tail import router as tail_router
+from app.api.metrics import router as metrics_router
 from app.web.console import router as console_router
 from app.core.es import init_es, close_es
+from app.core.looplag import loop_lag_monitor
+from app.service.cache import export_cache
+from app.service.jobs import job_manager
+from app.service.tail import tail_hub
+from app.storage.retention import retention
 
 app = FastAPI(title="LogScope API")
 
@@ -17,13 +26,24 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup():
     await init_es(app)
+    await retention.start()
+    await loop_lag_monitor.start()
 
 @app.on_event("shutdown")
 async def shutdown():
+    await loop_lag_monitor.stop()
+    await job_manager.shutdown()
+    await export_cache.shutdown()
+    await tail_hub.shutdown()
+    await retention.stop()
     await close_es(app)
 
 app.include_router(search_router, prefix="/api/logscope")
+app.include_router(jobs_router, prefix="/api/logscope")
+app.include_router(aggs_router, prefix="/api/logscope")
+app.include_router(tail_router, prefix="/api/logscope")
 app.include_router(console_router)
+app.include_router(metrics_router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,235 @@
+# coding=utf-8
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.service.cache import make_cache_key
+from app.service.exporter import build_dsl
+from app.service.partition import find_time_range
+
+logger = logging.getLogger(__name__)
+
+# 已结束时间窗的聚合结果缓存多久（秒）；迟到的日志最多晚这么久才体现在统计里
+AGG_CACHE_SECONDS = float(os.getenv("AGG_CACHE_SECONDS", "300"))
+AGG_CACHE_MAX_ENTRIES = int(os.getenv("AGG_CACHE_MAX_ENTRIES", "512"))
+# 开放时间窗（没有结束时间或结束时间在未来）的结束点向下取整到该粒度（秒），
+# 同一粒度内的重复请求命中同一条缓存
+AGG_WINDOW_SECONDS = int(os.getenv("AGG_WINDOW_SECONDS", "60"))
+# 单次直方图最多的桶数
+AGG_MAX_BUCKETS = int(os.getenv("AGG_MAX_BUCKETS", "2000"))
+# 未指定 interval 时自动选择，使桶数不超过该值
+AGG_AUTO_BUCKETS = int(os.getenv("AGG_AUTO_BUCKETS", "120"))
+# 按北京时间对齐按天/小时的桶
+AGG_TIME_ZONE = "+08:00"
+
+_INTERVAL_RE = re.compile(r"^(\d+)(ms|s|m|h|d)$")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+_AUTO_INTERVALS = ("1s", "5s", "10s", "30s", "1m", "5m", "10m", "30m", "1h", "3h", "6h", "12h", "1d", "7d")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def interval_seconds(interval: str) -> float:
+    m = _INTERVAL_RE.match(interval or "")
+    if not m or int(m.group(1)) <= 0:
+        raise ValueError(f"Invalid interval: {interval!r}, expected e.g. 30s / 5m / 1h / 1d")
+    return int(m.group(1)) * _UNIT_SECONDS[m.group(2)]
+
+
+def auto_interval(span_seconds: float) -> str:
+    for interval in _AUTO_INTERVALS:
+        if span_seconds / interval_seconds(interval) <= AGG_AUTO_BUCKETS:
+            return interval
+    return _AUTO_INTERVALS[-1]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _epoch_ms(dt: datetime) -> int:
+    return int((dt - _EPOCH).total_seconds() * 1000)
+
+
+def close_window(filters: list) -> Tuple[list, Optional[datetime], datetime, bool]:
+    """
+    把时间过滤的结束点固定下来，返回 (新过滤条件, 开始, 结束, 是否开放时间窗)。
+
+    开放时间窗的结束点取“当前时间向下取整到 AGG_WINDOW_SECONDS”，并改成不含端点的 lt：
+    同一粒度内的请求得到相同的 DSL（即相同的缓存 key），也不会出现只统计了一半的最后一秒。
+    """
+    pos, ts_range = find_time_range(filters)
+    start = datetime.fromisoformat(ts_range["gte"]) if "gte" in ts_range else None
+    now = _utcnow()
+    end = datetime.fromisoformat(ts_range["lte"]) if "lte" in ts_range else None
+    if end is not None and end <= now:
+        return filters, start, end, False
+
+    step = timedelta(seconds=AGG_WINDOW_SECONDS)
+    end = _EPOCH + step * ((now - _EPOCH) // step)
+    closed = {k: v for k, v in ts_range.items() if k != "lte"}
+    closed["lt"] = end.isoformat()
+    filters = list(filters)
+    filters[pos] = {"range": {"@timestamp": closed}}
+    return filters, start, end, True
+
+
+class AggCache:
+    """
+    聚合结果的小型 TTL + LRU 缓存，同一个 key 的并发请求只查一次 ES。
+    """
+
+    def __init__(self, max_entries: int = AGG_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        # key -> (过期时刻, 结果)
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def _run(self, key: str, compute: Callable[[], Awaitable[Dict]], ttl: float) -> Dict:
+        try:
+            result = await compute()
+            self._entries[key] = (time.monotonic() + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Dict]], ttl: float) -> Dict:
+        result = self._lookup(key)
+        if result is not None:
+            return dict(result, cached=True)
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._run(key, compute, ttl))
+            self._inflight[key] = fut
+        return dict(await asyncio.shield(fut), cached=False)
+
+
+agg_cache = AggCache()
+
+
+def _agg_key(kind: str, cache_scope: object, index: str, dsl_query: Dict, *args) -> str:
+    return make_cache_key(kind=kind, cluster=cache_scope, index=index, query=dsl_query, args=list(args))
+
+
+def _ttl(open_window: bool) -> float:
+    # 开放时间窗的结果到下一个取整点就换 key 了，缓存没必要活得更久
+    return AGG_WINDOW_SECONDS if open_window else AGG_CACHE_SECONDS
+
+
+async def histogram(
+    es,
+    index: str,
+    query: str,
+    filters: list,
+    interval: Optional[str] = None,
+    cache_scope: object = None
+) -> Dict:
+    """
+    按 @timestamp 做 date_histogram，返回每个桶的条数（空桶补 0）。
+
+    interval 为 fixed_interval（30s / 5m / 1h / 1d ...），不填时按时间跨度自动选择。
+    """
+    filters, start, end, open_window = close_window(filters)
+    if start is None:
+        raise ValueError("histogram needs start_time")
+    span = max(0.0, (end - start).total_seconds())
+    interval = interval or auto_interval(span)
+    buckets = math.ceil(span / interval_seconds(interval))
+    if buckets > AGG_MAX_BUCKETS:
+        raise ValueError(
+            f"interval {interval} yields {buckets} buckets (max {AGG_MAX_BUCKETS}); use a larger interval"
+        )
+
+    dsl_query = build_dsl(query, filters)["query"]
+    body = {
+        "size": 0,
+        "track_total_hits": True,
+        "query": dsl_query,
+        "aggs": {
+            "h": {
+                "date_histogram": {
+                    "field": "@timestamp",
+                    "fixed_interval": interval,
+                    "time_zone": AGG_TIME_ZONE,
+                    "min_doc_count": 0,
+                    # 用 epoch 毫秒：字符串会被按 time_zone 解析，与过滤条件的 UTC 时间错开
+                    "extended_bounds": {"min": _epoch_ms(start), "max": max(_epoch_ms(end) - 1, _epoch_ms(start))},
+                }
+            }
+        },
+    }
+
+    async def compute() -> Dict:
+        resp = await es.search(
+            index=index, body=body,
+            filter_path="hits.total.value,aggregations.h.buckets.key,aggregations.h.buckets.doc_count",
+        )
+        raw = resp.get("aggregations", {}).get("h", {}).get("buckets", [])
+        return {
+            "interval": interval,
+            "start": _epoch_ms(start),
+            "end": _epoch_ms(end),
+            "total": resp.get("hits", {}).get("total", {}).get("value", 0),
+            "buckets": [{"key": b["key"], "count": b["doc_count"]} for b in raw],
+        }
+
+    key = _agg_key("histogram", cache_scope, index, dsl_query, interval)
+    return await agg_cache.get_or_compute(key, compute, _ttl(open_window))
+
+
+async def terms(
+    es,
+    index: str,
+    query: str,
+    filters: list,
+    field: str,
+    top: int = 10,
+    cache_scope: object = None
+) -> Dict:
+    """
+    对 field 做 terms 聚合，返回出现次数最多的 top 个值及其余部分的条数。
+    """
+    filters, _, _, open_window = close_window(filters)
+    dsl_query = build_dsl(query, filters)["query"]
+    body = {
+        "size": 0,
+        "track_total_hits": True,
+        "query": dsl_query,
+        "aggs": {"t": {"terms": {"field": field, "size": top}}},
+    }
+
+    async def compute() -> Dict:
+        resp = await es.search(
+            index=index, body=body,
+            filter_path="hits.total.value,aggregations.t.sum_other_doc_count,"
+                        "aggregations.t.buckets.key,aggregations.t.buckets.doc_count",
+        )
+        agg = resp.get("aggregations", {}).get("t", {})
+        return {
+            "field": field,
+            "total": resp.get("hits", {}).get("total", {}).get("value", 0),
+            "other": agg.get("sum_other_doc_count", 0),
+            "buckets": [{"key": b["key"], "count": b["doc_count"]} for b in agg.get("buckets", [])],
+        }
+
+    key = _agg_key("terms", cache_scope, index, dsl_query, field, top)
+    return await agg_cache.get_or_compute(key, compute, _ttl(open_window))
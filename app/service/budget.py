@@ -0,0 +1,165 @@
+# coding=utf-8
+import asyncio
+import os
+from collections import deque
+from typing import Deque, Tuple
+
+# 单个导出在途数据的内存预算（字节）：已取回未编码的页 + 已编码未写完的页
+EXPORT_MEMORY_BYTES = int(os.getenv("EXPORT_MEMORY_BYTES", str(64 * 1024 ** 2)))
+# 所有导出合计的内存预算（字节）；按容器内存上限减去常驻开销来设
+EXPORT_MEMORY_TOTAL_BYTES = int(os.getenv("EXPORT_MEMORY_TOTAL_BYTES", str(512 * 1024 ** 2)))
+# 解析后的 hit（dict / str / int 对象）相对编码后文本的内存放大倍数，用于估算取回的页占多少内存
+EXPORT_MEMORY_RAW_FACTOR = float(os.getenv("EXPORT_MEMORY_RAW_FACTOR", "4"))
+
+
+class MemoryBudget:
+    """
+    按字节计数的异步信号量：额度不够时 acquire 排队等待（FIFO），release 后按顺序唤醒。
+
+    单次申请超过上限时按上限计（返回实际占用的字节数，release 时用它），
+    预算清空后总能拿到，不会因为某一页特别大而永久阻塞。
+
+    force 不排队、不检查额度直接计入（used 可以暂时超过上限）：用于流程往下走必须持有的数据，
+    这部分的量由各处有界队列限定；只有预取、预读这类可以推迟的拉取才 acquire 等额度。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self.used = 0
+        self.peak = 0
+        # 因额度不够而等待的次数（= 拉取被暂停的次数）
+        self.waits = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    @property
+    def available(self) -> int:
+        return max(0, self.limit - self.used)
+
+    def _clamp(self, n: float) -> int:
+        return max(0, min(int(n), self.limit))
+
+    def _take(self, n: int):
+        self.used += n
+        self.peak = max(self.peak, self.used)
+
+    def try_acquire(self, n: float) -> int:
+        """
+        立即占用；额度不够（或前面有人在排队）时返回 -1。
+        """
+        n = self._clamp(n)
+        if self._waiters or self.used + n > self.limit:
+            return -1
+        self._take(n)
+        return n
+
+    def force(self, n: float) -> int:
+        n = self._clamp(n)
+        self._take(n)
+        return n
+
+    async def acquire(self, n: float) -> int:
+        got = self.try_acquire(n)
+        if got >= 0:
+            return got
+
+        n = self._clamp(n)
+        self.waits += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((n, fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 已经分到额度才被取消：还回去
+                self.release(n)
+            else:
+                try:
+                    self._waiters.remove((n, fut))
+                except ValueError:
+                    pass
+                self._wake()
+            raise
+        return n
+
+    def release(self, n: int):
+        self.used = max(0, self.used - n)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            n, fut = self._waiters[0]
+            if fut.done():
+                self._waiters.popleft()
+                continue
+            if self.used + n > self.limit:
+                break
+            self._waiters.popleft()
+            self._take(n)
+            fut.set_result(None)
+
+
+# 所有导出共用的全局预算
+export_memory = MemoryBudget(EXPORT_MEMORY_TOTAL_BYTES)
+
+
+class ExportBudget:
+    """
+    单个导出的内存预算：每次占用同时计入本导出的额度和全局额度，任一不够都要等。
+
+    导出结束时必须 close，把还没释放的部分（例如中途取消时队列里的页）还给全局预算；
+    close 之后的占用不再计入，release 也不再生效。
+    """
+
+    def __init__(self, limit: int = EXPORT_MEMORY_BYTES, shared: MemoryBudget = export_memory):
+        self.local = MemoryBudget(min(limit, shared.limit))
+        self.shared = shared
+        self.closed = False
+        # 已同时计入本导出和全局预算、还没归还的字节数
+        self.held = 0
+
+    @property
+    def limit(self) -> int:
+        return self.local.limit
+
+    @property
+    def available(self) -> int:
+        return min(self.local.available, self.shared.available)
+
+    def force(self, n: float) -> int:
+        if self.closed:
+            return 0
+        n = self.local.force(n)
+        self.shared.force(n)
+        self.held += n
+        return n
+
+    async def acquire(self, n: float) -> int:
+        if self.closed:
+            return 0
+        n = await self.local.acquire(n)
+        try:
+            await self.shared.acquire(n)
+        except BaseException:
+            self.local.release(n)
+            raise
+        if self.closed:
+            # 等额度期间导出已经结束
+            self.shared.release(n)
+            return 0
+        self.held += n
+        return n
+
+    def release(self, n: int):
+        if self.closed or not n:
+            # close 时已经整体归还
+            return
+        self.held -= n
+        self.local.release(n)
+        self.shared.release(n)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.shared.release(self.held)
+            self.held = 0
+            self.local.used = 0
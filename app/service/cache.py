@@ -0,0 +1,113 @@
+# coding=utf-8
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.storage.local import get_file_path
+from app.storage.retention import retention
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CACHE_MAX_ENTRIES = int(os.getenv("EXPORT_CACHE_MAX_ENTRIES", "256"))
+# 没有结束时间（或结束时间在未来）的时间窗，结果会随时间增长：只在这段时间内复用
+EXPORT_CACHE_OPEN_WINDOW_SECONDS = float(os.getenv("EXPORT_CACHE_OPEN_WINDOW_SECONDS", "30"))
+
+# (文件名, 导出条数)
+ExportResult = Tuple[str, int]
+
+
+def make_cache_key(**parts) -> str:
+    """
+    对查询参数做规范化 JSON（键排序、紧凑分隔符）后取 sha256。
+    """
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("file_name", "count", "created_at")
+
+    def __init__(self, file_name: str, count: int):
+        self.file_name = file_name
+        self.count = count
+        self.created_at = time.monotonic()
+
+
+class ExportCache:
+    """
+    导出结果缓存 + single-flight：
+
+    - 命中且文件仍在保留期内：直接复用文件，并顺延其过期时间
+    - 同一个 key 的并发请求共享同一次导出（只走一遍 ES 分页）
+    """
+
+    def __init__(self, max_entries: int = EXPORT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _lookup(self, key: str, max_age: Optional[float]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if max_age is not None and time.monotonic() - entry.created_at > max_age:
+            return None
+        if not retention.touch(get_file_path(entry.file_name)):
+            # 文件已被清理
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def _run(self, key: str, export: Callable[[], Awaitable[ExportResult]]) -> ExportResult:
+        try:
+            file_name, count = await export()
+            if count > 0:
+                self._entries[key] = _Entry(file_name, count)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return file_name, count
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_export(
+        self,
+        key: str,
+        export: Callable[[], Awaitable[ExportResult]],
+        max_age: Optional[float] = None
+    ) -> ExportResult:
+        """
+        max_age：缓存条目允许的最大年龄（秒），None 表示只要文件还在就复用。
+        """
+        entry = self._lookup(key, max_age)
+        if entry is not None:
+            logger.info(f"Export cache hit: {entry.file_name}")
+            return entry.file_name, entry.count
+
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._run(key, export))
+            self._inflight[key] = fut
+        else:
+            logger.info("Export joined an in-flight identical request")
+        # shield：某个等待方断开不影响其他等待方共享的导出
+        return await asyncio.shield(fut)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    async def shutdown(self):
+        # 等待方被取消时共享的导出仍在跑（shield），这里取消并等它们退出
+        tasks = list(self._inflight.values())
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+export_cache = ExportCache()
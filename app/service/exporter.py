@@ -1,21 +1,186 @@
 # coding=utf-8
+import asyncio
+import functools
+import heapq
 import json
 import logging
-from typing import Dict, Optional
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from elasticsearch import ApiError, TransportError
+
+from app.core import metrics, tracing
+from app.service.budget import EXPORT_MEMORY_RAW_FACTOR, ExportBudget
+from app.service.fanout import Cluster, ClusterReport, ClusterStatus, ClustersFailed
+from app.service.formats import DEFAULT_FIELDS, make_encoder
+from app.service.partition import EXPORT_PARTITION_CONCURRENCY, Partition, plan_partitions
+from app.storage.compression import writer_opener
+from app.storage.writer import AsyncFileWriter
 
 logger = logging.getLogger(__name__)
 
-async def export_logs(
-    es,
-    index: str,
+SCROLL_KEEP_ALIVE = "2m"
+PIT_KEEP_ALIVE = "2m"
+# PIT 模式下的排序：@timestamp + _shard_doc 作为 tiebreaker，保证 search_after 不丢不重
+PIT_SORT = [{"@timestamp": {"order": "asc"}}, {"_shard_doc": {"order": "asc"}}]
+DEFAULT_PAGE_SIZE = 2000
+# 自适应页大小的上下限（search_after / scroll 单页上限默认 10000）
+PAGE_SIZE_MIN = 100
+PAGE_SIZE_MAX = 10000
+# 单页数据的内存预算（按编码后的文本大小估算）
+EXPORT_PAGE_MAX_BYTES = int(os.getenv("EXPORT_PAGE_MAX_BYTES", str(8 * 1024 ** 2)))
+# 还没有观测值、调用方也没给出估算（ExportPlan.avg_line_bytes）时，按每条这么多字节定首页大小
+EXPORT_DEFAULT_LINE_BYTES = int(os.getenv("EXPORT_DEFAULT_LINE_BYTES", "1024"))
+# 单次分页请求的目标耗时（秒）：请求越快页越大，越慢页越小
+EXPORT_PAGE_TARGET_SECONDS = float(os.getenv("EXPORT_PAGE_TARGET_SECONDS", "1.0"))
+# 只保留分页和编码需要的部分，省掉每条 hit 的 _index/_id/_score 等元数据的传输与解析
+FILTER_PATH = ["_scroll_id", "pit_id", "hits.hits._source", "hits.hits.fields", "hits.hits.sort"]
+# 每个 slice 最多预取的页数（merge 阶段消费慢时，slice 任务在此处阻塞）
+SLICE_QUEUE_PAGES = 2
+# 文件导出时已编码、等待写盘的页数上限（写盘跟不上时，拉取在此处阻塞）
+EXPORT_WRITE_QUEUE_PAGES = int(os.getenv("EXPORT_WRITE_QUEUE_PAGES", "2"))
+
+_END = object()
+
+
+class ExportProgress:
+    """
+    导出进度：由 export_logs 按页更新，供异步任务查询。
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.pages = 0
+        # 预计导出条数（min(命中数, size)），未知时为 None
+        self.total: Optional[int] = None
+        self.started_at = time.monotonic()
+
+    def eta_seconds(self) -> Optional[float]:
+        if not self.total or self.lines <= 0:
+            return None
+        elapsed = time.monotonic() - self.started_at
+        rate = self.lines / elapsed if elapsed > 0 else 0
+        if rate <= 0:
+            return None
+        return max(0.0, (self.total - self.lines) / rate)
+
+    def to_dict(self) -> Dict:
+        eta = self.eta_seconds()
+        return {
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "pages": self.pages,
+            "total": self.total,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+
+class PageSizer:
+    """
+    自适应页大小：按观测到的"每条字节数"和"每条耗时"决定下一页取多少条。
+
+    - 字节：单页不超过 max_bytes，大堆栈日志不会撑爆内存
+    - 耗时：单次请求尽量贴近 target_seconds，短消息索引会用更大的页
+    每次调整最多放大一倍，缩小立即生效；adaptive=False 时固定为初始值。
+
+    首页大小同样受 max_bytes 限制，按 line_bytes（估算的每条字节数）换算成条数：
+    scroll 的页大小在首个请求时就定下了，首页过大会一直占着远超预算的内存。
+    budget 非空时，各分页流据此决定是否预取下一页（见 can_prefetch）。
+    remaining 为导出还需要的条数（由消费方逐页更新），单次请求不会超过它（见 request_size）。
+    """
+
+    _ALPHA = 0.3
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_PAGE_SIZE,
+        adaptive: bool = True,
+        max_bytes: int = EXPORT_PAGE_MAX_BYTES,
+        target_seconds: float = EXPORT_PAGE_TARGET_SECONDS,
+        budget: Optional[ExportBudget] = None,
+        line_bytes: Optional[float] = None
+    ):
+        self.line_bytes = line_bytes or EXPORT_DEFAULT_LINE_BYTES
+        self.size = min(initial, max(PAGE_SIZE_MIN, int(max_bytes / self.line_bytes)))
+        self.adaptive = adaptive
+        self.max_bytes = max_bytes
+        self.target_seconds = target_seconds
+        self.budget = budget
+        self.remaining: Optional[int] = None
+        self._bytes_per_hit: Optional[float] = None
+        self._seconds_per_hit: Optional[float] = None
+
+    def _ema(self, old: Optional[float], new: float) -> float:
+        return new if old is None else old + self._ALPHA * (new - old)
+
+    def observe_latency(self, n: int, seconds: float):
+        if not self.adaptive or n <= 0:
+            return
+        self._seconds_per_hit = self._ema(self._seconds_per_hit, seconds / n)
+        self._adjust()
+
+    def observe_bytes(self, n: int, nbytes: int):
+        if n <= 0:
+            return
+        # 固定页大小时也记录每条字节数，供内存预算估算
+        self._bytes_per_hit = self._ema(self._bytes_per_hit, nbytes / n)
+        if self.adaptive:
+            self._adjust()
+
+    def request_size(self, fetched: int = 0) -> int:
+        """
+        下一次请求取多少条：页大小与导出还需要的条数取小。
+        fetched 为本流已取回、还没交给消费方的条数（预取时就是当前页）；返回 0 表示已经取够。
+        """
+        if self.remaining is None:
+            return self.size
+        return max(0, min(self.size, self.remaining - fetched))
+
+    def raw_bytes(self, n: Optional[int] = None) -> int:
+        """
+        n 条（默认一整页）解析后的 hit 大约占多少内存；还没有观测值时按 line_bytes 估。
+        """
+        n = self.size if n is None else n
+        return int(n * (self._bytes_per_hit or self.line_bytes) * EXPORT_MEMORY_RAW_FACTOR)
+
+    def can_prefetch(self) -> bool:
+        # 预算里还放得下一整页才预取；写盘跟不上、预算被占满时，等消费方要下一页再发请求
+        return self.budget is None or self.budget.available >= self.raw_bytes()
+
+    def _adjust(self):
+        # 还没编码过任何一页时按 line_bytes 估：多个页流的首批响应会先于第一次编码到达，不能只按耗时放大
+        limit = min(PAGE_SIZE_MAX, self.max_bytes / (self._bytes_per_hit or self.line_bytes))
+        if self._seconds_per_hit:
+            limit = min(limit, self.target_seconds / self._seconds_per_hit)
+        self.size = int(max(PAGE_SIZE_MIN, min(limit, self.size * 2)))
+
+
+def page_bytes_for_budget(limit: int, streams: int = 1) -> int:
+    """
+    在 limit 字节的导出预算内，单页（编码后）最多多大。
+
+    预算要同时装下：每个并发的页流在途的 SLICE_QUEUE_PAGES + 1 页（解析后的 hit，按 EXPORT_MEMORY_RAW_FACTOR 放大），
+    以及写盘一侧的 EXPORT_WRITE_QUEUE_PAGES 页排队 + 1 页等待提交 + 1 页正在写。
+    """
+    pages = max(1, streams) * (SLICE_QUEUE_PAGES + 1) * EXPORT_MEMORY_RAW_FACTOR + EXPORT_WRITE_QUEUE_PAGES + 2
+    return int(min(EXPORT_PAGE_MAX_BYTES, limit / pages))
+
+
+def build_dsl(
     query: str,
     filters: list,
-    file_path: str,
-    max_size: int = 50000
-) -> int:
+    fields: Optional[List[str]] = None,
+    fetch: str = "source"
+) -> Dict:
     """
-    Scroll 查询 ES 并写入文件
+    fetch 决定字段从哪里取：
+    - source：_source 过滤（默认，任何字段都可用）
+    - fields：fields API，不返回 _source
+    - docvalue：docvalue_fields，直接读列存，最省 CPU；只适用于 keyword / 数值 / 日期等有 doc values 的字段
     """
+    fields = list(fields or DEFAULT_FIELDS)
     dsl = {
         "query": {
             "bool": {
@@ -23,44 +188,696 @@ async def export_logs(
                 "filter": filters
             }
         },
-        "_source": ["message"],
         "sort": [{"@timestamp": {"order": "asc"}}]
     }
+    if fetch == "fields":
+        dsl["_source"] = False
+        dsl["fields"] = fields
+    elif fetch == "docvalue":
+        dsl["_source"] = False
+        dsl["docvalue_fields"] = fields
+    else:
+        dsl["_source"] = fields
+    return dsl
 
-    logger.info(f"ES DSL: {json.dumps(dsl, ensure_ascii=False)}")
 
-    count = 0
-    page_size = 2000
-    scroll_id = None
-
-    with open(file_path, "w", encoding="utf-8") as f:
-        resp = await es.search(
-            index=index,
-            body=dsl,
-            scroll="2m",
-            size=page_size
-        )
-        scroll_id = resp.get("_scroll_id")
+def _hits(resp) -> List[Dict]:
+    # filter_path 下没有命中时整个 hits 键都会被去掉
+    return resp.get("hits", {}).get("hits", [])
+
+
+async def _timed(sizer: PageSizer, op: str, call, **kwargs):
+    start = time.monotonic()
+    try:
+        resp = await call(**kwargs)
+    except ApiError:
+        metrics.ES_REQUEST_ERRORS.inc(op=op)
+        raise
+    finally:
+        tracing.record(op, start)
+    elapsed = time.monotonic() - start
+    metrics.ES_REQUEST_SECONDS.observe(elapsed, op=op)
+    sizer.observe_latency(len(_hits(resp)), elapsed)
+    return resp
+
+
+async def _cancel(task: Optional[asyncio.Future]):
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def _scroll_pages(
+    es,
+    index: str,
+    dsl: Dict,
+    sizer: PageSizer,
+    slice_id: Optional[int] = None,
+    slices: int = 1
+) -> AsyncIterator[List[Dict]]:
+    """
+    单个 scroll 游标按页产出 hits；slices > 1 时只遍历其中一个 slice
+
+    scroll 的页大小在首个请求时就定下了，之后不能再调整（自适应只对 PIT 生效）。
+    产出当前页之前先发出下一页的 scroll 请求，与消费方的编码/写盘重叠（内存预算不够时不预取）。
+    """
+    body = dict(dsl)
+    if slices > 1:
+        body["slice"] = {"id": slice_id, "max": slices}
+
+    resp = await _timed(
+        sizer, "search", es.search,
+        index=index,
+        body=body,
+        scroll=SCROLL_KEEP_ALIVE,
+        size=max(1, sizer.request_size()),
+        filter_path=FILTER_PATH
+    )
+    scroll_id = resp.get("_scroll_id")
+    pending: Optional[asyncio.Future] = None
+
+    def request() -> asyncio.Future:
+        return asyncio.ensure_future(_timed(
+            sizer, "scroll", es.scroll, scroll_id=scroll_id, scroll=SCROLL_KEEP_ALIVE, filter_path=FILTER_PATH
+        ))
+
+    try:
+        while True:
+            hits = _hits(resp)
+            if not hits:
+                break
+            # 这一页之后还需要数据时才预取
+            more = sizer.request_size(len(hits)) > 0
+            if more and sizer.can_prefetch():
+                pending = request()
+            # 产出后不再引用这一页：消费方编码完会清空它
+            del resp
+            yield hits
+            del hits
+            if not more:
+                break
+            resp, pending = await (pending or request()), None
+            scroll_id = resp.get("_scroll_id") or scroll_id
+    finally:
+        await _cancel(pending)
+        if scroll_id:
+            with tracing.span("clear_scroll"):
+                await es.clear_scroll(scroll_id=scroll_id)
+
+
+async def _pit_pages(
+    es,
+    dsl: Dict,
+    sizer: PageSizer,
+    pit: Dict,
+    slice_id: Optional[int] = None,
+    slices: int = 1
+) -> AsyncIterator[List[Dict]]:
+    """
+    PIT + search_after 按页产出 hits；不占用 scroll context，深分页开销恒定。
+
+    pit 为共享的 {"id": ...}，每次响应返回的新 pit_id 会回写进去，供最后关闭。
+    每页的条数取自 sizer（可逐页调整）；产出当前页之前先发出下一页请求（内存预算不够时不预取）。
+    """
+    base = dict(dsl)
+    base["sort"] = PIT_SORT
+    base["track_total_hits"] = False
+    if slices > 1:
+        base["slice"] = {"id": slice_id, "max": slices}
+
+    def request(search_after: Optional[List] = None, fetched: int = 0):
+        size = sizer.request_size(fetched)
+        if size <= 0:
+            # 导出需要的条数已经取够
+            return 0, None
+        body = dict(base, size=size, pit={"id": pit["id"], "keep_alive": PIT_KEEP_ALIVE})
+        if search_after is not None:
+            body["search_after"] = search_after
+        return size, asyncio.ensure_future(_timed(sizer, "search", es.search, body=body, filter_path=FILTER_PATH))
+
+    size, pending = request()
+    try:
+        while pending is not None:
+            resp, pending = await pending, None
+            pit["id"] = resp.get("pit_id") or pit["id"]
+
+            hits = _hits(resp)
+            del resp
+            if not hits:
+                break
+            after = hits[-1]["sort"] if len(hits) >= size else None
+            if after is not None and sizer.can_prefetch():
+                # 预取：消费方处理这一页时，下一页已经在路上
+                size, pending = request(after, len(hits))
+                if pending is None:
+                    after = None
+            yield hits
+            del hits
+            if after is not None and pending is None:
+                size, pending = request(after)
+    finally:
+        await _cancel(pending)
+
+
+async def _open_pit(es, index: str, pagination: str) -> Optional[Dict]:
+    if pagination == "scroll":
+        return None
+    start = time.monotonic()
+    try:
+        resp = await es.open_point_in_time(index=index, keep_alive=PIT_KEEP_ALIVE)
+        metrics.ES_REQUEST_SECONDS.observe(time.monotonic() - start, op="open_pit")
+        tracing.record("open_pit", start)
+    except ApiError as e:
+        # ES < 7.10 / 部分兼容实现不支持 PIT：auto 模式下回退到 scroll
+        if pagination == "pit":
+            raise
+        logger.warning(f"PIT not available on index={index}, fallback to scroll: {e}")
+        return None
+    return {"id": resp["id"]}
+
+
+async def _close_pit(es, pit: Dict):
+    try:
+        with tracing.span("close_pit"):
+            await es.close_point_in_time(id=pit["id"])
+    except Exception as e:
+        # PIT 会在 keep_alive 后自动过期，这里关闭失败不影响导出结果
+        logger.warning(f"close PIT failed: {e}")
+
+
+class _PageQueue(asyncio.Queue):
+    """
+    生产方与消费方之间的有界队列（_pump 的页、文件导出待写的文本）；消费方用 take 取，取空时置位 drained。
+    """
+
+    def __init__(self, maxsize: int = SLICE_QUEUE_PAGES):
+        super().__init__(maxsize)
+        self.drained = asyncio.Event()
+
+    async def take(self):
+        item = await self.get()
+        if self.empty():
+            self.drained.set()
+        return item
+
+
+async def _charge_queued(budget: ExportBudget, queue: _PageQueue, n: int) -> int:
+    """
+    给要放进 queue 的一项占预算，返回实际记入的字节数。
+
+    队列为空时消费方可能正等着这一项，直接记账、不等额度（让它等预算会和自己还没归还的数据互相等）；
+    否则这一项是预读，额度不够时等待，等待期间消费方把队列取空了就不再等，直接记账。
+    """
+    if queue.empty():
+        return budget.force(n)
+    queue.drained.clear()
+    acquire = asyncio.ensure_future(budget.acquire(n))
+    drained = asyncio.ensure_future(queue.drained.wait())
+    try:
+        await asyncio.wait([acquire, drained], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        acquire.cancel()
+        drained.cancel()
+        await asyncio.gather(acquire, drained, return_exceptions=True)
+    if acquire.cancelled():
+        return budget.force(n)
+    return acquire.result()
+
 
-        try:
+async def _pump(pages: AsyncIterator[List[Dict]], queue: _PageQueue, sizer: PageSizer):
+    """
+    后台任务：把一个有序页流搬到有界队列里，队列元素为 (页, 占用的预算)；异常也通过队列交给消费方。
+
+    每页入队时记入 sizer.budget 一次（见 _charge_queued），消费方取出后调用 _unqueue 归还；
+    预算不够时预读在这里暂停，队列里的页被取完后再继续。
+    """
+    try:
+        async for page in pages:
+            cost = 0
+            if sizer.budget is not None:
+                cost = await _charge_queued(sizer.budget, queue, sizer.raw_bytes(len(page)))
+            await queue.put((page, cost))
+            del page
+        await queue.put(_END)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+    finally:
+        await pages.aclose()
+
+
+async def _unqueue(queue: _PageQueue, sizer: PageSizer) -> Optional[List[Dict]]:
+    # 从 _pump 的队列取下一页，流结束时返回 None
+    item = await queue.take()
+    if item is _END:
+        return None
+    if isinstance(item, Exception):
+        raise item
+    page, cost = item
+    if cost:
+        sizer.budget.release(cost)
+    return page
+
+
+async def merge_sorted_pages(
+    streams: List[AsyncIterator[List[Dict]]],
+    sizer: PageSizer
+) -> AsyncIterator[List[Dict]]:
+    """
+    并发拉取多个各自按 sort 升序的页流，k 路归并后重新按 sizer.size 分页产出。
+
+    每个 hit 需带 ES 返回的 "sort" 值（DSL 中已指定 sort）。
+    """
+    queues = [_PageQueue() for _ in streams]
+    tasks = [
+        asyncio.ensure_future(_pump(s, q, sizer)) for s, q in zip(streams, queues)
+    ]
+
+    def next_page(i: int):
+        return _unqueue(queues[i], sizer)
+
+    try:
+        # 堆元素：(sort 值, 流序号, 页内位置, 页)
+        heap = []
+        for i in range(len(streams)):
+            page = await next_page(i)
+            if page:
+                heap.append((page[0].get("sort") or [], i, 0, page))
+        heapq.heapify(heap)
+
+        out = []
+        while heap:
+            _, i, pos, page = heap[0]
+            out.append(page[pos])
+            if len(out) >= sizer.size:
+                yield out
+                out = []
+
+            pos += 1
+            if pos >= len(page):
+                page = await next_page(i)
+                pos = 0
+            if page:
+                heapq.heapreplace(heap, (page[pos].get("sort") or [], i, pos, page))
+            else:
+                heapq.heappop(heap)
+
+        if out:
+            yield out
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def iter_pages(
+    es,
+    index: str,
+    dsl: Dict,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    slices: int = 1,
+    pagination: str = "auto",
+    sizer: Optional[PageSizer] = None
+) -> AsyncIterator[List[Dict]]:
+    """
+    按 @timestamp 升序产出 hits 页。
+
+    - pagination: auto（优先 PIT + search_after，开不了 PIT 或首个 PIT 查询失败时回退 scroll）/ pit / scroll
+    - slices > 1 时拆成 N 个 slice 并发拉取，再归并保持全局顺序
+    - 传入 sizer 时按它自适应页大小，否则固定为 page_size
+    """
+    sizer = sizer or PageSizer(page_size, adaptive=False)
+    pit = await _open_pit(es, index, pagination)
+    pages = _sliced_pages(es, index, dsl, sizer, slices, pit)
+
+    try:
+        if pit is not None and pagination == "auto":
+            try:
+                first = await pages.__anext__()
+            except StopAsyncIteration:
+                return
+            except ApiError as e:
+                # ES 7.10–7.11 能开 PIT 但还不支持按 _shard_doc 排序（7.12 起）：
+                # 首个 PIT 查询失败时还没有产出任何数据，关掉 PIT 改用 scroll 重来
+                logger.warning(f"PIT search failed on index={index}, fallback to scroll: {e}")
+                await pages.aclose()
+                await _close_pit(es, pit)
+                pit = None
+                pages = _sliced_pages(es, index, dsl, sizer, slices, pit)
+            else:
+                yield first
+                del first
+        async for page in pages:
+            yield page
+    finally:
+        await pages.aclose()
+        if pit is not None:
+            await _close_pit(es, pit)
+
+
+def _sliced_pages(
+    es,
+    index: str,
+    dsl: Dict,
+    sizer: PageSizer,
+    slices: int,
+    pit: Optional[Dict]
+) -> AsyncIterator[List[Dict]]:
+    # 有 pit 时走 PIT + search_after，否则走 scroll；多个 slice 归并保持全局顺序
+    if pit is not None:
+        streams = [
+            _pit_pages(es, dsl, sizer, pit, slice_id=i, slices=slices)
+            for i in range(slices)
+        ]
+    else:
+        streams = [
+            _scroll_pages(es, index, dsl, sizer, slice_id=i, slices=slices)
+            for i in range(slices)
+        ]
+    return streams[0] if len(streams) == 1 else merge_sorted_pages(streams, sizer)
+
+
+async def iter_partitioned_pages(
+    es,
+    partitions: List[Tuple[str, Dict]],
+    sizer: PageSizer,
+    slices: int = 1,
+    pagination: str = "auto",
+    concurrency: int = EXPORT_PARTITION_CONCURRENCY
+) -> AsyncIterator[List[Dict]]:
+    """
+    分区导出：partitions 为按时间先后排列、互不重叠的 (索引, DSL)。
+
+    同时最多 concurrency 个分区在拉取，各自写入有界队列；按分区顺序依次消费，
+    当前分区取完才启动下一个，因此不会出现"靠后的分区占满名额、靠前的分区等不到"的情况。
+    """
+    queues: List[_PageQueue] = []
+    tasks: List[asyncio.Future] = []
+
+    def start(i: int):
+        index, dsl = partitions[i]
+        queue = _PageQueue()
+        pages = iter_pages(es, index, dsl, slices=slices, pagination=pagination, sizer=sizer)
+        queues.append(queue)
+        tasks.append(asyncio.ensure_future(_pump(pages, queue, sizer)))
+
+    try:
+        for i in range(min(concurrency, len(partitions))):
+            start(i)
+        for i in range(len(partitions)):
             while True:
-                hits = resp["hits"]["hits"]
-                if not hits:
+                page = await _unqueue(queues[i], sizer)
+                if page is None:
                     break
+                yield page
+                del page
+            if len(tasks) < len(partitions):
+                start(len(tasks))
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _guarded_pages(
+    cluster: Cluster,
+    pages: AsyncIterator[List[Dict]],
+    status: ClusterStatus
+) -> AsyncIterator[List[Dict]]:
+    """
+    单个集群的页流：每页（含打开 PIT）限时 cluster.timeout。
+    超时或 ES 出错时记到 status 并结束这个流，归并继续使用其他集群的数据。
+    """
+    it = pages.__aiter__()
+    try:
+        while True:
+            try:
+                page = await asyncio.wait_for(it.__anext__(), cluster.timeout)
+            except StopAsyncIteration:
+                status.status = "ok"
+                return
+            status.hits += len(page)
+            yield page
+    except asyncio.TimeoutError:
+        status.fail("timeout", f"no page within {cluster.timeout:g}s")
+    except (ApiError, TransportError) as e:
+        status.fail("failed", str(e))
+    finally:
+        await pages.aclose()
 
-                for h in hits:
-                    f.write(h["_source"].get("message", "") + "\n")
-                    count += 1
-                    if count >= max_size:
-                        break
 
-                if count >= max_size:
+async def iter_cluster_pages(
+    clusters: List[Cluster],
+    dsl: Dict,
+    sizer: PageSizer,
+    report: ClusterReport,
+    slices: int = 1,
+    pagination: str = "auto"
+) -> AsyncIterator[List[Dict]]:
+    """
+    多集群导出：各集群（可以是不同索引）并发分页，按 sort 值 k 路归并成一个 @timestamp 升序的流。
+
+    慢的集群会拖住归并（全局有序必须等它的下一页），所以每个集群单独限时，超时即剔除；
+    剔除与出错情况记在 report 里。所有集群都失败且一条都没取到时抛 ClustersFailed。
+    """
+    streams = [
+        _guarded_pages(
+            c,
+            iter_pages(c.es, c.index, dsl, slices=slices, pagination=pagination, sizer=sizer),
+            status
+        )
+        for c, status in zip(clusters, report.clusters)
+    ]
+    pages = merge_sorted_pages(streams, sizer)
+    try:
+        async for page in pages:
+            yield page
+    finally:
+        await pages.aclose()
+
+    if report.all_failed and not any(c.hits for c in report.clusters):
+        raise ClustersFailed(report)
+    for status in report.clusters:
+        # 达到 max_size 提前结束时，没取完的集群也算成功
+        if status.status == "pending":
+            status.status = "ok"
+
+
+async def iter_export_chunks(
+    es,
+    index: str,
+    query: str,
+    filters: list,
+    max_size: int = 50000,
+    page_size: Optional[int] = None,
+    slices: int = 1,
+    pagination: str = "auto",
+    fields: Optional[List[str]] = None,
+    fmt: str = "txt",
+    fetch: str = "source",
+    partition_seconds: Optional[int] = None,
+    clusters: Optional[List[Cluster]] = None,
+    report: Optional[ClusterReport] = None,
+    budget: Optional[ExportBudget] = None,
+    line_bytes: Optional[float] = None
+) -> AsyncIterator[Tuple[str, int]]:
+    """
+    按页产出 (文本, 条数)：每个 ES 页按 fmt（txt / ndjson / csv / columnar）整页编码成一段文本，
+    总条数不超过 max_size。fields 为导出的字段，默认只有 message；fetch 见 build_dsl。
+    page_size 为 None 时自适应页大小（见 PageSizer），否则固定。
+    partition_seconds 非空时按该时长把时间窗切成分区并发导出（见 plan_partitions）。
+    clusters 非空时忽略 es / index，从这些集群并发拉取后按时间归并，各集群情况记入 report。
+
+    内存受 budget 约束（未传入时新建一个 ExportBudget，结束时关闭）：
+    - 每页按估算的大小记入预算一次（经过 _pump 队列的在入队时记，单个页流直接产出的在这里记），编码完即归还
+    - 预算不够时暂停的只是预取和队列预读；消费方要的那一页不等额度，否则会和自己还没归还的页互相等
+    - 编码后立即清空页列表，ES 响应里的 hit 对象马上可回收，不必等上游生成器丢掉引用
+    - 单页上限按预算和并发页流数收紧（见 page_bytes_for_budget），首页按 line_bytes（导出估算的每行字节数）换算条数
+    文件导出与流式响应共用这条管线。
+    """
+    with tracing.span("dsl"):
+        dsl = build_dsl(query, filters, fields, fetch)
+        encoder = make_encoder(fmt, fields, fetch)
+        header = encoder.header()
+
+    logger.info(f"ES DSL: {json.dumps(dsl, ensure_ascii=False)} slices={slices} page_size={page_size or 'auto'} pagination={pagination}")
+
+    own_budget = budget is None
+    budget = budget or ExportBudget()
+    streams = slices * (len(clusters) if clusters else EXPORT_PARTITION_CONCURRENCY if partition_seconds else 1)
+    sizer = PageSizer(
+        page_size or DEFAULT_PAGE_SIZE,
+        adaptive=page_size is None,
+        max_bytes=page_bytes_for_budget(budget.limit, streams),
+        budget=budget,
+        line_bytes=line_bytes
+    )
+    remaining = sizer.remaining = max_size
+    # 单个页流直接交给这里（不经过 _pump 队列）时，由这里给正在编码的页记账
+    direct = not clusters and not partition_seconds and slices <= 1
+    if clusters:
+        pages = iter_cluster_pages(
+            clusters, dsl, sizer, report or ClusterReport([(c.name, c.index) for c in clusters]),
+            slices=slices,
+            pagination=pagination
+        )
+    elif partition_seconds:
+        partitions: List[Partition] = await plan_partitions(es, index, filters, partition_seconds)
+        pages = iter_partitioned_pages(
+            es,
+            [(idx, build_dsl(query, f, fields, fetch)) for idx, f in partitions],
+            sizer,
+            slices=slices,
+            pagination=pagination
+        )
+    else:
+        pages = iter_pages(
+            es, index, dsl,
+            slices=slices,
+            pagination=pagination,
+            sizer=sizer
+        )
+
+    started = time.monotonic()
+    status = "error"
+    first = True
+    index_label = metrics.index_label(index)
+    metrics.ACTIVE_EXPORTS.inc()
+    try:
+        while remaining > 0:
+            try:
+                hits = await pages.__anext__()
+            except StopAsyncIteration:
+                break
+            cost = budget.force(sizer.raw_bytes(len(hits))) if direct else 0
+            try:
+                n = min(len(hits), remaining)
+                with tracing.span("encode"):
+                    text = encoder.encode(hits if n == len(hits) else hits[:n])
+                hits.clear()
+                del hits
+            finally:
+                budget.release(cost)
+            remaining -= n
+            sizer.remaining = remaining
+            # 用编码后的文本长度近似每条数据的内存占用
+            sizer.observe_bytes(n, len(text))
+            if header:
+                text, header = header + text, ""
+            if first:
+                metrics.EXPORT_TTFB.observe(time.monotonic() - started)
+                tracing.record("first_page", started)
+                first = False
+            metrics.EXPORT_LINES.inc(n, index=index_label)
+            metrics.EXPORT_BYTES.inc(len(text) if text.isascii() else len(text.encode("utf-8")), index=index_label)
+            yield text, n
+            del text
+        status = "empty" if first else "ok"
+    except (GeneratorExit, asyncio.CancelledError):
+        # 消费方提前关闭（例如流式下载的客户端断开）
+        status = "aborted"
+        raise
+    finally:
+        metrics.ACTIVE_EXPORTS.dec()
+        metrics.EXPORTS.inc(index=index_label, status=status)
+        metrics.EXPORT_DURATION.observe(time.monotonic() - started, status=status)
+        await pages.aclose()
+        if own_budget:
+            budget.close()
+
+
+async def _produce(chunks: AsyncIterator[Tuple[str, int]], queue: _PageQueue, budget: ExportBudget):
+    # 文件导出的生产者：编码好的页按文本大小占预算后入队，元素为 (文本, 条数, 占用的预算)
+    try:
+        async for text, n in chunks:
+            cost = await _charge_queued(budget, queue, len(text))
+            await queue.put((text, n, cost))
+            del text
+        await queue.put(_END)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+    finally:
+        await chunks.aclose()
+
+
+async def export_logs(
+    es,
+    index: str,
+    query: str,
+    filters: list,
+    file_path: str,
+    max_size: int = 50000,
+    page_size: Optional[int] = None,
+    slices: int = 1,
+    pagination: str = "auto",
+    compression: Optional[str] = None,
+    progress: Optional[ExportProgress] = None,
+    fields: Optional[List[str]] = None,
+    fmt: str = "txt",
+    fetch: str = "source",
+    partition_seconds: Optional[int] = None,
+    clusters: Optional[List[Cluster]] = None,
+    report: Optional[ClusterReport] = None,
+    line_bytes: Optional[float] = None
+) -> int:
+    """
+    分页查询 ES 并写入文件（PIT + search_after，必要时回退 scroll；slices > 1 时并行）
+
+    compression 为 gzip / zstd 时在写线程里增量压缩；progress 非空时按页更新进度。
+    clusters / report / line_bytes 见 iter_export_chunks。
+
+    生产者任务负责拉取 + 编码，把编码好的页放进有界队列；这里作为消费方逐页提交给写线程。
+    每页从编码完到写完一直占着本导出的内存预算（同时计入全局预算），写完即归还；
+    写盘跟不上时队列很快占满，生产者随之停止拉取，预算被占满后各页流也不再预取。
+    """
+    count = 0
+    budget = ExportBudget()
+    chunks = iter_export_chunks(
+        es, index, query, filters,
+        max_size=max_size,
+        page_size=page_size,
+        slices=slices,
+        pagination=pagination,
+        fields=fields,
+        fmt=fmt,
+        fetch=fetch,
+        partition_seconds=partition_seconds,
+        clusters=clusters,
+        report=report,
+        budget=budget,
+        line_bytes=line_bytes
+    )
+    queue = _PageQueue(EXPORT_WRITE_QUEUE_PAGES)
+    producer = asyncio.ensure_future(_produce(chunks, queue, budget))
+
+    # 写盘在线程池里进行，事件循环只负责拉取 ES 页；一页一次写入
+    writer = AsyncFileWriter(file_path, opener=writer_opener(compression), index_lines=True)
+    try:
+        async with writer:
+            while True:
+                item = await queue.take()
+                if item is _END:
                     break
+                if isinstance(item, Exception):
+                    raise item
+                chunk, n, cost = item
+                del item
+                await writer.write(chunk, on_written=functools.partial(budget.release, cost))
+                # 写线程持有这一页直到写完，这里不再引用
+                del chunk
+                count += n
+                if progress is not None:
+                    progress.pages += 1
+                    progress.lines = count
+                    progress.bytes = writer.bytes_written
+    finally:
+        await _cancel(producer)
+        budget.close()
 
-                resp = await es.scroll(scroll_id=scroll_id, scroll="2m")
-                scroll_id = resp.get("_scroll_id")
-        finally:
-            if scroll_id:
-                await es.clear_scroll(scroll_id=scroll_id)
+    if progress is not None:
+        progress.bytes = writer.bytes_written
 
     return count
@@ -0,0 +1,77 @@
+# coding=utf-8
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 多集群导出时，单个集群取一页（含打开 PIT）的超时（秒）；超时的集群被剔除，其余集群继续
+CLUSTER_TIMEOUT_SECONDS = float(os.getenv("CLUSTER_TIMEOUT_SECONDS", "30"))
+
+
+class Cluster:
+    """
+    多集群导出中的一个目标：名字（用于报告）、客户端、索引、单页超时。
+    """
+
+    def __init__(self, name: str, es, index: str, timeout: Optional[float] = None):
+        self.name = name
+        self.es = es
+        self.index = index
+        self.timeout = timeout or CLUSTER_TIMEOUT_SECONDS
+
+
+class ClusterStatus:
+    def __init__(self, name: str, index: str):
+        self.name = name
+        self.index = index
+        self.status = "pending"  # pending / ok / timeout / failed
+        self.hits = 0
+        self.error: Optional[str] = None
+
+    def fail(self, status: str, error: str):
+        self.status = status
+        self.error = error
+        logger.warning(f"Cluster {self.name} index={self.index} dropped from export ({status}): {error}")
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "index": self.index,
+            "status": self.status,
+            "hits": self.hits,
+            "error": self.error,
+        }
+
+
+class ClusterReport:
+    """
+    各集群的导出结果；部分集群失败时导出照常完成，由调用方把失败情况返回给用户。
+    """
+
+    def __init__(self, targets: List[Tuple[str, str]]):
+        # targets：(集群名, 索引)，与导出时的 Cluster 列表一一对应
+        self.clusters = [ClusterStatus(name, index) for name, index in targets]
+
+    @property
+    def failed(self) -> List[ClusterStatus]:
+        return [c for c in self.clusters if c.status in ("timeout", "failed")]
+
+    @property
+    def all_failed(self) -> bool:
+        return bool(self.clusters) and len(self.failed) == len(self.clusters)
+
+    def header(self) -> str:
+        # X-Cluster-Failures 头：name=状态 以逗号分隔（错误详情见任务状态或日志）
+        return ", ".join(f"{c.name}={c.status}" for c in self.failed)
+
+    def to_dict(self) -> List[Dict]:
+        return [c.to_dict() for c in self.clusters]
+
+
+class ClustersFailed(Exception):
+    def __init__(self, report: ClusterReport):
+        super().__init__(
+            "All clusters failed: " + "; ".join(f"{c.name}: {c.error}" for c in report.failed)
+        )
+        self.report = report
@@ -0,0 +1,134 @@
+# coding=utf-8
+import csv
+import io
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+# 导出格式 -> 文件后缀 / 流式响应的 media type
+EXTENSIONS = {"txt": ".txt", "ndjson": ".ndjson", "csv": ".csv", "columnar": ".columnar.ndjson"}
+MEDIA_TYPES = {
+    "txt": "text/plain; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "columnar": "application/x-ndjson",
+}
+DEFAULT_FIELDS = ["message"]
+
+_json = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str)
+_MISSING = object()
+
+
+def get_field(source: Dict, path: str) -> Any:
+    """
+    取 _source 中的字段：先按完整键名取（"@timestamp"、扁平写入的 "trace.id"），
+    取不到再按 . 逐层取嵌套对象。
+    """
+    value = source.get(path, _MISSING)
+    if value is not _MISSING:
+        return value
+    value = source
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def source_value(hit: Dict, field: str) -> Any:
+    return get_field(hit["_source"], field)
+
+
+def fields_value(hit: Dict, field: str) -> Any:
+    # fields / docvalue_fields 的值总是数组：单值展开，多值保留数组
+    values = hit.get("fields", {}).get(field)
+    if values is None:
+        return None
+    return values[0] if len(values) == 1 else values
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return _json.encode(value)
+
+
+class Encoder:
+    """
+    按页编码：encode 一次处理一整页 hits，返回整段文本；header 在第一页之前写出。
+    """
+
+    def __init__(self, fields: List[str], value: Callable[[Dict, str], Any] = source_value):
+        self.fields = fields
+        self.value = value
+
+    def header(self) -> str:
+        return ""
+
+    def rows(self, hits: List[Dict]) -> List[List[Any]]:
+        fields, value = self.fields, self.value
+        return [[value(h, f) for f in fields] for h in hits]
+
+    def encode(self, hits: List[Dict]) -> str:
+        raise NotImplementedError
+
+
+class TxtEncoder(Encoder):
+    # 单字段时每行就是字段值（默认 message，与原有导出一致）；多字段用 \t 分隔
+    def encode(self, hits: List[Dict]) -> str:
+        if len(self.fields) == 1:
+            field, value = self.fields[0], self.value
+            return "".join(_text(value(h, field)) + "\n" for h in hits)
+        return "".join("\t".join(map(_text, row)) + "\n" for row in self.rows(hits))
+
+
+class NdjsonEncoder(Encoder):
+    def encode(self, hits: List[Dict]) -> str:
+        fields = self.fields
+        return "".join(
+            _json.encode(dict(zip(fields, row))) + "\n"
+            for row in self.rows(hits)
+        )
+
+
+class CsvEncoder(Encoder):
+    def _write(self, rows: List[List[Any]]) -> str:
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerows(rows)
+        return buf.getvalue()
+
+    def header(self) -> str:
+        return self._write([self.fields])
+
+    def encode(self, hits: List[Dict]) -> str:
+        return self._write([[_text(v) for v in row] for row in self.rows(hits)])
+
+
+class ColumnarEncoder(Encoder):
+    """
+    列式：每页一行 JSON，{"rows": n, "columns": {字段: [值, ...]}}，
+    可以按页直接读成 DataFrame / Arrow 表（pd.DataFrame(obj["columns"])）。
+    """
+
+    def encode(self, hits: List[Dict]) -> str:
+        value = self.value
+        columns = {
+            f: [value(h, f) for h in hits]
+            for f in self.fields
+        }
+        return _json.encode({"rows": len(hits), "columns": columns}) + "\n"
+
+
+_ENCODERS = {
+    "txt": TxtEncoder,
+    "ndjson": NdjsonEncoder,
+    "csv": CsvEncoder,
+    "columnar": ColumnarEncoder,
+}
+
+
+def make_encoder(fmt: str = "txt", fields: Optional[List[str]] = None, fetch: str = "source") -> Encoder:
+    value = source_value if fetch == "source" else fields_value
+    return _ENCODERS[fmt](list(fields or DEFAULT_FIELDS), value)
@@ -0,0 +1,112 @@
+# coding=utf-8
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core import tracing
+from app.service.exporter import ExportProgress
+from app.service.fanout import ClusterReport
+from app.service.scheduler import Ticket
+
+logger = logging.getLogger(__name__)
+
+# 结束后的任务状态保留多久（秒）
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "600"))
+
+# 任务实际执行的导出：接收任务对象（更新进度/登记排队凭证），返回 (文件名, 导出条数)
+JobRunner = Callable[["Job"], Awaitable[Tuple[str, int]]]
+
+
+class Job:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"  # queued / running / done / failed
+        self.progress = ExportProgress()
+        self.trace = tracing.Trace("export job")
+        # 提交时的导出估算（ExportPlan.to_dict()）
+        self.estimate: Optional[Dict] = None
+        # 多集群导出时各集群的进度与失败情况
+        self.clusters: Optional[ClusterReport] = None
+        self.file_name: Optional[str] = None
+        self.count = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        # 导出调度器的排队凭证；未获得执行权前任务处于 queued
+        self.ticket: Optional[Ticket] = None
+
+    def set_ticket(self, ticket: Ticket):
+        self.ticket = ticket
+
+    def to_dict(self) -> Dict:
+        status = self.status
+        queue_position = 0
+        if status == "running" and self.ticket is not None and not self.ticket.granted:
+            status = "queued"
+            queue_position = self.ticket.position
+        return {
+            "job_id": self.id,
+            "status": status,
+            "queue_position": queue_position,
+            "progress": self.progress.to_dict(),
+            "file": self.file_name,
+            "count": self.count,
+            "estimate": self.estimate,
+            "clusters": self.clusters.to_dict() if self.clusters is not None else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    后台导出任务：提交后立即返回 job id；并发由导出调度器（scheduler）统一控制。
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def submit(self, runner: JobRunner) -> Job:
+        self._prune()
+        job = Job()
+        self._jobs[job.id] = job
+        self._tasks[job.id] = asyncio.ensure_future(self._run(job, runner))
+        return job
+
+    async def _run(self, job: Job, runner: JobRunner):
+        try:
+            job.status = "running"
+            with tracing.activate(job.trace):
+                job.file_name, job.count = await runner(job)
+            job.status = "done"
+        except Exception as e:
+            logger.exception(f"Export job {job.id} failed")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.trace.finish()
+            job.finished_at = time.time()
+            self._tasks.pop(job.id, None)
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > JOB_RETENTION_SECONDS:
+                del self._jobs[job_id]
+
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+job_manager = JobManager()
@@ -0,0 +1,120 @@
+# coding=utf-8
+import asyncio
+import logging
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from elasticsearch import ApiError
+
+from app.core import tracing
+
+logger = logging.getLogger(__name__)
+
+# 同时进行的分区子导出数
+EXPORT_PARTITION_CONCURRENCY = int(os.getenv("EXPORT_PARTITION_CONCURRENCY", "4"))
+# 分区数上限；时间窗太宽时自动放大每个分区的时长
+EXPORT_PARTITION_MAX_BUCKETS = int(os.getenv("EXPORT_PARTITION_MAX_BUCKETS", "64"))
+# 解析分区索引时并发的 field_caps 请求数
+_RESOLVE_CONCURRENCY = 8
+
+# (该分区要查的索引表达式, 该分区的过滤条件)
+Partition = Tuple[str, list]
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def find_time_range(filters: list) -> Tuple[int, Dict]:
+    for i, f in enumerate(filters):
+        ts_range = f.get("range", {}).get("@timestamp")
+        if ts_range is not None:
+            return i, ts_range
+    raise ValueError("partitioned export needs a @timestamp range filter")
+
+
+def split_window(start: datetime, end: datetime, bucket_seconds: int) -> List[Tuple[datetime, datetime]]:
+    """
+    把 [start, end] 切成按 bucket_seconds 对齐（相对 UTC 纪元，按天切时即 UTC 零点）的时间桶。
+    桶数超过 EXPORT_PARTITION_MAX_BUCKETS 时按比例放大桶长。
+    """
+    span = max(0.0, (end - start).total_seconds())
+    bucket_seconds = max(bucket_seconds, math.ceil(span / EXPORT_PARTITION_MAX_BUCKETS))
+    step = timedelta(seconds=bucket_seconds)
+
+    aligned = _EPOCH + step * ((start - _EPOCH) // step)
+    buckets = []
+    lo = start
+    edge = aligned + step
+    while edge <= end:
+        buckets.append((lo, edge))
+        lo = edge
+        edge += step
+    buckets.append((lo, end))
+    return buckets
+
+
+async def _resolve_indices(es, index: str, ts_range: Dict, sem: asyncio.Semaphore) -> Optional[List[str]]:
+    """
+    用 field_caps + index_filter 找出 @timestamp 可能落在 ts_range 内的具体索引（按分片元数据判断，不扫文档）。
+    集群不支持时返回 None，表示不做裁剪、直接查原索引表达式。
+    """
+    async with sem:
+        try:
+            resp = await es.field_caps(
+                index=index,
+                fields="@timestamp",
+                index_filter={"range": {"@timestamp": ts_range}},
+                ignore_unavailable=True,
+                allow_no_indices=True,
+            )
+        except ApiError as e:
+            logger.warning(f"field_caps index_filter not available on index={index}, no index pruning: {e}")
+            return None
+    indices = resp.get("indices", [])
+    return [indices] if isinstance(indices, str) else sorted(indices)
+
+
+async def plan_partitions(es, index: str, filters: list, bucket_seconds: int) -> List[Partition]:
+    """
+    按时间桶拆分导出：每个桶只查与其时间范围有交集的索引，没有索引的桶直接跳过。
+
+    桶之间时间不重叠，按时间顺序拼接各桶结果即得到全局 @timestamp 升序。
+    """
+    pos, ts_range = find_time_range(filters)
+    if "gte" not in ts_range:
+        # 只有结束时间时无从切分，整体作为一个分区
+        return [(index, filters)]
+    start = datetime.fromisoformat(ts_range["gte"])
+    end = datetime.fromisoformat(ts_range["lte"]) if "lte" in ts_range else _utcnow()
+    buckets = split_window(start, end, bucket_seconds)
+
+    ranges = []
+    for i, (lo, hi) in enumerate(buckets):
+        if i < len(buckets) - 1:
+            ranges.append({"gte": lo.isoformat(), "lt": hi.isoformat()})
+        else:
+            # 最后一个桶沿用原来的上界；没有上界时保持开放，导出期间新写入的数据也能取到
+            last = {"gte": lo.isoformat()}
+            if "lte" in ts_range:
+                last["lte"] = ts_range["lte"]
+            ranges.append(last)
+
+    sem = asyncio.Semaphore(_RESOLVE_CONCURRENCY)
+    with tracing.span("partition"):
+        resolved = await asyncio.gather(*(_resolve_indices(es, index, r, sem) for r in ranges))
+
+    partitions: List[Partition] = []
+    for r, indices in zip(ranges, resolved):
+        if indices is not None and not indices:
+            continue
+        bucket_filters = list(filters)
+        bucket_filters[pos] = {"range": {"@timestamp": r}}
+        partitions.append((",".join(indices) if indices else index, bucket_filters))
+
+    logger.info(f"Partitioned export index={index}: {len(partitions)}/{len(buckets)} buckets with data")
+    return partitions
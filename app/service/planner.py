@@ -0,0 +1,112 @@
+# coding=utf-8
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from app.core import tracing
+from app.service.exporter import FILTER_PATH, build_dsl
+from app.service.formats import make_encoder
+
+logger = logging.getLogger(__name__)
+
+# 估算单条大小时抽样的文档数
+PLAN_SAMPLE_SIZE = int(os.getenv("PLAN_SAMPLE_SIZE", "50"))
+# 预计导出大小（未压缩字节）超过该值直接拒绝；0 表示不限
+EXPORT_MAX_BYTES = int(os.getenv("EXPORT_MAX_BYTES", str(4 * 1024 ** 3)))
+# 超过该值时仍然导出，但在响应里给出提示；0 表示不提示
+EXPORT_WARN_BYTES = int(os.getenv("EXPORT_WARN_BYTES", str(512 * 1024 ** 2)))
+
+
+class ExportTooLarge(Exception):
+    def __init__(self, plan: "ExportPlan"):
+        super().__init__(
+            f"Estimated export size {plan.estimated_bytes} bytes exceeds limit {EXPORT_MAX_BYTES} bytes; "
+            f"narrow the time range or lower size"
+        )
+        self.plan = plan
+
+
+class ExportPlan:
+    """
+    导出前的估算：命中数、实际会导出的条数、抽样得到的单条平均大小和预计总大小。
+    """
+
+    def __init__(self, hits: int, lines: int, avg_line_bytes: float, sampled: int):
+        self.hits = hits
+        self.lines = lines
+        self.avg_line_bytes = avg_line_bytes
+        self.sampled = sampled
+        self.estimated_bytes = int(lines * avg_line_bytes)
+        # 多集群导出时各集群的估算情况（ClusterReport.to_dict()）
+        self.clusters: Optional[List[Dict]] = None
+
+    @property
+    def over_limit(self) -> bool:
+        return EXPORT_MAX_BYTES > 0 and self.estimated_bytes > EXPORT_MAX_BYTES
+
+    @property
+    def warning(self) -> Optional[str]:
+        if EXPORT_WARN_BYTES > 0 and self.estimated_bytes > EXPORT_WARN_BYTES:
+            return f"Large export: about {self.estimated_bytes / 1024 ** 2:.1f} MiB ({self.lines} lines)"
+        return None
+
+    def to_dict(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "lines": self.lines,
+            "avg_line_bytes": round(self.avg_line_bytes, 1),
+            "sampled": self.sampled,
+            # 按导出格式编码后的未压缩大小
+            "estimated_bytes": self.estimated_bytes,
+            "max_bytes": EXPORT_MAX_BYTES or None,
+            "over_limit": self.over_limit,
+            "warning": self.warning,
+            "clusters": self.clusters,
+        }
+
+
+async def plan_export(
+    es,
+    index: str,
+    query: str,
+    filters: list,
+    size: int,
+    fields: Optional[List[str]] = None,
+    fetch: str = "source",
+    fmt: str = "txt"
+) -> ExportPlan:
+    """
+    并发执行 _count 和一次小规模抽样 search：
+    抽样结果按真实导出格式编码，得到每行平均字节数，乘以导出条数即为预计大小。
+    """
+    dsl = build_dsl(query, filters, fields, fetch)
+    sample_body = dict(dsl, size=PLAN_SAMPLE_SIZE, track_total_hits=False)
+    # 抽样不需要全局排序：按 _doc 顺序取最便宜
+    sample_body["sort"] = ["_doc"]
+
+    with tracing.span("plan"):
+        count_resp, sample_resp = await asyncio.gather(
+            es.count(index=index, body={"query": dsl["query"]}),
+            es.search(index=index, body=sample_body, filter_path=FILTER_PATH),
+        )
+
+    hits = count_resp["count"]
+    sample = sample_resp.get("hits", {}).get("hits", [])
+    avg = 0.0
+    if sample:
+        text = make_encoder(fmt, fields, fetch).encode(sample)
+        avg = len(text.encode("utf-8")) / len(sample)
+    plan = ExportPlan(hits, min(hits, size), avg, len(sample))
+    logger.info(f"Export plan index={index}: {plan.to_dict()}")
+    return plan
+
+
+def combine_plans(plans: List[ExportPlan], size: int) -> ExportPlan:
+    """
+    多集群导出的总估算：命中数相加，平均行大小按各自抽样数加权。
+    """
+    hits = sum(p.hits for p in plans)
+    sampled = sum(p.sampled for p in plans)
+    avg = sum(p.avg_line_bytes * p.sampled for p in plans) / sampled if sampled else 0.0
+    return ExportPlan(hits, min(hits, size), avg, sampled)
@@ -0,0 +1,222 @@
+# coding=utf-8
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+# 全局同时运行的导出数
+EXPORT_MAX_CONCURRENCY = int(os.getenv("EXPORT_MAX_CONCURRENCY", "8"))
+# 单个 ES 集群同时运行的导出数
+EXPORT_MAX_PER_HOST = int(os.getenv("EXPORT_MAX_PER_HOST", "4"))
+# 单个 token 同时运行的导出数（0 表示不限）；只有一个 token 时等于限制所有人加起来的并发
+EXPORT_MAX_PER_TOKEN = int(os.getenv("EXPORT_MAX_PER_TOKEN", "4"))
+# 排队上限；超过后直接 429
+EXPORT_MAX_QUEUE = int(os.getenv("EXPORT_MAX_QUEUE", "32"))
+
+
+def _decrement(counts: Dict[str, int], key: str):
+    n = counts.get(key, 1) - 1
+    if n > 0:
+        counts[key] = n
+    else:
+        counts.pop(key, None)
+
+
+class SchedulerFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Export queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    一次导出的准入凭证：排队时可查询位置，获得执行权后必须 release。
+
+    hosts 是本次导出要访问的各个 ES 集群（跨集群导出有多个），每个集群都要有空余名额才授予。
+    """
+
+    def __init__(self, scheduler: "ExportScheduler", token: str, hosts: Union[str, Sequence[str]]):
+        self._scheduler = scheduler
+        self.token = token
+        self.hosts = (hosts,) if isinstance(hosts, str) else tuple(dict.fromkeys(hosts))
+        self.granted = False
+        self.released = False
+        self.granted_at: Optional[float] = None
+        self._future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def position(self) -> int:
+        """排队位置（1 起）；已获得执行权时为 0。"""
+        if self.granted:
+            return 0
+        return self._scheduler.position_of(self)
+
+    async def wait(self):
+        try:
+            await self._future
+        except asyncio.CancelledError:
+            # 排队中被取消：出队；刚好已获得执行权则归还
+            self._scheduler._cancel(self)
+            raise
+
+    def release(self):
+        if self.granted and not self.released:
+            self.released = True
+            self._scheduler._release(self)
+
+
+class ExportScheduler:
+    """
+    导出准入控制：
+
+    - 全局并发上限 + 每个 ES 集群并发上限 + 每个 token 并发上限
+    - 按 token 公平排队：各 token 的队列轮转出队，单个用户的大批请求不会饿死其他人
+    - 队列满时抛 SchedulerFull，由接口转成 429 + Retry-After
+
+    公平排队和 token 上限以 Bearer token 区分使用方：所有人共用 AUTH_TOKEN 时只有一个队列，
+    实际就是 FIFO。要隔离各使用方，给每个人配置自己的 token（AUTH_TOKENS）。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = EXPORT_MAX_CONCURRENCY,
+        max_per_host: int = EXPORT_MAX_PER_HOST,
+        max_queue: int = EXPORT_MAX_QUEUE,
+        max_per_token: int = EXPORT_MAX_PER_TOKEN
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.max_queue = max_queue
+        self.max_per_token = max_per_token
+        self.running = 0
+        self._running_by_host: Dict[str, int] = {}
+        self._running_by_token: Dict[str, int] = {}
+        # token -> 该 token 的等待队列；OrderedDict 的顺序即轮转顺序
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        # 导出耗时的指数滑动平均，用于估算 Retry-After
+        self._avg_seconds = 10.0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _has_capacity(self, ticket: Ticket) -> bool:
+        return (
+            self.running < self.max_concurrency
+            and all(self._running_by_host.get(h, 0) < self.max_per_host for h in ticket.hosts)
+            and (self.max_per_token <= 0 or self._running_by_token.get(ticket.token, 0) < self.max_per_token)
+        )
+
+    def retry_after(self) -> int:
+        waves = (self.queued + 1) / max(1, self.max_concurrency)
+        return max(1, min(300, int(math.ceil(self._avg_seconds * waves))))
+
+    def check_admission(self):
+        if self.queued >= self.max_queue:
+            raise SchedulerFull(self.retry_after())
+
+    def _dispatch_order(self) -> Dict[int, int]:
+        # 模拟轮转出队顺序，得到每个等待者的排队位置
+        order = {}
+        queues = [list(q) for q in self._queues.values()]
+        pos = 0
+        depth = 0
+        while any(depth < len(q) for q in queues):
+            for q in queues:
+                if depth < len(q):
+                    pos += 1
+                    order[id(q[depth])] = pos
+            depth += 1
+        return order
+
+    def position_of(self, ticket: Ticket) -> int:
+        return self._dispatch_order().get(id(ticket), 0)
+
+    def _grant(self, ticket: Ticket):
+        ticket.granted = True
+        ticket.granted_at = time.monotonic()
+        self.running += 1
+        for h in ticket.hosts:
+            self._running_by_host[h] = self._running_by_host.get(h, 0) + 1
+        self._running_by_token[ticket.token] = self._running_by_token.get(ticket.token, 0) + 1
+        ticket._future.set_result(None)
+
+    def _dispatch(self):
+        progressed = True
+        while progressed and self._queues and self.running < self.max_concurrency:
+            progressed = False
+            for token in list(self._queues.keys()):
+                q = self._queues[token]
+                # 同一 token 内保持 FIFO，但跳过所访问集群已满的请求；token 已到上限时整队跳过
+                ticket = next((t for t in q if self._has_capacity(t)), None)
+                if ticket is None:
+                    continue
+                q.remove(ticket)
+                if q:
+                    # 本轮已服务过：移到轮转末尾
+                    self._queues.move_to_end(token)
+                else:
+                    del self._queues[token]
+                # 等待方已被取消但还没来得及出队：丢弃即可
+                if not ticket._future.cancelled():
+                    self._grant(ticket)
+                progressed = True
+                break
+
+    def acquire(self, token: str, hosts: Union[str, Sequence[str]]) -> Ticket:
+        """
+        申请一个执行名额：能立即执行则直接授予，否则排队；队列满时抛 SchedulerFull。
+        """
+        ticket = Ticket(self, token, hosts)
+        self._queues.setdefault(token, deque()).append(ticket)
+        self._dispatch()
+        if not ticket.granted and self.queued > self.max_queue:
+            self._cancel(ticket)
+            raise SchedulerFull(self.retry_after())
+        return ticket
+
+    def _cancel(self, ticket: Ticket):
+        q = self._queues.get(ticket.token)
+        if q is not None and ticket in q:
+            q.remove(ticket)
+            if not q:
+                del self._queues[ticket.token]
+        elif ticket.granted:
+            ticket.release()
+
+    def _release(self, ticket: Ticket):
+        self.running -= 1
+        for h in ticket.hosts:
+            _decrement(self._running_by_host, h)
+        _decrement(self._running_by_token, ticket.token)
+        if ticket.granted_at is not None:
+            elapsed = time.monotonic() - ticket.granted_at
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        token: str,
+        hosts: Union[str, Sequence[str]],
+        on_ticket: Optional[Callable[[Ticket], None]] = None
+    ) -> AsyncIterator[Ticket]:
+        ticket = self.acquire(token, hosts)
+        if on_ticket is not None:
+            on_ticket(ticket)
+        try:
+            if not ticket.granted:
+                logger.info(f"Export queued: hosts={','.join(ticket.hosts)} position={ticket.position}")
+            await ticket.wait()
+            yield ticket
+        finally:
+            ticket.release()
+
+
+export_scheduler = ExportScheduler()
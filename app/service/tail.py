@@ -0,0 +1,259 @@
+# coding=utf-8
+import asyncio
+import logging
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from app.core.es import release_es
+from app.service.exporter import FILTER_PATH, build_dsl
+from app.service.formats import make_encoder
+
+logger = logging.getLogger(__name__)
+
+# 每隔多少秒查一次新日志（同一个查询不论多少人在看都只有一个轮询）
+TAIL_POLL_SECONDS = float(os.getenv("TAIL_POLL_SECONDS", "2"))
+# 每次查询最多取多少条；取满时立即接着查，直到追上
+TAIL_PAGE_SIZE = int(os.getenv("TAIL_PAGE_SIZE", "500"))
+# 单次轮询连续追赶的页数上限，超出的留到下一轮
+TAIL_MAX_CATCHUP_PAGES = int(os.getenv("TAIL_MAX_CATCHUP_PAGES", "10"))
+# 开始 tail（以及后来者加入）时先推送的最近日志条数，相当于 tail -n
+TAIL_BACKLOG_LINES = int(os.getenv("TAIL_BACKLOG_LINES", "100"))
+# 每个观看者最多积压的批次数；消费太慢时丢弃并告知丢了多少条
+TAIL_QUEUE_MAX = int(os.getenv("TAIL_QUEUE_MAX", "100"))
+# 起始时只在最近这么多小时内找最近的日志（也让按天滚动的旧索引在 can_match 阶段就被跳过）
+TAIL_LOOKBACK_HOURS = int(os.getenv("TAIL_LOOKBACK_HOURS", "24"))
+# 同时存在的轮询数上限（不同查询）
+TAIL_MAX_POLLERS = int(os.getenv("TAIL_MAX_POLLERS", "32"))
+# 查询连续失败时的重试间隔上限（秒）；间隔从 TAIL_POLL_SECONDS 起按次翻倍
+TAIL_MAX_BACKOFF_SECONDS = float(os.getenv("TAIL_MAX_BACKOFF_SECONDS", "60"))
+
+# ES 默认 index.max_result_window
+_MAX_RESULT_WINDOW = 10000
+
+# 推给观看者的事件：("hits", [每条日志编码后的文本...]) / ("dropped", 条数) / ("error", 说明)
+# 一条日志的文本里可能有换行（多行 message、多字段 txt），不能再按行拆
+TailEvent = Tuple[str, object]
+
+
+class TooManyTails(Exception):
+    pass
+
+
+class _Subscriber:
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self):
+        self.queue: "asyncio.Queue[TailEvent]" = asyncio.Queue(maxsize=TAIL_QUEUE_MAX)
+        self.dropped = 0
+
+    def put(self, event: TailEvent):
+        if self.dropped and not self.queue.full():
+            # 先告诉观看者中间缺了多少条，再继续推送
+            self.queue.put_nowait(("dropped", self.dropped))
+            self.dropped = 0
+        if self.queue.full():
+            if event[0] == "hits":
+                self.dropped += len(event[1])
+            return
+        self.queue.put_nowait(event)
+
+
+class TailPoller:
+    """
+    一个查询对应一个轮询：按 @timestamp 升序、用 search_after 从上次看到的位置往后取。
+
+    @timestamp 不唯一，search_after 用 “上次时间戳 - 1ms”，再按 _id 去掉上次时间戳上已经推送过的文档；
+    这样同一毫秒内后写入的日志也不会漏掉（_id 不参与排序，避免对 _id 开启 fielddata）。
+
+    es 由调用方 acquire_es 取得，轮询停止时由这里 release。
+    """
+
+    def __init__(
+        self,
+        es,
+        index: str,
+        query: str,
+        filters: list,
+        fields: Optional[List[str]] = None,
+        fetch: str = "source",
+        fmt: str = "txt"
+    ):
+        self.es = es
+        self.index = index
+        self.query = query
+        self.filters = filters
+        self.fields = fields
+        self.fetch = fetch
+        self.encoder = make_encoder(fmt, fields, fetch)
+        self.subscribers: Set[_Subscriber] = set()
+        self.backlog: Deque[str] = deque(maxlen=TAIL_BACKLOG_LINES)
+        # 已推送的最大时间戳（epoch 毫秒）及该时间戳上已推送的 _id
+        self.last_ts: Optional[int] = None
+        self.last_ids: Set[str] = set()
+        self.polls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _publish(self, event: TailEvent):
+        for sub in self.subscribers:
+            sub.put(event)
+
+    def _advance(self, hits: List[Dict]) -> List[Dict]:
+        """
+        去掉已推送过的文档，并把位置推进到本批最后一条。
+        """
+        fresh = [
+            h for h in hits
+            if not (h["sort"][0] == self.last_ts and h["_id"] in self.last_ids)
+        ]
+        if fresh:
+            ts = fresh[-1]["sort"][0]
+            if ts != self.last_ts:
+                self.last_ts = ts
+                self.last_ids = set()
+            self.last_ids.update(h["_id"] for h in fresh if h["sort"][0] == ts)
+        return fresh
+
+    async def _search(self, body: Dict) -> List[Dict]:
+        resp = await self.es.search(index=self.index, body=body, filter_path=FILTER_PATH + ["hits.hits._id"])
+        self.polls += 1
+        return resp.get("hits", {}).get("hits", [])
+
+    def _body(self, ts_range: Dict, size: int) -> Dict:
+        # 时间下界同时写进 range 过滤：search_after 只决定从哪里开始返回，range 才能让旧分片直接跳过
+        filters = self.filters + [{"range": {"@timestamp": ts_range}}]
+        return dict(build_dsl(self.query, filters, self.fields, self.fetch), size=size, track_total_hits=False)
+
+    async def _seed(self):
+        # 先倒序取最近 TAIL_BACKLOG_LINES 条作为起点，之后只推新的
+        body = self._body({"gte": f"now-{TAIL_LOOKBACK_HOURS}h"}, max(1, TAIL_BACKLOG_LINES))
+        body["sort"] = [{"@timestamp": {"order": "desc"}}]
+        hits = await self._search(body)
+        hits.reverse()
+        if TAIL_BACKLOG_LINES > 0:
+            self._emit(hits)
+        self._advance(hits)
+
+    def _emit(self, hits: List[Dict]):
+        if not hits:
+            return
+        # 逐条编码：每条结尾恰好一个 \n，去掉它，内部的换行保留
+        entries = [self.encoder.encode([h])[:-1] for h in hits]
+        self.backlog.extend(entries)
+        self._publish(("hits", entries))
+
+    async def _drain_millisecond(self):
+        """
+        同一毫秒内的文档比一页还多时，search_after 会一直返回同一页：
+        单独把这一毫秒剩下的文档取完，然后越过这一毫秒（之后才写入、时间戳恰好是这一毫秒的文档不再补推）。
+        """
+        ts = self.last_ts
+        body = self._body({"gte": ts, "lte": ts, "format": "epoch_millis"}, _MAX_RESULT_WINDOW)
+        fresh = [h for h in await self._search(body) if h["_id"] not in self.last_ids]
+        if len(fresh) + len(self.last_ids) >= _MAX_RESULT_WINDOW:
+            logger.warning(f"Tail on index={self.index}: more than {_MAX_RESULT_WINDOW} docs at ts={ts}, some skipped")
+        self._emit(fresh)
+        self.last_ts = ts + 1
+        self.last_ids = set()
+
+    async def _poll(self):
+        for _ in range(TAIL_MAX_CATCHUP_PAGES):
+            body = self._body({"gte": self.last_ts, "format": "epoch_millis"}, TAIL_PAGE_SIZE)
+            body["search_after"] = [self.last_ts - 1]
+            hits = await self._search(body)
+            fresh = self._advance(hits)
+            self._emit(fresh)
+            if len(hits) < TAIL_PAGE_SIZE:
+                return
+            if not fresh:
+                await self._drain_millisecond()
+
+    async def _run(self):
+        failures = 0
+        try:
+            while True:
+                try:
+                    if self.last_ts is None:
+                        await self._seed()
+                    else:
+                        await self._poll()
+                    failures = 0
+                except Exception as e:
+                    # 任何失败（ES 报错、连接断开、超时……）都不能让共用的轮询退出，否则观看者会一直挂着：
+                    # 告诉观看者，退避后重试
+                    failures += 1
+                    logger.warning(f"Tail poll failed on index={self.index} ({failures} in a row): {e!r}")
+                    self._publish(("error", str(e) or type(e).__name__))
+                delay = TAIL_POLL_SECONDS * 2 ** min(failures, 16)
+                await asyncio.sleep(min(delay, max(TAIL_POLL_SECONDS, TAIL_MAX_BACKOFF_SECONDS)))
+        finally:
+            await release_es(self.es)
+
+
+class TailHub:
+    """
+    按查询 key 合并 tail：第一个观看者到来时启动轮询，最后一个离开时停止。
+    """
+
+    def __init__(self, max_pollers: int = TAIL_MAX_POLLERS):
+        self.max_pollers = max_pollers
+        self._pollers: Dict[str, TailPoller] = {}
+
+    @property
+    def pollers(self) -> int:
+        return len(self._pollers)
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(p.subscribers) for p in self._pollers.values())
+
+    def check_admission(self, key: str):
+        # 在开始响应前调用：加入已有的 tail 总是允许的，新查询受 max_pollers 限制
+        if key not in self._pollers and len(self._pollers) >= self.max_pollers:
+            raise TooManyTails(f"Too many live tails ({self.max_pollers}), try again later")
+
+    @asynccontextmanager
+    async def subscribe(self, key: str, factory: Callable[[], TailPoller]) -> AsyncIterator["asyncio.Queue[TailEvent]"]:
+        """
+        factory 只在该 key 还没有轮询时调用。
+        """
+        poller = self._pollers.get(key)
+        if poller is None:
+            self.check_admission(key)
+            poller = self._pollers[key] = factory()
+            poller.start()
+            logger.info(f"Tail started on index={poller.index}")
+
+        sub = _Subscriber()
+        if poller.backlog:
+            sub.put(("hits", list(poller.backlog)))
+        poller.subscribers.add(sub)
+        try:
+            yield sub.queue
+        finally:
+            poller.subscribers.discard(sub)
+            if not poller.subscribers and self._pollers.get(key) is poller:
+                del self._pollers[key]
+                await poller.stop()
+                logger.info(f"Tail stopped on index={poller.index} after {poller.polls} polls")
+
+    async def shutdown(self):
+        pollers = list(self._pollers.values())
+        self._pollers.clear()
+        for poller in pollers:
+            await poller.stop()
+
+
+tail_hub = TailHub()
@@ -0,0 +1,78 @@
+# coding=utf-8
+import gzip
+import io
+import zlib
+from typing import BinaryIO, Callable, Optional, TextIO
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖：未安装时只提供 gzip
+    zstandard = None
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# 压缩方式 -> 导出文件后缀 / 下载时的 media type
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+MEDIA_TYPES = {".gz": "application/gzip", ".zst": "application/zstd"}
+
+
+def is_available(compression: Optional[str]) -> bool:
+    if compression == "zstd":
+        return zstandard is not None
+    return compression in (None, "gzip")
+
+
+def file_suffix(compression: Optional[str]) -> str:
+    return SUFFIXES.get(compression, "")
+
+
+def media_type_for(path: str) -> Optional[str]:
+    for suffix, media_type in MEDIA_TYPES.items():
+        if path.endswith(suffix):
+            return media_type
+    return None
+
+
+def writer_opener(compression: Optional[str]) -> Callable[[str], BinaryIO]:
+    """
+    返回 AsyncFileWriter 用的 opener：写入的是未压缩字节，压缩在写线程里增量完成。
+    """
+    if compression == "gzip":
+        return lambda path: gzip.GzipFile(path, "wb", compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        return lambda path: zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, "wb"))
+    return lambda path: open(path, "wb")
+
+
+def open_text(path: str, newline: Optional[str] = None) -> TextIO:
+    """
+    按后缀打开导出文件用于读取（预览等），压缩文件透明解压。
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline=newline)
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8", errors="replace", newline=newline)
+    return open(path, "r", encoding="utf-8", errors="replace", newline=newline)
+
+
+class StreamCompressor:
+    """
+    流式响应用的增量压缩器（Content-Encoding: gzip / zstd）。
+    """
+
+    def __init__(self, compression: str):
+        if compression == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            # wbits=31：输出带 gzip 头/尾的格式
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
@@ -0,0 +1,259 @@
+# coding=utf-8
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from app.storage import compression
+from app.storage.lineindex import LineIndex
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_SUFFIX = ".tri"
+# 小文件直接扫描就够快，超过这个大小才建 trigram 索引
+GREP_INDEX_MIN_BYTES = int(os.getenv("GREP_INDEX_MIN_BYTES", str(8 * 1024 ** 2)))
+# 每条命中返回的行内容最多多少字符（以命中位置为中心截取）
+GREP_SNIPPET_CHARS = int(os.getenv("GREP_SNIPPET_CHARS", "300"))
+
+# trigram 索引在后台线程里建（纯 Python，大文件要数秒到数十秒），同一时刻只建一个，少占 GIL
+_BUILD_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="logscope-trigram")
+# 正在建或排队等着建索引的文件
+_building: Set[str] = set()
+_building_guard = threading.Lock()
+
+
+def trigram_path(path: str) -> str:
+    return path + TRIGRAM_SUFFIX
+
+
+def _snippet(line: bytes, start: int, end: int) -> str:
+    if len(line) > GREP_SNIPPET_CHARS:
+        half = max(0, (GREP_SNIPPET_CHARS - (end - start)) // 2)
+        lo = max(0, start - half)
+        line = line[lo: lo + GREP_SNIPPET_CHARS]
+    return line.decode("utf-8", errors="replace").rstrip("\r")
+
+
+def _trigrams(data: bytes) -> set:
+    return {data[i: i + 3] for i in range(len(data) - 2)}
+
+
+class TrigramIndex:
+    """
+    块级 trigram 索引：按行索引的分块（每 step 行一块）记录每个 trigram 出现在哪些块里。
+
+    - 只对未压缩、带行索引（.idx）的文件建立，块的字节范围直接取自行索引
+    - 按小写字节建索引，大小写敏感/不敏感的子串查询都能用它排除不含该串的块
+    - 块集合用 int 位图表示，保存到 <path>.tri
+    """
+
+    def __init__(self, size: int, blocks: int, postings: Dict[bytes, int]):
+        self.size = size
+        self.blocks = blocks
+        self.postings = postings
+
+    @classmethod
+    def build(cls, path: str, idx: LineIndex) -> "TrigramIndex":
+        postings: Dict[bytes, int] = {}
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bounds = idx.offsets + [len(mm)]
+            for k in range(len(idx.offsets)):
+                bit = 1 << k
+                for gram in _trigrams(mm[bounds[k]: bounds[k + 1]].lower()):
+                    postings[gram] = postings.get(gram, 0) | bit
+            size = len(mm)
+        return cls(size, len(idx.offsets), postings)
+
+    def save(self, path: str):
+        data = {
+            "size": self.size,
+            "blocks": self.blocks,
+            # latin-1 保证任意字节都能无损转成 JSON 字符串
+            "postings": {k.decode("latin-1"): v for k, v in self.postings.items()},
+        }
+        tmp = trigram_path(path) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, trigram_path(path))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["TrigramIndex"]:
+        try:
+            with open(trigram_path(path), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        postings = {k.encode("latin-1"): v for k, v in data["postings"].items()}
+        return cls(data["size"], data["blocks"], postings)
+
+    def candidate_blocks(self, needle: bytes) -> List[int]:
+        """
+        可能包含 needle 的块（按顺序）；needle 不足 3 字节时无法过滤，返回全部块。
+        """
+        mask = (1 << self.blocks) - 1
+        for gram in _trigrams(needle.lower()):
+            mask &= self.postings.get(gram, 0)
+            if not mask:
+                return []
+        return [k for k in range(self.blocks) if mask >> k & 1]
+
+
+def _indexable(path: str) -> bool:
+    # 只对未压缩、足够大的文件建索引（还需要行索引，见 build_index）
+    return compression.media_type_for(path) is None and os.path.getsize(path) >= GREP_INDEX_MIN_BYTES
+
+
+def build_index(path: str) -> Optional[TrigramIndex]:
+    """
+    同步建立 trigram 索引并落盘；没有行索引时返回 None。
+    """
+    idx = LineIndex.load(path)
+    if idx is None:
+        return None
+    tri = TrigramIndex.build(path, idx)
+    if not os.path.exists(path):
+        # 建索引期间文件已被清理，不留下孤立的 .tri
+        return None
+    tri.save(path)
+    logger.info(f"Built trigram index for {os.path.basename(path)}: {len(tri.postings)} trigrams, {tri.blocks} blocks")
+    return tri
+
+
+def _build_in_background(path: str):
+    try:
+        build_index(path)
+    except Exception as e:
+        logger.warning(f"Failed to build trigram index for {os.path.basename(path)}: {e}")
+    finally:
+        with _building_guard:
+            _building.discard(path)
+
+
+def get_index(path: str) -> Optional[TrigramIndex]:
+    """
+    返回已建好且与文件大小一致的 trigram 索引。
+
+    还没有索引时把建索引任务交给后台线程并返回 None：本次（以及建好之前的）检索直接扫描，
+    不让首个请求等待建索引。文件不满足条件（压缩、太小）时同样返回 None。
+    """
+    if not _indexable(path):
+        return None
+    tri = TrigramIndex.load(path)
+    if tri is not None and tri.size == os.path.getsize(path):
+        return tri
+    with _building_guard:
+        if path in _building:
+            return None
+        _building.add(path)
+    _BUILD_POOL.submit(_build_in_background, path)
+    return None
+
+
+def _scan_mmap(mm, matcher: "re.Pattern", start: int, end: int, first_line: int, skip: int, want: int, out: list) -> int:
+    """
+    在 mm[start:end) 里找命中行，first_line 为 start 处的行号（start 须为行首）。
+    跳过前 skip 条命中后收集到 out，返回仍需跳过的条数。
+
+    matcher 须带 re.MULTILINE，^ / $ 才会在行首行尾匹配。整段搜索只用来快速定位候选行：
+    命中跨过换行时（例如 \\s+、[^x]），在该行范围内重新匹配，结果与逐行匹配一致。
+    """
+    pos = start
+    line = first_line
+    counted = start
+    while pos < end and len(out) < want:
+        m = matcher.search(mm, pos, end)
+        if m is None:
+            break
+        line_start = mm.rfind(b"\n", start, m.start()) + 1 or start
+        line_end = mm.find(b"\n", m.start(), end)
+        if line_end < 0:
+            line_end = end
+        if m.end() > line_end:
+            m = matcher.search(mm, line_start, line_end)
+            if m is None:
+                pos = line_end + 1
+                continue
+        line += mm[counted: line_start].count(b"\n")
+        counted = line_start
+        if skip:
+            skip -= 1
+        else:
+            out.append({
+                "line": line,
+                "text": _snippet(mm[line_start: line_end], m.start() - line_start, m.end() - line_start),
+            })
+        # 同一行只算一次命中
+        pos = line_end + 1
+    return skip
+
+
+def grep_file(
+    path: str,
+    pattern: str,
+    regex: bool = False,
+    ignore_case: bool = False,
+    offset: int = 0,
+    limit: int = 100,
+    use_index: bool = True
+) -> Dict:
+    """
+    在导出文件中查找命中行，返回 {"matches": [{"line", "text"}], "next_offset", "indexed"}。
+
+    - line 为 0 起的行号，与预览接口的 offset_line 一致
+    - 未压缩文件用 mmap 扫描（子串也编译成转义后的正则，匹配在 C 里完成）
+    - 子串查询可用 trigram 索引先排除不可能命中的块，只扫描候选块；索引首次用到时在后台建立
+    - 压缩文件只能边解压边逐行匹配
+    分页按命中条数：offset 跳过前若干条，多取一条用来判断是否还有下一页。
+    """
+    # 按行匹配：^ / $ 对应行首行尾（压缩文件逐行匹配，未压缩文件见 _scan_mmap）
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    want = limit + 1
+    out: List[Dict] = []
+    indexed = False
+
+    if compression.media_type_for(path) is not None:
+        matcher = re.compile(pattern if regex else re.escape(pattern), flags)
+        skip = offset
+        with compression.open_text(path, newline="\n") as f:
+            for i, line in enumerate(f):
+                line = line.rstrip("\n")
+                m = matcher.search(line)
+                if m is None:
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                raw = line.encode("utf-8")
+                out.append({"line": i, "text": _snippet(raw, len(line[: m.start()].encode("utf-8")), len(line[: m.end()].encode("utf-8")))})
+                if len(out) >= want:
+                    break
+    else:
+        needle = pattern.encode("utf-8")
+        matcher = re.compile(needle if regex else re.escape(needle), flags)
+        tri = get_index(path) if use_index and not regex else None
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return {"matches": [], "next_offset": None, "indexed": False}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if tri is not None and tri.size == len(mm):
+                    indexed = True
+                    idx = LineIndex.load(path)
+                    bounds = idx.offsets + [len(mm)]
+                    skip = offset
+                    for k in tri.candidate_blocks(needle):
+                        skip = _scan_mmap(mm, matcher, bounds[k], bounds[k + 1], k * idx.step, skip, want, out)
+                        if len(out) >= want:
+                            break
+                else:
+                    _scan_mmap(mm, matcher, 0, len(mm), 0, offset, want, out)
+
+    has_more = len(out) > limit
+    return {
+        "matches": out[:limit],
+        "next_offset": offset + limit if has_more else None,
+        "indexed": indexed,
+    }
@@ -0,0 +1,157 @@
+# coding=utf-8
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import IO, List, Optional, Tuple
+
+from app.storage import compression
+
+# 每隔多少行记录一次字节偏移
+LINE_INDEX_STEP = int(os.getenv("LINE_INDEX_STEP", "1000"))
+INDEX_SUFFIX = ".idx"
+# 压缩文件预览时保留的解压游标个数（按文件），顺序往后翻页时接着上次的位置读
+PREVIEW_CURSOR_CACHE = int(os.getenv("PREVIEW_CURSOR_CACHE", "8"))
+
+
+def index_path(path: str) -> str:
+    return path + INDEX_SUFFIX
+
+
+class LineIndexBuilder:
+    """
+    导出时增量构建稀疏行索引：offsets[k] 为第 k * step 行（0 起）在未压缩内容中的字节偏移。
+
+    偏移按未压缩字节计算；压缩文件不能按偏移 seek，但总行数仍然可用。
+    """
+
+    def __init__(self, step: int = LINE_INDEX_STEP):
+        self.step = step
+        self.lines = 0
+        self.size = 0
+        self.offsets: List[int] = [0]
+
+    def feed(self, data: bytes):
+        # 只在跨过 step 边界时才逐个定位换行符，其余情况只做一次 count
+        n = data.count(b"\n")
+        next_mark = len(self.offsets) * self.step
+        if self.lines + n >= next_mark:
+            pos = -1
+            line = self.lines
+            while line < self.lines + n:
+                pos = data.find(b"\n", pos + 1)
+                line += 1
+                if line == next_mark:
+                    self.offsets.append(self.size + pos + 1)
+                    next_mark += self.step
+                    if next_mark > self.lines + n:
+                        break
+        self.lines += n
+        self.size += len(data)
+
+    def save(self, path: str):
+        data = {"step": self.step, "lines": self.lines, "size": self.size, "offsets": self.offsets}
+        with open(index_path(path), "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+
+class LineIndex:
+    def __init__(self, step: int, lines: int, offsets: List[int]):
+        self.step = step
+        self.lines = lines
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LineIndex"]:
+        try:
+            with open(index_path(path), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return cls(data["step"], data["lines"], data["offsets"])
+
+    def locate(self, line: int) -> Tuple[int, int]:
+        """
+        返回 (起始字节偏移, 还需跳过的行数)。
+        """
+        k = min(line // self.step, len(self.offsets) - 1)
+        return self.offsets[k], line - k * self.step
+
+
+# (路径, mtime) -> (游标所在行号, 打开的解压流)；取用时从缓存里拿出来，同一个游标不会被两个线程同时读
+_cursors: "OrderedDict[Tuple[str, int], Tuple[int, IO[str]]]" = OrderedDict()
+_cursors_guard = threading.Lock()
+
+
+def _take_cursor(key: Tuple[str, int], offset_line: int) -> Tuple[int, Optional[IO[str]]]:
+    with _cursors_guard:
+        cursor = _cursors.pop(key, None)
+    if cursor is None:
+        return 0, None
+    if cursor[0] > offset_line:
+        # 解压流只能往前读，往回跳只能从头开始
+        cursor[1].close()
+        return 0, None
+    return cursor
+
+
+def _put_cursor(key: Tuple[str, int], line: int, f: IO[str]):
+    evicted: List[IO[str]] = []
+    with _cursors_guard:
+        old = _cursors.pop(key, None)
+        if old is not None:
+            evicted.append(old[1])
+        _cursors[key] = (line, f)
+        while len(_cursors) > PREVIEW_CURSOR_CACHE:
+            evicted.append(_cursors.popitem(last=False)[1][1])
+    for stale in evicted:
+        stale.close()
+
+
+def read_lines(path: str, offset_line: int, limit: int) -> Tuple[List[str], Optional[int]]:
+    """
+    读取第 [offset_line, offset_line + limit) 行，返回 (行列表, 总行数或 None)。
+
+    未压缩且有索引时先 seek 到最近的索引点，只需跳过不到 step 行。
+    压缩文件不能随机定位（索引里是未压缩偏移，gzip/zstd 流没法从中间开始解），
+    只能顺序解压：缓存上次停下的解压游标，往后翻页时接着读；往回跳或游标被淘汰时从头解压，
+    所以跳到大文件很靠后的位置会慢。
+    """
+    idx = LineIndex.load(path)
+    total = idx.lines if idx is not None else None
+    lines: List[str] = []
+
+    if idx is not None and compression.media_type_for(path) is None:
+        offset, skip = idx.locate(offset_line)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for _ in range(skip):
+                if not f.readline():
+                    return lines, total
+            for _ in range(limit):
+                raw = f.readline()
+                if not raw:
+                    break
+                lines.append(raw.decode("utf-8", errors="replace").rstrip("\n"))
+        return lines, total
+
+    key = (path, os.stat(path).st_mtime_ns)
+    line, f = _take_cursor(key, offset_line)
+    if f is None:
+        # 只按 \n 分行，与索引的计数方式一致
+        f = compression.open_text(path, newline="\n")
+    try:
+        while line < offset_line and f.readline():
+            line += 1
+        if line == offset_line:
+            for _ in range(limit):
+                raw = f.readline()
+                if not raw:
+                    break
+                lines.append(raw.rstrip("\n"))
+                line += 1
+    except BaseException:
+        f.close()
+        raise
+    _put_cursor(key, line, f)
+    return lines, total
@@ -0,0 +1,251 @@
+# coding=utf-8
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.storage.grep import TRIGRAM_SUFFIX
+from app.storage.lineindex import INDEX_SUFFIX
+from app.storage.local import LOG_DIR
+
+logger = logging.getLogger(__name__)
+
+# 导出文件默认保留时长（秒）
+FILE_TTL_SECONDS = int(os.getenv("FILE_TTL_SECONDS", "120"))
+# 清理周期（秒）
+RETENTION_SWEEP_SECONDS = float(os.getenv("RETENTION_SWEEP_SECONDS", "10"))
+# LOG_DIR 总大小上限，超出后按最近访问时间（LRU）淘汰；0 表示不限
+LOG_DIR_MAX_BYTES = int(os.getenv("LOG_DIR_MAX_BYTES", str(5 * 1024 ** 3)))
+
+INDEX_FILE = ".retention.json"
+# 跟随导出文件一起删除的附属文件（行索引、grep 索引等）
+SIDECAR_SUFFIXES = (INDEX_SUFFIX, TRIGRAM_SUFFIX)
+
+
+class RetentionManager:
+    """
+    导出文件保留管理，取代"每个文件一个 sleep 协程"：
+
+    - 元数据（过期时间、最近访问、大小）保存在 LOG_DIR/.retention.json，进程重启不丢
+    - 单个周期任务统一清理过期文件，并在超出 LOG_DIR_MAX_BYTES 时按 LRU 淘汰
+    - 启动时扫描目录：索引里没有的孤儿文件按 mtime + TTL 判断，过期即删除
+    """
+
+    def __init__(
+        self,
+        log_dir: Path = LOG_DIR,
+        default_ttl: int = FILE_TTL_SECONDS,
+        max_bytes: int = LOG_DIR_MAX_BYTES,
+        sweep_interval: float = RETENTION_SWEEP_SECONDS
+    ):
+        self.log_dir = Path(log_dir)
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.total_bytes = 0
+        self.stats = {
+            "expired_removed": 0,
+            "quota_removed": 0,
+            "orphans_removed": 0,
+            "orphans_adopted": 0,
+        }
+        # 文件名 -> {"expires_at", "last_access", "size"}（时间均为 wall clock，重启后仍有效）
+        self._entries: Dict[str, Dict] = {}
+        # 索引会在写线程（sweep）和事件循环（register/touch）里同时访问
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def file_count(self) -> int:
+        return len(self._entries)
+
+    @property
+    def _index_path(self) -> Path:
+        return self.log_dir / INDEX_FILE
+
+    def _load(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Retention index unreadable, rebuilding from scan: {e}")
+            return
+        with self._lock:
+            self._entries = {k: v for k, v in data.items() if isinstance(v, dict)}
+
+    def _persist(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._entries)
+            self._dirty = False
+        tmp = self._index_path.with_name(INDEX_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self._index_path)
+
+    def register(self, path: str, ttl: Optional[int] = None):
+        """
+        登记一个已写完的导出文件，ttl 秒后过期。
+        """
+        name = os.path.basename(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        now = time.time()
+        with self._lock:
+            self._entries[name] = {
+                "expires_at": now + (ttl if ttl is not None else self.default_ttl),
+                "last_access": now,
+                "size": size,
+            }
+            self.total_bytes += size
+            self._dirty = True
+
+    def touch(self, path: str, ttl: Optional[int] = None) -> bool:
+        """
+        顺延一个仍在保留期内的文件；文件已不存在或已过期时返回 False。
+        """
+        name = os.path.basename(path)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry["expires_at"] <= now or not os.path.exists(path):
+                return False
+            entry["expires_at"] = max(entry["expires_at"], now + (ttl if ttl is not None else self.default_ttl))
+            entry["last_access"] = now
+            self._dirty = True
+        return True
+
+    def mark_access(self, path: str):
+        # 只更新最近访问时间（影响 LRU 淘汰顺序），不延长过期时间
+        with self._lock:
+            entry = self._entries.get(os.path.basename(path))
+            if entry is not None:
+                entry["last_access"] = time.time()
+                self._dirty = True
+
+    def _remove_sidecars(self, name: str):
+        for suffix in SIDECAR_SUFFIXES:
+            try:
+                os.remove(self.log_dir / (name + suffix))
+            except OSError:
+                pass
+
+    def _remove(self, name: str) -> bool:
+        with self._lock:
+            self._entries.pop(name, None)
+            self._dirty = True
+        self._remove_sidecars(name)
+        try:
+            os.remove(self.log_dir / name)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"Retention remove {name} failed: {e}")
+            return False
+        logger.info(f"Cleanup removed {name}")
+        return True
+
+    def sweep(self, now: Optional[float] = None):
+        """
+        一次清理：先删过期文件，再按 LRU 把总大小压到上限以内。在线程里调用。
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            items = list(self._entries.items())
+
+        alive = []
+        for name, entry in items:
+            if entry["expires_at"] <= now:
+                if self._remove(name):
+                    self.stats["expired_removed"] += 1
+            else:
+                alive.append((name, entry))
+
+        total = sum(entry.get("size", 0) for _, entry in alive)
+        if self.max_bytes > 0 and total > self.max_bytes:
+            alive.sort(key=lambda item: item[1].get("last_access", 0))
+            for name, entry in alive:
+                if total <= self.max_bytes:
+                    break
+                self._remove(name)
+                total -= entry.get("size", 0)
+                self.stats["quota_removed"] += 1
+        self.total_bytes = total
+
+        self._persist()
+
+    def scan(self):
+        """
+        启动扫描：回收上次进程遗留的文件（索引外的孤儿文件按 mtime + TTL 处理）。
+        """
+        self._load()
+        now = time.time()
+        with self._lock:
+            known = set(self._entries)
+        for p in self.log_dir.iterdir():
+            if not p.is_file() or p.name.startswith("."):
+                continue
+            if p.name in known:
+                continue
+            if p.name.endswith(SIDECAR_SUFFIXES):
+                # 附属文件随主文件处理；主文件已不在则直接删掉
+                if not p.with_name(p.name[: p.name.rindex(".")]).exists():
+                    p.unlink()
+                continue
+            st = p.stat()
+            if st.st_mtime + self.default_ttl <= now:
+                try:
+                    p.unlink()
+                    self._remove_sidecars(p.name)
+                    self.stats["orphans_removed"] += 1
+                    logger.info(f"Reclaimed orphan export {p.name}")
+                except OSError as e:
+                    logger.warning(f"Reclaim orphan {p.name} failed: {e}")
+            else:
+                with self._lock:
+                    self._entries[p.name] = {
+                        "expires_at": st.st_mtime + self.default_ttl,
+                        "last_access": st.st_mtime,
+                        "size": st.st_size,
+                    }
+                    self._dirty = True
+                self.stats["orphans_adopted"] += 1
+        # 索引里有但文件已不在的条目
+        with self._lock:
+            for name in list(self._entries):
+                if not (self.log_dir / name).exists():
+                    del self._entries[name]
+                    self._dirty = True
+        self.sweep(now)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception:
+                logger.exception("Retention sweep failed")
+
+    async def start(self):
+        await asyncio.to_thread(self.scan)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self._persist)
+
+
+retention = RetentionManager()
@@ -0,0 +1,87 @@
+# coding=utf-8
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Optional
+
+from app.core import tracing
+from app.storage.lineindex import LineIndexBuilder
+
+# 所有导出文件共用的写线程池；单个 writer 内同一时刻最多一个写任务在跑，保证顺序
+_WRITE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="logscope-writer")
+
+
+def _open_binary(path: str) -> BinaryIO:
+    return open(path, "wb")
+
+
+class AsyncFileWriter:
+    """
+    把磁盘写入挪出事件循环：每次 write 提交一整页文本到写线程，
+    编码 + 落盘都在线程里完成。
+
+    背压：提交新一页前先等上一页写完，因此"写第 N 页"与"拉第 N+1 页"重叠，
+    但内存里最多同时存在两页数据。on_written 在这一页写完（或写失败）后于事件循环中调用，
+    调用方用它归还这一页占用的内存预算。
+
+    index_lines=True 时顺带构建稀疏行索引，关闭时写到 <path>.idx。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        opener: Callable[[str], BinaryIO] = _open_binary,
+        index_lines: bool = False
+    ):
+        self.path = path
+        self.bytes_written = 0
+        self._opener = opener
+        self._index = LineIndexBuilder() if index_lines else None
+        self._f: Optional[BinaryIO] = None
+        self._pending: Optional[asyncio.Future] = None
+        # 写线程里拿不到 contextvar，创建时捕获当前 trace
+        self._trace = tracing.current()
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self._f = await loop.run_in_executor(_WRITE_POOL, self._opener, self.path)
+        return self
+
+    def _write(self, text: str) -> int:
+        with tracing.span("write", self._trace):
+            data = text.encode("utf-8")
+            self._f.write(data)
+            if self._index is not None:
+                self._index.feed(data)
+        return len(data)
+
+    def _finish(self, f: BinaryIO):
+        f.close()
+        if self._index is not None:
+            self._index.save(self.path)
+
+    async def _drain(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self.bytes_written += await pending
+
+    async def write(self, text: str, on_written: Optional[Callable[[], None]] = None):
+        await self._drain()
+        loop = asyncio.get_running_loop()
+        self._pending = loop.run_in_executor(_WRITE_POOL, self._write, text)
+        if on_written is not None:
+            self._pending.add_done_callback(lambda _: on_written())
+
+    async def close(self):
+        try:
+            await self._drain()
+        finally:
+            if self._f is not None:
+                f, self._f = self._f, None
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(_WRITE_POOL, self._finish, f)
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -210,6 +210,8 @@ async def console():
             <button class="secondary" id="clearTime">清空时间</button>
             <button class="secondary" id="addFilter">+ 添加过滤</button>
             <button class="secondary" id="save">保存到本地</button>
+            <button class="secondary" id="stats">统计趋势</button>
+            <button class="secondary" id="tail">实时跟踪</button>
             <button id="run">查询并导出</button>
           </div>
         </div>
@@ -470,17 +472,7 @@ async def console():
       $("out").innerHTML = html;
     }
 
-    async function run() {
-      setStatus("请求中…", "");
-      setOut(`<pre class="mono">正在调用 /api/logscope/search …</pre>`);
-
-      const token = $("token").value.trim();
-      if (!token) {
-        setStatus("缺少 token", "bad");
-        setOut(`<pre class="mono">请先填写 Authorization Token。</pre>`);
-        return;
-      }
-
+    function readBody() {
       const body = {
         index: $("index").value.trim(),
         es_host: $("es_host").value.trim() || undefined,
@@ -494,9 +486,26 @@ async def console():
 
       // 清理 undefined（FastAPI/Pydantic 兼容）
       Object.keys(body).forEach(k => (body[k] === undefined || body[k] === "" || (k === "filters" && Object.keys(body.filters).length === 0)) && delete body[k]);
+      return body;
+    }
+
+    async function run() {
+      stopTail();
+      setStatus("请求中…", "");
+      setOut(`<pre class="mono">正在提交导出任务 /api/logscope/jobs …</pre>`);
+
+      const token = $("token").value.trim();
+      if (!token) {
+        setStatus("缺少 token", "bad");
+        setOut(`<pre class="mono">请先填写 Authorization Token。</pre>`);
+        return;
+      }
+
+      const body = readBody();
 
       try {
-        const resp = await fetch("/api/logscope/search", {
+        // 提交异步导出任务，然后轮询进度（避免大时间窗导出时连接被网关超时断开）
+        const resp = await fetch("/api/logscope/jobs", {
           method: "POST",
           headers: {
             "Authorization": `Bearer ${token}`,
@@ -506,75 +515,298 @@ async def console():
         });
 
         const text = await resp.text();
+        if (resp.status === 429) {
+          setStatus(`服务繁忙，请 ${resp.headers.get("Retry-After") || "稍后"} 秒后重试`, "bad");
+          setOut(`<pre class="mono">${text}</pre>`);
+          return;
+        }
         if (!resp.ok) {
           setStatus(`失败：HTTP ${resp.status}`, "bad");
           setOut(`<pre class="mono">${text}</pre>`);
           return;
         }
 
-        const url = text.trim();
-        setStatus("成功", "ok");
-        const safe = url.replaceAll("<","&lt;").replaceAll(">","&gt;");
-        const file = url.split("/").pop();
-        const viewUrl = `/view/${encodeURIComponent(file)}`;
-        setOut(`
-          <div class="hint">下载链接：</div>
-          <div style="height:8px;"></div>
-          <pre class="mono">${safe}</pre>
-          <div style="height:10px;"></div>
-          <div class="actions">
-            <button class="secondary" id="downloadBtn" type="button">下载（带 token）</button>
-            <a href="${viewUrl}" target="_blank" rel="noreferrer">在线打开</a>
-            <button class="secondary" id="copy">复制链接</button>
-          </div>
-        `);
-        const dlBtn = document.getElementById("downloadBtn");
-        if (dlBtn) {
-          dlBtn.addEventListener("click", async () => {
-            try {
-              setStatus("下载中…", "");
-              const resp2 = await fetch(`/api/logscope/download/${encodeURIComponent(file)}`, {
-                headers: { "Authorization": `Bearer ${token}` }
-              });
-              const blob = await resp2.blob();
-              if (!resp2.ok) {
-                const t = await blob.text();
-                setStatus(`下载失败：HTTP ${resp2.status}`, "bad");
-                setOut(`<pre class="mono">${t}</pre>`);
-                return;
-              }
-              const a = document.createElement("a");
-              const u = URL.createObjectURL(blob);
-              a.href = u;
-              a.download = file || "log.txt";
-              document.body.appendChild(a);
-              a.click();
-              a.remove();
-              URL.revokeObjectURL(u);
-              setStatus("成功", "ok");
-            } catch (e) {
-              setStatus("下载异常", "bad");
-            }
-          });
-        }
-        const copyBtn = document.getElementById("copy");
-        if (copyBtn) {
-          copyBtn.addEventListener("click", async () => {
-            try {
-              await navigator.clipboard.writeText(url);
-              setStatus("已复制", "ok");
-              setTimeout(() => setStatus("成功", "ok"), 900);
-            } catch (e) {
-              setStatus("复制失败（浏览器权限限制）", "bad");
-            }
-          });
+        const job = await pollJob(JSON.parse(text).job_id, token);
+        if (!job) return;
+        renderResult(job.url, token);
+      } catch (e) {
+        setStatus("请求异常", "bad");
+        setOut(`<pre class="mono">${String(e)}</pre>`);
+      }
+    }
+
+    function fmtTime(ms) {
+      return new Date(ms).toLocaleString("zh-CN", { hour12: false });
+    }
+
+    function sparkline(buckets) {
+      // 内联 SVG 折线 + 面积；鼠标悬停在某个桶上显示时间和条数
+      const W = 800, H = 80, P = 2;
+      const n = buckets.length;
+      const max = Math.max(1, ...buckets.map(b => b.count));
+      const x = i => n > 1 ? P + i * (W - 2 * P) / (n - 1) : W / 2;
+      const y = c => H - P - c * (H - 2 * P) / max;
+      const pts = buckets.map((b, i) => `${x(i).toFixed(1)},${y(b.count).toFixed(1)}`).join(" ");
+      const area = n ? `${x(0).toFixed(1)},${H - P} ${pts} ${x(n - 1).toFixed(1)},${H - P}` : "";
+      const w = n > 1 ? (W - 2 * P) / (n - 1) : W;
+      const hits = buckets.map((b, i) =>
+        `<rect x="${(x(i) - w / 2).toFixed(1)}" y="0" width="${w.toFixed(1)}" height="${H}" fill="transparent">` +
+        `<title>${fmtTime(b.key)}  ${b.count}</title></rect>`
+      ).join("");
+      return `<svg viewBox="0 0 ${W} ${H}" preserveAspectRatio="none" style="width:100%; height:${H}px; display:block;">` +
+        `<polygon points="${area}" fill="rgba(90,140,255,.18)" />` +
+        `<polyline points="${pts}" fill="none" stroke="rgb(90,140,255)" stroke-width="1.5" vector-effect="non-scaling-stroke" />` +
+        hits + `</svg>`;
+    }
+
+    async function runStats() {
+      const token = $("token").value.trim();
+      if (!token) {
+        setStatus("缺少 token", "bad");
+        setOut(`<pre class="mono">请先填写 Authorization Token。</pre>`);
+        return;
+      }
+      stopTail();
+      setStatus("统计中…", "");
+
+      try {
+        const resp = await fetch("/api/logscope/histogram", {
+          method: "POST",
+          headers: {
+            "Authorization": `Bearer ${token}`,
+            "Content-Type": "application/json"
+          },
+          body: JSON.stringify(readBody())
+        });
+        const text = await resp.text();
+        if (!resp.ok) {
+          setStatus(`失败：HTTP ${resp.status}`, "bad");
+          setOut(`<pre class="mono">${text}</pre>`);
+          return;
         }
+
+        const h = JSON.parse(text);
+        const peak = h.buckets.reduce((a, b) => (b.count > a.count ? b : a), { key: h.start, count: 0 });
+        setStatus(h.cached ? "统计完成（缓存）" : "统计完成", "ok");
+        setOut(
+          `<div class="hint" style="margin-bottom:8px;">` +
+          `共 <b>${h.total}</b> 条 · 每桶 ${h.interval} · 峰值 ${peak.count}（${fmtTime(peak.key)}）` +
+          `</div>` +
+          sparkline(h.buckets) +
+          `<div class="actions" style="justify-content:space-between;">` +
+          `<span class="hint">${fmtTime(h.start)}</span><span class="hint">${fmtTime(h.end)}</span></div>`
+        );
       } catch (e) {
         setStatus("请求异常", "bad");
         setOut(`<pre class="mono">${String(e)}</pre>`);
       }
     }
 
+    // ---- 实时跟踪（/api/logscope/tail，SSE over fetch：EventSource 不能带 Authorization 头）----
+    const TAIL_KEEP_LINES = 2000;
+    let tailCtl = null;
+
+    function appendTail(pre, lines) {
+      const atBottom = pre.scrollTop + pre.clientHeight >= pre.scrollHeight - 4;
+      pre.appendChild(document.createTextNode(lines.join("\n") + "\n"));
+      // 只保留最近 TAIL_KEEP_LINES 行，避免页面越跑越慢
+      let total = pre.textContent.split("\n").length - 1;
+      while (total > TAIL_KEEP_LINES && pre.firstChild) {
+        total -= pre.firstChild.textContent.split("\n").length - 1;
+        pre.removeChild(pre.firstChild);
+      }
+      if (atBottom) pre.scrollTop = pre.scrollHeight;
+    }
+
+    function stopTail() {
+      if (tailCtl) tailCtl.abort();
+      tailCtl = null;
+      $("tail").textContent = "实时跟踪";
+    }
+
+    async function runTail() {
+      if (tailCtl) { stopTail(); setStatus("已停止跟踪", ""); return; }
+      const token = $("token").value.trim();
+      if (!token) {
+        setStatus("缺少 token", "bad");
+        setOut(`<pre class="mono">请先填写 Authorization Token。</pre>`);
+        return;
+      }
+
+      const body = readBody();
+      delete body.start_time;
+      delete body.end_time;
+      delete body.size;
+
+      tailCtl = new AbortController();
+      $("tail").textContent = "停止跟踪";
+      setStatus("跟踪中…", "");
+      setOut(`<pre class="mono" id="tailOut" style="max-height:520px; overflow:auto; margin:0;"></pre>`);
+      const pre = $("tailOut");
+
+      try {
+        const resp = await fetch("/api/logscope/tail", {
+          method: "POST",
+          headers: {
+            "Authorization": `Bearer ${token}`,
+            "Content-Type": "application/json"
+          },
+          body: JSON.stringify(body),
+          signal: tailCtl.signal
+        });
+        if (!resp.ok) {
+          setStatus(`失败：HTTP ${resp.status}`, "bad");
+          pre.textContent = await resp.text();
+          stopTail();
+          return;
+        }
+
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buf = "";
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buf += decoder.decode(value, { stream: true });
+          let sep;
+          const hits = [];
+          while ((sep = buf.indexOf("\n\n")) >= 0) {
+            const block = buf.slice(0, sep);
+            buf = buf.slice(sep + 2);
+            let event = "message", data = "";
+            for (const line of block.split("\n")) {
+              if (line.startsWith("event: ")) event = line.slice(7);
+              else if (line.startsWith("data: ")) data += line.slice(6);
+            }
+            if (!data) continue;
+            const msg = JSON.parse(data);
+            if (event === "hit") {
+              hits.push(msg.hit);
+              continue;
+            }
+            if (hits.length) appendTail(pre, hits.splice(0));
+            if (event === "dropped") appendTail(pre, [`… 浏览器处理不过来，跳过了 ${msg.dropped} 条 …`]);
+            else if (event === "error") setStatus(`ES 查询失败，稍后重试：${msg.error}`, "bad");
+          }
+          // 一次读到的多条日志合并成一次追加
+          if (hits.length) {
+            appendTail(pre, hits);
+            setStatus("跟踪中…", "");
+          }
+        }
+        setStatus("跟踪已结束", "");
+      } catch (e) {
+        if (e.name !== "AbortError") {
+          setStatus("请求异常", "bad");
+          appendTail(pre, [String(e)]);
+        }
+      }
+      if (tailCtl) stopTail();
+    }
+
+    function fmtBytes(n) {
+      if (!n) return "0 B";
+      const units = ["B", "KB", "MB", "GB"];
+      let i = 0;
+      while (n >= 1024 && i < units.length - 1) { n /= 1024; i++; }
+      return `${n.toFixed(i ? 1 : 0)} ${units[i]}`;
+    }
+
+    async function pollJob(jobId, token) {
+      while (true) {
+        const resp = await fetch(`/api/logscope/jobs/${encodeURIComponent(jobId)}`, {
+          headers: { "Authorization": `Bearer ${token}` }
+        });
+        const text = await resp.text();
+        if (!resp.ok) {
+          setStatus(`失败：HTTP ${resp.status}`, "bad");
+          setOut(`<pre class="mono">${text}</pre>`);
+          return null;
+        }
+        const job = JSON.parse(text);
+        const p = job.progress || {};
+        if (job.status === "failed") {
+          setStatus("导出失败", "bad");
+          setOut(`<pre class="mono">${String(job.error || "")}</pre>`);
+          return null;
+        }
+        if (job.status === "done") {
+          if (!job.count) {
+            setStatus("失败：HTTP 404", "bad");
+            setOut(`<pre class="mono">No log found</pre>`);
+            return null;
+          }
+          return job;
+        }
+
+        const total = p.total ? ` / ${p.total}` : "";
+        const eta = p.eta_seconds != null ? `，预计剩余 ${Math.ceil(p.eta_seconds)} 秒` : "";
+        setStatus(job.status === "queued" ? `排队中（第 ${job.queue_position || 1} 位）…` : "导出中…", "");
+        setOut(`<pre class="mono">任务 ${jobId}
+已写入 ${p.lines || 0}${total} 行，${fmtBytes(p.bytes)}，ES 分页 ${p.pages || 0}${eta}</pre>`);
+        await new Promise(r => setTimeout(r, 1000));
+      }
+    }
+
+    function renderResult(url, token) {
+      setStatus("成功", "ok");
+      const safe = url.replaceAll("<","&lt;").replaceAll(">","&gt;");
+      const file = url.split("/").pop();
+      const viewUrl = `/view/${encodeURIComponent(file)}`;
+      setOut(`
+        <div class="hint">下载链接：</div>
+        <div style="height:8px;"></div>
+        <pre class="mono">${safe}</pre>
+        <div style="height:10px;"></div>
+        <div class="actions">
+          <button class="secondary" id="downloadBtn" type="button">下载（带 token）</button>
+          <a href="${viewUrl}" target="_blank" rel="noreferrer">在线打开</a>
+          <button class="secondary" id="copy">复制链接</button>
+        </div>
+      `);
+      const dlBtn = document.getElementById("downloadBtn");
+      if (dlBtn) {
+        dlBtn.addEventListener("click", async () => {
+          try {
+            setStatus("下载中…", "");
+            const resp2 = await fetch(`/api/logscope/download/${encodeURIComponent(file)}`, {
+              headers: { "Authorization": `Bearer ${token}` }
+            });
+            const blob = await resp2.blob();
+            if (!resp2.ok) {
+              const t = await blob.text();
+              setStatus(`下载失败：HTTP ${resp2.status}`, "bad");
+              setOut(`<pre class="mono">${t}</pre>`);
+              return;
+            }
+            const a = document.createElement("a");
+            const u = URL.createObjectURL(blob);
+            a.href = u;
+            a.download = file || "log.txt";
+            document.body.appendChild(a);
+            a.click();
+            a.remove();
+            URL.revokeObjectURL(u);
+            setStatus("成功", "ok");
+          } catch (e) {
+            setStatus("下载异常", "bad");
+          }
+        });
+      }
+      const copyBtn = document.getElementById("copy");
+      if (copyBtn) {
+        copyBtn.addEventListener("click", async () => {
+          try {
+            await navigator.clipboard.writeText(url);
+            setStatus("已复制", "ok");
+            setTimeout(() => setStatus("成功", "ok"), 900);
+          } catch (e) {
+            setStatus("复制失败（浏览器权限限制）", "bad");
+          }
+        });
+      }
+    }
+
     $("pickTime").addEventListener("click", (e) => { e.preventDefault(); openTimePopover(); });
     $("start_time").addEventListener("click", (e) => { e.preventDefault(); openTimePopover(); });
     $("end_time").addEventListener("click", (e) => { e.preventDefault(); openTimePopover(); });
@@ -621,6 +853,8 @@ async def console():
     $("addFilter").addEventListener("click", () => addFilterRow("", ""));
     $("save").addEventListener("click", saveLocal);
     $("run").addEventListener("click", async () => { saveLocal(); await run(); });
+    $("stats").addEventListener("click", async () => { saveLocal(); await runStats(); });
+    $("tail").addEventListener("click", async () => { saveLocal(); await runTail(); });
 
     // 初始加载
     loadLocal();
@@ -640,7 +874,10 @@ async def view_file(file: str):
     """
     在线查看导出的日志文件：
     - 页面本身不要求 Header（便于新标签页打开）
-    - 页面内用 localStorage 保存的 token，fetch 下载接口并展示内容
+    - 页面内用 localStorage 保存的 token，按行窗口分块请求预览接口（offset_line/limit）
+    - 虚拟滚动：只渲染可见行，并预取相邻分块，整份导出无需下载即可浏览
+    - 自动换行：每行仍占一个行高的滚动距离，渲染时从首个可见行开始按实际高度排布
+    - 压缩文件不能随机定位，往后顺序翻页会接着上次解压的位置读，往回或远距离跳转要从头解压
     """
     safe_file = (file or "").strip().replace('"', "").replace("'", "")
     html = rf"""
@@ -691,20 +928,51 @@ async def view_file(file: str):
       cursor: pointer;
     }}
     button.danger {{ border-color: rgba(255,90,122,0.55); }}
-    pre {{
-      margin: 0; padding: 12px; border-radius: 12px; overflow: auto;
+    input {{
+      width: 120px;
+      border-radius: 10px;
       border: 1px solid var(--border);
       background: rgba(10,16,28,0.55);
-      color: #d7e3ff;
+      color: var(--text);
+      padding: 8px 10px;
+      outline: none;
+    }}
+    /* 虚拟滚动：viewport 内只放可见的若干行，spacer 撑出整份文件的滚动高度 */
+    .viewport {{
+      position: relative;
+      height: 72vh;
+      overflow: auto;
+      border: 1px solid var(--border);
+      border-radius: 12px;
+      background: rgba(10,16,28,0.55);
+    }}
+    .spacer {{ width: 1px; }}
+    .rows {{ position: absolute; left: 0; right: 0; top: 0; min-width: 100%; }}
+    .row {{
+      height: 18px;
+      line-height: 18px;
       font-size: 12px;
-      line-height: 1.45;
+      color: #d7e3ff;
       white-space: pre;
+      padding-right: 12px;
+    }}
+    .row .ln {{
+      display: inline-block;
+      width: 72px;
+      padding-right: 10px;
+      text-align: right;
+      color: var(--muted);
+      user-select: none;
     }}
-    /* 自动换行（更适合阅读长行日志） */
-    pre.wrap {{
+    .row.loading {{ color: var(--muted); }}
+    .rows.wrapped {{ right: 0; min-width: 0; }}
+    .rows.wrapped .row {{
+      height: auto;
       white-space: pre-wrap;
       word-break: break-word;
       overflow-wrap: anywhere;
+      padding-left: 72px;
+      text-indent: -72px;
     }}
     .mono {{ font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace; }}
   </style>
@@ -718,30 +986,54 @@ async def view_file(file: str):
       </div>
       <div class="actions">
         <a class="mono" href="/console" target="_blank" rel="noreferrer">返回控制台</a>
-        <button id="downloadBtn" type="button">下载（带 token）</button>
+        <input id="jumpLine" type="number" min="1" placeholder="跳到行号" />
+        <button id="jumpBtn" type="button">跳转</button>
         <button id="toggleWrap" type="button">自动换行：开</button>
+        <button id="downloadBtn" type="button">下载（带 token）</button>
         <button class="danger" id="clearToken">清空 token</button>
       </div>
     </div>
 
     <div class="card">
-      <div class="hint">提示：该页面会从浏览器 localStorage 读取 token，并带 Authorization 去请求下载接口。</div>
+      <div class="hint">提示：该页面会从浏览器 localStorage 读取 token，并按需分块请求预览接口，只渲染可见的行。</div>
+      <div id="seekHint" class="hint" style="display:none;">压缩文件不能按行随机定位：往后顺序滚动会接着读，往回滚或跳到很靠后的行需要从头解压，大文件会比较慢。</div>
       <div style="height:10px;"></div>
       <div id="status" class="hint"></div>
       <div style="height:10px;"></div>
-      <pre id="content" class="mono wrap">加载中…</pre>
+      <div id="viewport" class="viewport mono">
+        <div id="spacer" class="spacer"></div>
+        <div id="rows" class="rows"></div>
+      </div>
     </div>
   </div>
 
   <script>
     const LS_KEY = "{_LS_KEY}";
-    const WRAP_KEY = "logscope.view.wrap.v1";
     const file = "{safe_file}";
     const statusEl = document.getElementById("status");
-    const pre = document.getElementById("content");
+    const viewport = document.getElementById("viewport");
+    const spacer = document.getElementById("spacer");
+    const rowsEl = document.getElementById("rows");
     const previewUrl = `/api/logscope/preview/${{encodeURIComponent(file)}}`;
     const downloadUrl = `/api/logscope/download/${{encodeURIComponent(file)}}`;
-    const wrapBtn = document.getElementById("toggleWrap");
+
+    const ROW_H = 18;          // 与 .row 的 height 一致
+    const CHUNK = 500;         // 每次请求的行数
+    const OVERSCAN = 40;       // 可见区上下多渲染的行数
+    const MAX_CHUNKS = 40;     // 浏览器端最多缓存的分块数（LRU）
+    const MAX_PX = 15000000;   // 超过浏览器元素高度上限时按比例映射滚动位置
+    const WRAP_KEY = "logscope.view.wrap.v1";
+    const toggleWrapBtn = document.getElementById("toggleWrap");
+
+    let totalLines = null;     // 服务端给出的总行数；未知时随加载增长
+    let knownLines = 0;
+    const chunks = new Map();  // chunk 序号 -> 行数组
+    const inflight = new Map();
+    let renderQueued = false;
+    let wrapEnabled = getWrapEnabled();
+
+    if (/\.(gz|zst)$/.test(file)) document.getElementById("seekHint").style.display = "";
+
     document.getElementById("downloadBtn").addEventListener("click", async () => {{
       const token = getToken();
       if (!token) {{
@@ -756,8 +1048,7 @@ async def view_file(file: str):
         const blob = await resp.blob();
         if (!resp.ok) {{
           const t = await blob.text();
-          setStatus(`下载失败：HTTP ${{resp.status}}`, true);
-          pre.textContent = t;
+          setStatus(`下载失败：HTTP ${{resp.status}} ${{t}}`, true);
           return;
         }}
         const a = document.createElement("a");
@@ -785,11 +1076,6 @@ async def view_file(file: str):
       }}
     }}
 
-    function setStatus(msg, bad=false) {{
-      statusEl.textContent = msg || "";
-      statusEl.style.color = bad ? "var(--danger)" : "var(--muted)";
-    }}
-
     function getWrapEnabled() {{
       try {{
         const v = localStorage.getItem(WRAP_KEY);
@@ -801,35 +1087,142 @@ async def view_file(file: str):
     }}
 
     function setWrapEnabled(enabled) {{
-      try {{ localStorage.setItem(WRAP_KEY, enabled ? "1" : "0"); }} catch (e) {{}}
-      if (enabled) pre.classList.add("wrap");
-      else pre.classList.remove("wrap");
-      wrapBtn.textContent = enabled ? "自动换行：开" : "自动换行：关";
+      wrapEnabled = !!enabled;
+      try {{
+        localStorage.setItem(WRAP_KEY, wrapEnabled ? "1" : "0");
+      }} catch (e) {{}}
+      rowsEl.classList.toggle("wrapped", wrapEnabled);
+      toggleWrapBtn.textContent = `自动换行：${{wrapEnabled ? "开" : "关"}}`;
+      scheduleRender();
+    }}
+
+    function setStatus(msg, bad=false) {{
+      statusEl.textContent = msg || "";
+      statusEl.style.color = bad ? "var(--danger)" : "var(--muted)";
+    }}
+
+    function lineCount() {{
+      return totalLines !== null ? totalLines : knownLines;
+    }}
+
+    function scrollHeightPx() {{
+      return Math.min(lineCount() * ROW_H, MAX_PX);
+    }}
+
+    // 滚动位置 <-> 行号（行数太多时 spacer 高度被截断，按比例换算）
+    function firstVisibleLine() {{
+      const visible = Math.ceil(viewport.clientHeight / ROW_H);
+      const maxFirst = Math.max(0, lineCount() - visible);
+      const maxScroll = Math.max(1, scrollHeightPx() - viewport.clientHeight);
+      if (lineCount() * ROW_H <= MAX_PX) return Math.min(maxFirst, Math.floor(viewport.scrollTop / ROW_H));
+      return Math.round(viewport.scrollTop / maxScroll * maxFirst);
+    }}
+
+    function scrollToLine(line) {{
+      const visible = Math.ceil(viewport.clientHeight / ROW_H);
+      const maxFirst = Math.max(1, lineCount() - visible);
+      if (lineCount() * ROW_H <= MAX_PX) viewport.scrollTop = line * ROW_H;
+      else viewport.scrollTop = line / maxFirst * (scrollHeightPx() - viewport.clientHeight);
+      scheduleRender();
+    }}
+
+    async function loadChunk(k) {{
+      if (chunks.has(k)) {{
+        // LRU：最近用过的移到末尾
+        const v = chunks.get(k);
+        chunks.delete(k);
+        chunks.set(k, v);
+        return;
+      }}
+      if (inflight.has(k)) return inflight.get(k);
+      const token = getToken();
+      const p = (async () => {{
+        const resp = await fetch(`${{previewUrl}}?offset_line=${{k * CHUNK}}&limit=${{CHUNK}}`, {{
+          headers: {{ "Authorization": `Bearer ${{token}}` }}
+        }});
+        const text = await resp.text();
+        if (!resp.ok) throw new Error(`HTTP ${{resp.status}} ${{text}}`);
+        const total = resp.headers.get("X-Total-Lines");
+        if (total !== null) totalLines = Number(total);
+        const lines = text ? text.replace(/\n$/, "").split("\n") : [];
+        // 没有总行数时：读满一块就先假设后面还有
+        knownLines = Math.max(knownLines, k * CHUNK + lines.length + (lines.length === CHUNK ? CHUNK : 0));
+        chunks.set(k, lines);
+        while (chunks.size > MAX_CHUNKS) chunks.delete(chunks.keys().next().value);
+      }})();
+      inflight.set(k, p);
+      try {{
+        await p;
+      }} finally {{
+        inflight.delete(k);
+      }}
+      spacer.style.height = `${{scrollHeightPx()}}px`;
+      scheduleRender();
+    }}
+
+    function scheduleRender() {{
+      if (renderQueued) return;
+      renderQueued = true;
+      requestAnimationFrame(() => {{
+        renderQueued = false;
+        render();
+      }});
+    }}
+
+    function render() {{
+      const n = lineCount();
+      const visible = Math.ceil(viewport.clientHeight / ROW_H);
+      const first = firstVisibleLine();
+      // 换行后行高不固定，无法把上方的行准确排到可见区外，所以从首个可见行开始渲染
+      const start = wrapEnabled ? first : Math.max(0, first - OVERSCAN);
+      const end = Math.min(n, first + visible + OVERSCAN);
+
+      // 需要的分块 + 前后各一块预取
+      const need = new Set();
+      for (let k = Math.floor(start / CHUNK); k <= Math.floor(Math.max(start, end - 1) / CHUNK); k++) need.add(k);
+      const firstChunk = Math.floor(start / CHUNK);
+      const lastChunk = Math.floor(Math.max(start, end - 1) / CHUNK);
+      if (firstChunk > 0) need.add(firstChunk - 1);
+      if ((lastChunk + 1) * CHUNK < n) need.add(lastChunk + 1);
+      need.forEach(k => loadChunk(k).catch(e => setStatus(`请求失败：${{e.message}}`, true)));
+
+      const frag = document.createDocumentFragment();
+      for (let i = start; i < end; i++) {{
+        const row = document.createElement("div");
+        const lines = chunks.get(Math.floor(i / CHUNK));
+        const text = lines ? lines[i % CHUNK] : undefined;
+        row.className = text === undefined ? "row loading" : "row";
+        const ln = document.createElement("span");
+        ln.className = "ln";
+        ln.textContent = String(i + 1);
+        row.appendChild(ln);
+        row.appendChild(document.createTextNode(text === undefined ? "…" : text));
+        frag.appendChild(row);
+      }}
+      rowsEl.replaceChildren(frag);
+      // rows 跟随滚动位置放在可见区域顶部（比例映射时同样成立）
+      rowsEl.style.top = `${{viewport.scrollTop - (first - start) * ROW_H}}px`;
+
+      const shown = n ? `${{first + 1}}–${{Math.min(n, first + visible)}}` : "0";
+      setStatus(`共 ${{totalLines !== null ? totalLines : knownLines + "+"}} 行，当前 ${{shown}}`);
     }}
 
     async function load() {{
       const token = getToken();
+      chunks.clear();
+      totalLines = null;
+      knownLines = 0;
+      rowsEl.replaceChildren();
       if (!token) {{
         setStatus("未找到 token：请先在 /console 填写并保存。", true);
-        pre.textContent = "无法加载：缺少 Authorization Token。";
         return;
       }}
       setStatus("请求中…");
       try {{
-        const resp = await fetch(previewUrl, {{
-          headers: {{ "Authorization": `Bearer ${{token}}` }}
-        }});
-        const text = await resp.text();
-        if (!resp.ok) {{
-          setStatus(`失败：HTTP ${{resp.status}}`, true);
-          pre.textContent = text;
-          return;
-        }}
-        setStatus("预览加载成功（仅前 200KB）");
-        pre.textContent = text || "(空文件)";
+        await loadChunk(0);
+        if (lineCount() === 0) setStatus("(空文件)");
       }} catch (e) {{
-        setStatus("请求异常", true);
-        pre.textContent = String(e);
+        setStatus(`请求失败：${{e.message}}`, true);
       }}
     }}
 
@@ -845,13 +1238,17 @@ async def view_file(file: str):
       load();
     }});
 
-    wrapBtn.addEventListener("click", () => {{
-      setWrapEnabled(!pre.classList.contains("wrap"));
+    toggleWrapBtn.addEventListener("click", () => setWrapEnabled(!wrapEnabled));
+
+    document.getElementById("jumpBtn").addEventListener("click", () => {{
+      const line = Number(document.getElementById("jumpLine").value || 1);
+      scrollToLine(Math.max(0, Math.min(lineCount() - 1, line - 1)));
     }});
 
-    // 初始化换行偏好（默认开）
-    setWrapEnabled(getWrapEnabled());
+    viewport.addEventListener("scroll", scheduleRender, {{ passive: true }});
+    window.addEventListener("resize", scheduleRender);
 
+    setWrapEnabled(wrapEnabled);
     load();
   </script>
 </body>
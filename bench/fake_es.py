@@ -0,0 +1,250 @@
+# coding=utf-8
+"""
+压测用的本地 Elasticsearch 替身（aiohttp），实现导出用到的接口：
+
+- POST /{index}/_count
+- POST /{index}/_search（普通 / ?scroll=，导出估算的抽样也走这里）
+- POST /_search（PIT + search_after，支持 slice）
+- POST /_search/scroll、DELETE /_search/scroll
+- POST /{index}/_pit、DELETE /_pit
+
+索引里有 --docs 条合成日志，按 @timestamp 严格递增；每条 message 约 --doc-bytes 字节。
+文档现用现生成，不占内存。查询条件和时间范围一律忽略，所有文档都算命中；
+_count 永远返回 --docs。--latency-ms 给每个请求加固定延迟，模拟网络和 ES 的耗时。
+
+用法：python bench/fake_es.py [--port 9250] [--docs 200000] [--doc-bytes 512] [--latency-ms 0]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+from datetime import datetime, timedelta
+from fnmatch import fnmatchcase
+from typing import Dict, List, Optional, Sequence
+
+from aiohttp import web
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_BASE = datetime(2024, 5, 1)
+_BASE_MS = int((_BASE - datetime(1970, 1, 1)).total_seconds() * 1000)
+_LEVELS = ("INFO", "INFO", "INFO", "WARN", "ERROR")
+_HEADERS = {"X-Elastic-Product": "Elasticsearch"}
+
+
+def _dumps(obj) -> bytes:
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+class Corpus:
+    """
+    第 i 条文档：@timestamp = 基准时间 + i 毫秒 * step，sort 值为 [时间戳毫秒, i]。
+    """
+
+    def __init__(self, docs: int, doc_bytes: int, step_ms: int = 10):
+        self.docs = docs
+        self.step_ms = step_ms
+        self.pad = "x" * max(0, doc_bytes)
+
+    def ts_ms(self, i: int) -> int:
+        return _BASE_MS + i * self.step_ms
+
+    def source(self, i: int) -> Dict:
+        ts = _BASE + timedelta(milliseconds=i * self.step_ms)
+        head = f"{ts.isoformat(timespec='milliseconds')}Z {_LEVELS[i % 5]} svc-{i % 16:02d} req={i} "
+        return {
+            "@timestamp": ts.isoformat(timespec="milliseconds") + "Z",
+            "message": head + self.pad[:max(0, len(self.pad) - len(head))],
+            "host": {"name": f"web-{i % 16:02d}"},
+            "level": _LEVELS[i % 5],
+        }
+
+    def positions(self, start: int, size: int, slice_id: int = 0, slices: int = 1) -> List[int]:
+        # 从 start（含）开始取属于该 slice 的 size 个位置
+        first = start + (slice_id - start) % slices
+        return list(range(first, self.docs, slices))[:size]
+
+
+def _hit(corpus: Corpus, i: int, body: Dict, pit: bool) -> Dict:
+    hit = {"_index": "bench", "_id": str(i), "_score": None}
+    fields = body.get("_source")
+    src = corpus.source(i)
+    if body.get("fields") or body.get("docvalue_fields"):
+        wanted = body.get("fields") or body.get("docvalue_fields")
+        hit["fields"] = {f: [_lookup(src, f)] for f in wanted if _lookup(src, f) is not None}
+    elif fields is not False:
+        hit["_source"] = src if fields is None or fields is True else _filter_source(src, fields)
+    hit["sort"] = [corpus.ts_ms(i), i] if pit else [corpus.ts_ms(i)]
+    return hit
+
+
+def _filter_source(src: Dict, spec) -> Dict:
+    """
+    与 ES 的 _source 过滤一致：spec 可以是字段名 / 字段列表 / {"includes": [...], "excludes": [...]}，
+    支持通配符；按点分路径匹配，"host.name" 返回 {"host": {"name": ...}}，匹配到对象时整个对象返回。
+    """
+    if isinstance(spec, str):
+        spec = [spec]
+    if isinstance(spec, dict):
+        includes, excludes = spec.get("includes") or ["*"], spec.get("excludes") or []
+    else:
+        includes, excludes = spec or ["*"], []
+    return _filter_object(src, "", list(includes), list(excludes))
+
+
+def _filter_object(obj: Dict, prefix: str, includes: Sequence[str], excludes: Sequence[str]) -> Dict:
+    out = {}
+    for key, value in obj.items():
+        path = prefix + key
+        if any(fnmatchcase(path, p) for p in excludes):
+            continue
+        if any(fnmatchcase(path, p) for p in includes):
+            # 整个对象都要，但里面仍可能有被排除的字段
+            out[key] = _filter_object(value, path + ".", ["*"], excludes) if isinstance(value, dict) and excludes else value
+        elif isinstance(value, dict):
+            # 祖先没被选中时看下面有没有匹配的字段；一个都没有就不输出这个对象
+            inner = _filter_object(value, path + ".", includes, excludes)
+            if inner:
+                out[key] = inner
+    return out
+
+
+def _lookup(src: Dict, path: str):
+    value = src.get(path)
+    if value is not None:
+        return value
+    value = src
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+class FakeES:
+    def __init__(self, corpus: Corpus, latency: float = 0.0):
+        self.corpus = corpus
+        self.latency = latency
+        self.ids = itertools.count()
+        # scroll_id -> [下一个位置, 页大小, slice_id, slices, 请求体]
+        self.scrolls: Dict[str, list] = {}
+        self.pits: set = set()
+        self.requests = 0
+
+    async def _delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    @staticmethod
+    async def _body(request: web.Request) -> Dict:
+        raw = await request.read()
+        return json.loads(raw) if raw else {}
+
+    def _json(self, obj) -> web.Response:
+        return web.Response(body=_dumps(obj), content_type="application/json", headers=_HEADERS)
+
+    def _page(self, body: Dict, start: int, pit: bool) -> List[Dict]:
+        sl = body.get("slice") or {}
+        positions = self.corpus.positions(start, int(body.get("size", 10)), sl.get("id", 0), sl.get("max", 1))
+        return [_hit(self.corpus, i, body, pit) for i in positions]
+
+    async def info(self, request: web.Request) -> web.Response:
+        return self._json({"name": "fake-es", "version": {"number": "8.13.0"}, "tagline": "You Know, for Search"})
+
+    async def count(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return self._json({"count": self.corpus.docs})
+
+    async def search(self, request: web.Request) -> web.Response:
+        await self._delay()
+        body = await self._body(request)
+        total = {"value": self.corpus.docs, "relation": "eq"}
+        if "pit" in body:
+            after = body.get("search_after")
+            start = after[1] + 1 if after else 0
+            hits = self._page(body, start, pit=True)
+            return self._json({"pit_id": body["pit"]["id"], "hits": {"total": total, "hits": hits}})
+
+        hits = self._page(body, 0, pit=False)
+        resp = {"took": 1, "timed_out": False, "hits": {"total": total, "hits": hits}}
+        if "scroll" in request.query:
+            sid = f"scroll-{next(self.ids)}"
+            sl = body.get("slice") or {}
+            next_pos = int(hits[-1]["_id"]) + 1 if hits else self.corpus.docs
+            self.scrolls[sid] = [next_pos, int(body.get("size", 10)), sl.get("id", 0), sl.get("max", 1), body]
+            resp["_scroll_id"] = sid
+        return self._json(resp)
+
+    async def scroll(self, request: web.Request) -> web.Response:
+        await self._delay()
+        body = await self._body(request)
+        sid = body.get("scroll_id")
+        state = self.scrolls.get(sid)
+        if state is None:
+            return web.json_response({"error": "search_context_missing_exception"}, status=404, headers=_HEADERS)
+        start, size, slice_id, slices, search_body = state
+        positions = self.corpus.positions(start, size, slice_id, slices)
+        hits = [_hit(self.corpus, i, search_body, pit=False) for i in positions]
+        state[0] = positions[-1] + 1 if positions else self.corpus.docs
+        return self._json({"_scroll_id": sid, "hits": {"hits": hits}})
+
+    async def clear_scroll(self, request: web.Request) -> web.Response:
+        body = await self._body(request)
+        ids = body.get("scroll_id") or []
+        for sid in ([ids] if isinstance(ids, str) else ids):
+            self.scrolls.pop(sid, None)
+        return self._json({"succeeded": True, "num_freed": 1})
+
+    async def open_pit(self, request: web.Request) -> web.Response:
+        await self._delay()
+        pid = f"pit-{next(self.ids)}"
+        self.pits.add(pid)
+        return self._json({"id": pid})
+
+    async def close_pit(self, request: web.Request) -> web.Response:
+        body = await self._body(request)
+        self.pits.discard(body.get("id"))
+        return self._json({"succeeded": True, "num_freed": 1})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        # 压测脚本用来确认 PIT / scroll 都被正确释放
+        return self._json({"requests": self.requests, "open_pits": len(self.pits), "open_scrolls": len(self.scrolls)})
+
+
+def make_app(docs: int, doc_bytes: int, latency_ms: float = 0.0) -> web.Application:
+    es = FakeES(Corpus(docs, doc_bytes), latency_ms / 1000)
+    app = web.Application(client_max_size=64 * 1024 ** 2)
+    app.add_routes([
+        web.get("/", es.info),
+        web.get("/_bench/stats", es.stats),
+        web.post("/_search/scroll", es.scroll),
+        web.delete("/_search/scroll", es.clear_scroll),
+        web.post("/_search", es.search),
+        web.delete("/_pit", es.close_pit),
+        web.post("/{index}/_search", es.search),
+        web.post("/{index}/_count", es.count),
+        web.post("/{index}/_pit", es.open_pit),
+    ])
+    return app
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9250)
+    parser.add_argument("--docs", type=int, default=200000)
+    parser.add_argument("--doc-bytes", type=int, default=512)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    web.run_app(
+        make_app(args.docs, args.doc_bytes, args.latency_ms),
+        host=args.host, port=args.port, print=None, access_log=None
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# coding=utf-8
+"""
+导出热路径基准：对比"解析 ES 页响应 + 编码成导出文本"的吞吐（lines/s）。
+
+- baseline：原有路径，完整 hit（_index/_id/_score/sort + _source）+ 标准库 json 解码
+- trimmed：filter_path 裁剪后的响应 + fetch=source
+- fields：filter_path + fetch=fields（docvalue 的响应结构与之相同）
+
+每种组合都分别用标准库 json 和 orjson（已安装时）解码。不需要 ES，响应体是本地合成的。
+
+用法：python bench/fetch_decode.py [--pages 50] [--page-size 2000] [--fields message]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.service.formats import get_field, make_encoder  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _doc(i: int) -> dict:
+    return {
+        "@timestamp": f"2024-05-01T00:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000:03d}Z",
+        "message": f"GET /api/v1/orders/{i} 200 {random.randint(1, 900)}ms trace_id={random.getrandbits(64):016x} "
+                   + "x" * random.randint(40, 200),
+        "host": {"name": f"web-{i % 16:02d}"},
+        "level": random.choice(["INFO", "WARN", "ERROR"]),
+        "trace": {"id": f"{random.getrandbits(64):016x}"},
+    }
+
+
+def build_page(page_size: int, fields: list, mode: str) -> bytes:
+    hits = []
+    for i in range(page_size):
+        doc = _doc(i)
+        sort = [1714521600000 + i, i]
+        if mode == "baseline":
+            hit = {
+                "_index": "logs-2024.05.01", "_id": f"{random.getrandbits(64):x}", "_score": None,
+                "_source": {f: get_field(doc, f) for f in fields}, "sort": sort,
+            }
+        elif mode == "trimmed":
+            hit = {"_source": {f: get_field(doc, f) for f in fields}, "sort": sort}
+        else:
+            hit = {"fields": {f: [get_field(doc, f)] for f in fields}, "sort": sort}
+        hits.append(hit)
+    resp = {"took": 12, "timed_out": False, "_shards": {"total": 3, "successful": 3, "skipped": 0, "failed": 0},
+            "hits": {"hits": hits}}
+    if mode != "baseline":
+        resp = {"pit_id": "x" * 200, "hits": {"hits": hits}}
+    return json.dumps(resp).encode("utf-8")
+
+
+def run(raw: bytes, loads, pages: int, fields: list, fetch: str, fmt: str) -> float:
+    encoder = make_encoder(fmt, fields, fetch)
+    lines = 0
+    start = time.perf_counter()
+    for _ in range(pages):
+        hits = loads(raw)["hits"]["hits"]
+        encoder.encode(hits).encode("utf-8")
+        lines += len(hits)
+    return lines / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=2000)
+    parser.add_argument("--fields", default="message", help="逗号分隔，例如 @timestamp,host.name,message")
+    parser.add_argument("--format", default="txt", choices=["txt", "ndjson", "csv", "columnar"])
+    args = parser.parse_args()
+
+    random.seed(42)
+    fields = [f for f in args.fields.split(",") if f]
+    decoders = [("json", json.loads)]
+    if orjson is not None:
+        decoders.append(("orjson", orjson.loads))
+
+    baseline = None
+    print(f"{'mode':<10}{'decoder':<9}{'page KB':>9}{'lines/s':>14}{'vs baseline':>13}")
+    for mode, fetch in (("baseline", "source"), ("trimmed", "source"), ("fields", "fields")):
+        raw = build_page(args.page_size, fields, mode)
+        for name, loads in decoders:
+            rate = run(raw, loads, args.pages, fields, fetch, args.format)
+            if baseline is None:
+                baseline = rate
+            print(f"{mode:<10}{name:<9}{len(raw) / 1024:>9.0f}{rate:>14,.0f}{rate / baseline:>12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# coding=utf-8
+import asyncio
+
+from app.service.budget import ExportBudget, MemoryBudget
+from app.service.exporter import _charge_queued, _PageQueue
+
+
+def test_acquire_waits_in_fifo_order():
+    async def main():
+        budget = MemoryBudget(100)
+        assert await budget.acquire(60) == 60
+        order = []
+
+        async def take(name, n):
+            await budget.acquire(n)
+            order.append(name)
+
+        big = asyncio.ensure_future(take("big", 80))
+        await asyncio.sleep(0)
+        # 前面有人排队时，小的申请也不能插队
+        assert budget.try_acquire(10) == -1
+        small = asyncio.ensure_future(take("small", 10))
+        await asyncio.sleep(0)
+        assert order == []
+
+        budget.release(60)
+        await asyncio.gather(big, small)
+        assert order == ["big", "small"]
+        assert budget.used == 90
+
+    asyncio.run(main())
+
+
+def test_oversized_request_is_clamped():
+    async def main():
+        budget = MemoryBudget(100)
+        assert await budget.acquire(10 ** 9) == 100
+        budget.release(100)
+        assert budget.used == 0
+
+    asyncio.run(main())
+
+
+def test_force_ignores_limit_and_queue():
+    async def main():
+        budget = MemoryBudget(100)
+        await budget.acquire(100)
+        waiter = asyncio.ensure_future(budget.acquire(50))
+        await asyncio.sleep(0)
+        assert budget.force(30) == 30
+        assert budget.used == 130
+        budget.release(100)
+        budget.release(30)
+        await waiter
+        assert budget.used == 50
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_leak():
+    async def main():
+        shared = MemoryBudget(100)
+        budget = ExportBudget(100, shared)
+        await budget.acquire(100)
+        waiter = asyncio.ensure_future(budget.acquire(40))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        budget.release(100)
+        assert shared.used == budget.local.used == 0
+        assert not shared._waiters and not budget.local._waiters
+
+    asyncio.run(main())
+
+
+def test_close_returns_everything_and_ignores_late_charges():
+    async def main():
+        shared = MemoryBudget(1000)
+        other = ExportBudget(1000, shared)
+        budget = ExportBudget(100, shared)
+        await other.acquire(950)
+        await budget.acquire(30)
+        budget.force(20)
+        # 本导出的额度够，但全局额度不够：卡在全局预算上
+        pending = asyncio.ensure_future(budget.acquire(40))
+        await asyncio.sleep(0)
+
+        budget.close()
+        # 等待中的申请在 close 之后才拿到额度：立即还回去
+        assert await pending == 0
+        assert shared.used == 950
+        other.release(950)
+        # close 之后的占用不计入，release 也不生效
+        assert budget.force(10) == 0
+        assert await budget.acquire(10) == 0
+        budget.release(30)
+        assert shared.used == 0
+
+    asyncio.run(main())
+
+
+def test_charge_queued_stops_waiting_when_queue_drained():
+    async def main():
+        shared = MemoryBudget(1000)
+        budget = ExportBudget(100, shared)
+        budget.force(100)
+        queue = _PageQueue()
+        queue.put_nowait("page")
+
+        charge = asyncio.ensure_future(_charge_queued(budget, queue, 50))
+        await asyncio.sleep(0)
+        assert not charge.done()
+
+        # 消费方取空队列：下一页就是它要等的那一页，不能再等预算
+        queue.get_nowait()
+        queue.drained.set()
+        assert await asyncio.wait_for(charge, 1) == 50
+        assert budget.held == shared.used == 150
+        assert not budget.local._waiters
+
+    asyncio.run(main())
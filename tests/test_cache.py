@@ -0,0 +1,33 @@
+# coding=utf-8
+import asyncio
+
+from app.service.cache import ExportCache
+
+
+def test_shutdown_cancels_shared_exports():
+    async def main():
+        cache = ExportCache()
+        started = asyncio.Event()
+        cancelled = []
+
+        async def export():
+            started.set()
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "f", 1
+
+        waiter = asyncio.ensure_future(cache.get_or_export("k", export))
+        await started.wait()
+        # 等待方被取消（如任务被 JobManager 取消）后，共享的导出仍在跑
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert not cancelled and cache._inflight
+
+        await asyncio.wait_for(cache.shutdown(), 1)
+        assert cancelled == [True]
+        assert not cache._inflight
+
+    asyncio.run(main())
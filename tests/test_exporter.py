@@ -0,0 +1,206 @@
+# coding=utf-8
+import asyncio
+import itertools
+import random
+
+import pytest
+from elastic_transport import ApiResponseMeta, HttpHeaders
+from elasticsearch import BadRequestError
+
+from app.service.budget import export_memory
+from app.service.exporter import export_logs, iter_export_chunks
+
+DOCS = 20000
+
+
+class FakeES:
+    """
+    按 @timestamp 升序的 docs 条文档（支持 slice）；记录每次分页请求的 size 和返回条数。
+    doc_bytes 非 0 时每条 message 补齐到约这么多字节，用来制造内存压力。
+    shard_doc=False 模拟 ES 7.10–7.11：能开 PIT，但按 _shard_doc 排序的查询返回 400。
+    """
+
+    def __init__(
+        self,
+        docs: int = DOCS,
+        doc_bytes: int = 0,
+        latency: float = 0.0,
+        connections: int = 0,
+        shard_doc: bool = True
+    ):
+        self.docs = docs
+        self.latency = latency
+        # 和客户端连接池一样限制同时在途的请求数，多出来的排队
+        self.connections = asyncio.Semaphore(connections) if connections else None
+        self.pad = " " + "x" * doc_bytes if doc_bytes else ""
+        self.shard_doc = shard_doc
+        self.requests = []
+        self.scrolls = {}
+        self.open_pits = 0
+        self._ids = itertools.count()
+
+    def _hits(self, start: int, size: int, pit: bool, sl=None):
+        step = sl["max"] if sl else 1
+        first = start + (sl["id"] - start) % step if sl else start
+        hits = [
+            {"_source": {"message": f"line {i}{self.pad}"}, "sort": [i, i] if pit else [i]}
+            for i in range(first, self.docs, step)[:size]
+        ]
+        self.requests.append((size, len(hits)))
+        return hits
+
+    async def open_point_in_time(self, index=None, keep_alive=None, **kw):
+        self.open_pits += 1
+        return {"id": "pit"}
+
+    async def close_point_in_time(self, **kw):
+        self.open_pits -= 1
+
+    async def _latency(self):
+        # 各 slice 的响应交错到达，和真实 ES 一样
+        if self.connections is None:
+            await asyncio.sleep(self.latency * random.random())
+            return
+        async with self.connections:
+            await asyncio.sleep(self.latency * random.random())
+
+    async def search(self, index=None, body=None, scroll=None, size=None, **kw):
+        await self._latency()
+        if "pit" in body:
+            if not self.shard_doc and any("_shard_doc" in s for s in body["sort"]):
+                meta = ApiResponseMeta(400, "1.1", HttpHeaders(), 0.0, None)
+                raise BadRequestError("search_phase_execution_exception", meta, {})
+            after = body.get("search_after")
+            hits = self._hits(after[1] + 1 if after else 0, body["size"], pit=True, sl=body.get("slice"))
+            return {"pit_id": "pit", "hits": {"hits": hits}}
+        scroll_id = f"s{next(self._ids)}"
+        hits = self._hits(0, size, pit=False, sl=body.get("slice"))
+        self.scrolls[scroll_id] = [hits[-1]["sort"][0] + 1 if hits else self.docs, size, body.get("slice")]
+        return {"_scroll_id": scroll_id, "hits": {"hits": hits}}
+
+    async def scroll(self, scroll_id=None, **kw):
+        await self._latency()
+        pos, size, sl = self.scrolls[scroll_id]
+        hits = self._hits(pos, size, pit=False, sl=sl)
+        if hits:
+            self.scrolls[scroll_id][0] = hits[-1]["sort"][0] + 1
+        return {"_scroll_id": scroll_id, "hits": {"hits": hits}}
+
+    async def clear_scroll(self, scroll_id=None, **kw):
+        self.scrolls.pop(scroll_id, None)
+
+
+@pytest.mark.parametrize("pagination", ["pit", "scroll"])
+@pytest.mark.parametrize("max_size", [3, 2500, 17777])
+def test_requests_capped_by_max_size(tmp_path, pagination, max_size):
+    es = FakeES()
+    path = tmp_path / "out.txt"
+    count = asyncio.run(export_logs(es, "i", "*", [], str(path), max_size=max_size, pagination=pagination))
+
+    assert count == max_size
+    assert path.read_text().splitlines() == [f"line {i}" for i in range(max_size)]
+    # 每次请求都不超过导出需要的条数
+    assert all(size <= max_size for size, _ in es.requests)
+    fetched = sum(n for _, n in es.requests)
+    if pagination == "pit":
+        # PIT 每页的条数可以逐页调整，最后一页正好取到 max_size
+        assert fetched == max_size
+    else:
+        # scroll 的页大小在首个请求时就定下了，最多多取不到一页
+        assert fetched < max_size + es.requests[0][0]
+
+
+@pytest.mark.parametrize("slices", [1, 4])
+def test_auto_falls_back_to_scroll_without_shard_doc(tmp_path, slices):
+    es = FakeES(shard_doc=False)
+    path = tmp_path / "out.txt"
+    count = asyncio.run(export_logs(es, "i", "*", [], str(path), max_size=DOCS, slices=slices))
+
+    assert count == DOCS
+    assert path.read_text().splitlines() == [f"line {i}" for i in range(DOCS)]
+    assert es.open_pits == 0 and not es.scrolls
+
+
+def test_pit_mode_does_not_fall_back(tmp_path):
+    es = FakeES(shard_doc=False)
+    with pytest.raises(BadRequestError):
+        asyncio.run(export_logs(es, "i", "*", [], str(tmp_path / "out.txt"), max_size=DOCS, pagination="pit"))
+    assert es.open_pits == 0
+
+
+# 默认预算下的回归：4 KB 的日志、多 slice / 多个导出并发时不能互相等预算卡死，结束或取消后预算全部归还
+BIG_DOC_BYTES = 4096
+HANG_SECONDS = 30
+
+
+def _export(es, path, **kwargs):
+    return export_logs(es, "i", "*", [], str(path), **kwargs)
+
+
+async def _assert_released():
+    # 写线程的完成回调在事件循环里归还预算
+    await asyncio.sleep(0.05)
+    assert export_memory.used == 0
+    assert not export_memory._waiters
+
+
+def test_sliced_scroll_under_default_budget(tmp_path):
+    async def main():
+        es = FakeES(docs=60000, doc_bytes=BIG_DOC_BYTES, latency=0.005)
+        count = await asyncio.wait_for(
+            _export(es, tmp_path / "out.txt", max_size=60000, slices=8, pagination="scroll"), HANG_SECONDS
+        )
+        assert count == 60000
+        await _assert_released()
+
+    asyncio.run(main())
+
+
+def test_concurrent_sliced_pit_under_default_budget(tmp_path):
+    async def main():
+        es = FakeES(docs=40000, doc_bytes=BIG_DOC_BYTES, latency=0.005, connections=10)
+        counts = await asyncio.wait_for(asyncio.gather(*(
+            _export(es, tmp_path / f"out{i}.txt", max_size=40000, slices=16, pagination="pit")
+            for i in range(8)
+        )), HANG_SECONDS)
+        assert counts == [40000] * 8
+        await _assert_released()
+
+    asyncio.run(main())
+
+
+def test_concurrent_mixed_exports_under_default_budget(tmp_path):
+    async def main():
+        es = FakeES(docs=20000, doc_bytes=BIG_DOC_BYTES, latency=0.005)
+
+        async def stream():
+            n = 0
+            async for _, lines in iter_export_chunks(es, "i", "*", [], max_size=20000, slices=4):
+                n += lines
+            return n
+
+        counts = await asyncio.wait_for(asyncio.gather(
+            _export(es, tmp_path / "a.txt", max_size=20000, slices=4, pagination="scroll"),
+            _export(es, tmp_path / "b.txt", max_size=20000, slices=1),
+            stream(),
+        ), HANG_SECONDS)
+        assert counts == [20000] * 3
+        await _assert_released()
+
+    asyncio.run(main())
+
+
+def test_cancelled_exports_release_budget(tmp_path):
+    async def main():
+        es = FakeES(docs=20000, doc_bytes=BIG_DOC_BYTES, latency=0.005)
+        tasks = [
+            asyncio.ensure_future(_export(es, tmp_path / f"out{i}.txt", max_size=20000, slices=8))
+            for i in range(4)
+        ]
+        await asyncio.sleep(0.2)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await _assert_released()
+
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+# coding=utf-8
+import gzip
+
+import pytest
+
+from app.storage import grep
+from app.storage.grep import grep_file
+from app.storage.lineindex import LineIndexBuilder
+
+LINES = [
+    "foo start",
+    "middle foo",
+    "bar end",
+    "x bar",
+    "foo and bar",
+]
+
+
+@pytest.fixture(params=["plain", "gzip"])
+def log_file(request, tmp_path):
+    text = "\n".join(LINES) + "\n"
+    if request.param == "gzip":
+        path = tmp_path / "log.txt.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        path = tmp_path / "log.txt"
+        path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def _lines(result):
+    return [m["line"] for m in result["matches"]]
+
+
+@pytest.mark.parametrize("pattern, expected", [
+    ("^foo", [0, 4]),
+    ("bar$", [3, 4]),
+    ("^bar end$", [2]),
+    ("^middle", [1]),
+])
+def test_anchored_regex(log_file, pattern, expected):
+    assert _lines(grep_file(log_file, pattern, regex=True, use_index=False)) == expected
+
+
+def test_match_does_not_cross_lines(log_file):
+    # \s+ 不能借行尾的换行匹配到下一行；[^x]* 也不能把多行连成一条命中
+    assert _lines(grep_file(log_file, r"end\s+x", regex=True, use_index=False)) == []
+    result = grep_file(log_file, r"^[^x]*bar", regex=True, use_index=False)
+    assert _lines(result) == [2, 4]
+    assert result["matches"][0]["text"] == "bar end"
+
+
+def test_ignore_case_and_paging(log_file):
+    result = grep_file(log_file, "FOO", ignore_case=True, limit=2, use_index=False)
+    assert _lines(result) == [0, 1]
+    assert result["next_offset"] == 2
+    assert _lines(grep_file(log_file, "FOO", ignore_case=True, offset=2, use_index=False)) == [4]
+
+
+def test_trigram_index_built_in_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(grep, "GREP_INDEX_MIN_BYTES", 0)
+    data = "".join(f"line {i} {'needle' if i % 7 == 0 else 'hay'}\n" for i in range(100)).encode("utf-8")
+    path = tmp_path / "log.txt"
+    path.write_bytes(data)
+    builder = LineIndexBuilder(step=10)
+    builder.feed(data)
+    builder.save(str(path))
+
+    # 首次检索不等索引，直接扫描
+    first = grep_file(str(path), "needle")
+    assert not first["indexed"]
+    grep._BUILD_POOL.submit(lambda: None).result()
+
+    second = grep_file(str(path), "needle")
+    assert second["indexed"]
+    assert _lines(second) == _lines(first) == list(range(0, 100, 7))
@@ -0,0 +1,60 @@
+# coding=utf-8
+import gzip
+
+import pytest
+
+from app.storage import lineindex
+from app.storage.lineindex import LineIndexBuilder, read_lines
+
+LINES = [f"line {i}" for i in range(257)]
+
+
+@pytest.fixture(params=["plain", "gzip"])
+def log_file(request, tmp_path):
+    data = ("\n".join(LINES) + "\n").encode("utf-8")
+    if request.param == "gzip":
+        path = tmp_path / "log.txt.gz"
+        with gzip.open(path, "wb") as f:
+            f.write(data)
+    else:
+        path = tmp_path / "log.txt"
+        path.write_bytes(data)
+    builder = LineIndexBuilder(step=10)
+    builder.feed(data)
+    builder.save(str(path))
+    return str(path)
+
+
+@pytest.mark.parametrize("offsets", [
+    [0, 50, 100, 250],
+    [100, 50, 0],
+    [30, 30, 200, 10, 256, 257],
+])
+def test_read_lines_any_order(log_file, offsets):
+    for offset in offsets:
+        lines, total = read_lines(log_file, offset, 20)
+        assert total == len(LINES)
+        assert lines == LINES[offset:offset + 20]
+
+
+def test_compressed_reads_resume_from_cursor(tmp_path, monkeypatch):
+    path = str(tmp_path / "log.txt.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("\n".join(LINES) + "\n")
+
+    opened = []
+    real_open = lineindex.compression.open_text
+
+    def counting_open(*args, **kwargs):
+        opened.append(args[0])
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(lineindex.compression, "open_text", counting_open)
+    for offset in range(0, 200, 20):
+        assert read_lines(path, offset, 20)[0] == LINES[offset:offset + 20]
+    # 顺序往后翻页只解压一次
+    assert len(opened) == 1
+
+    # 往回跳只能从头解压
+    assert read_lines(path, 0, 5)[0] == LINES[:5]
+    assert len(opened) == 2
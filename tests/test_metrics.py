@@ -0,0 +1,42 @@
+# coding=utf-8
+import pytest
+
+from app.core import metrics
+from app.core.metrics import OTHER_INDEX, index_label
+
+
+@pytest.fixture(autouse=True)
+def fresh_labels(monkeypatch):
+    monkeypatch.setattr(metrics, "_seen_index_labels", set())
+    monkeypatch.setattr(metrics, "METRICS_INDEX_LABELS", [])
+
+
+@pytest.mark.parametrize("index, expected", [
+    ("app-logs", "app-logs"),
+    ("app-logs-2024.05.01", "app-logs-*"),
+    ("app-logs-*", "app-logs-*"),
+    (".ds-nginx-2024.05.01-000001", ".ds-nginx-*"),
+    ("app-2024.05.01,app-2024.05.02", "app-*"),
+    ("app-*,-app-2024.05.01", "app-*"),
+    ("app-*,nginx-*", OTHER_INDEX),
+])
+def test_index_label_prefix(index, expected):
+    assert index_label(index) == expected
+
+
+def test_index_label_is_bounded(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_INDEX_MAX_LABELS", 3)
+    labels = [index_label(f"idx{c}-2024") for c in "abcdef"]
+    assert labels == ["idxa-*", "idxb-*", "idxc-*", OTHER_INDEX, OTHER_INDEX, OTHER_INDEX]
+    # 已经出现过的取值继续保留
+    assert index_label("idxb-2025") == "idxb-*"
+
+
+def test_index_label_allowlist(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_INDEX_LABELS", ["app-*", "nginx"])
+    assert index_label("app-2024.05.01") == "app-*"
+    assert index_label("nginx") == "nginx"
+    assert index_label("nginx-2024") == OTHER_INDEX
+    assert index_label("secret-user-typed-name") == OTHER_INDEX
+    assert index_label("app-a,app-b") == "app-*"
+    assert index_label("app-a,nginx") == OTHER_INDEX
@@ -0,0 +1,115 @@
+# coding=utf-8
+import asyncio
+
+import pytest
+
+from app.api.search import too_busy
+from app.service.scheduler import ExportScheduler, SchedulerFull
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_admission_limits():
+    async def main():
+        s = ExportScheduler(max_concurrency=3, max_per_host=2, max_queue=10, max_per_token=0)
+        a = s.acquire("u1", "h1")
+        b = s.acquire("u2", "h1")
+        c = s.acquire("u3", "h1")   # h1 已满
+        d = s.acquire("u3", "h2")
+        assert [t.granted for t in (a, b, c, d)] == [True, True, False, True]
+        assert s.running == 3 and s.queued == 1
+        e = s.acquire("u4", "h3")   # 全局已满
+        assert not e.granted and e.position == 2
+
+        a.release()
+        # 轮转：c 所在集群空出名额，先于 e 出队
+        assert c.granted and not e.granted
+        b.release()
+        assert e.granted and s.queued == 0
+
+    _run(main())
+
+
+def test_per_token_cap():
+    async def main():
+        s = ExportScheduler(max_concurrency=4, max_per_host=4, max_queue=10, max_per_token=2)
+        mine = [s.acquire("u1", "h") for _ in range(3)]
+        other = s.acquire("u2", "h")
+        assert [t.granted for t in mine] == [True, True, False]
+        assert other.granted and s.running == 3
+
+        mine[0].release()
+        assert mine[2].granted
+
+    _run(main())
+
+
+def test_multi_cluster_export_takes_a_slot_on_each_cluster():
+    async def main():
+        s = ExportScheduler(max_concurrency=8, max_per_host=1, max_queue=10, max_per_token=0)
+        fanout = s.acquire("u1", ["a", "b"])
+        only_b = s.acquire("u2", "b")
+        only_c = s.acquire("u3", ["c", "c"])
+        assert fanout.granted and not only_b.granted and only_c.granted
+        assert s._running_by_host == {"a": 1, "b": 1, "c": 1}
+
+        fanout.release()
+        assert only_b.granted and s._running_by_host == {"b": 1, "c": 1}
+
+    _run(main())
+
+
+def test_round_robin_between_tokens():
+    async def main():
+        s = ExportScheduler(max_concurrency=1, max_per_host=1, max_queue=10, max_per_token=0)
+        first = s.acquire("u1", "h")
+        waiting = [s.acquire("u1", "h") for _ in range(3)] + [s.acquire("u2", "h"), s.acquire("u3", "h")]
+        assert [t.position for t in waiting] == [1, 4, 5, 2, 3]
+
+        order = []
+        current = first
+        for _ in waiting:
+            current.release()
+            current = next(t for t in waiting if t.granted and not t.released)
+            order.append(current.token)
+        assert order == ["u1", "u2", "u3", "u1", "u1"]
+
+    _run(main())
+
+
+def test_queue_full_gives_429_with_retry_after():
+    async def main():
+        s = ExportScheduler(max_concurrency=1, max_per_host=1, max_queue=2, max_per_token=0)
+        s.acquire("u1", "h")
+        s.acquire("u1", "h")
+        s.acquire("u2", "h")
+        with pytest.raises(SchedulerFull) as e:
+            s.check_admission()
+        with pytest.raises(SchedulerFull):
+            s.acquire("u3", "h")
+        assert s.queued == 2
+
+        err = too_busy(e.value)
+        assert err.status_code == 429
+        assert int(err.headers["Retry-After"]) == e.value.retry_after >= 1
+
+    _run(main())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def main():
+        s = ExportScheduler(max_concurrency=1, max_per_host=1, max_queue=10, max_per_token=0)
+        first = s.acquire("u1", "h")
+        queued = s.acquire("u2", "h")
+        waiter = asyncio.ensure_future(queued.wait())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert s.queued == 0
+
+        first.release()
+        assert s.running == 0
+
+    _run(main())